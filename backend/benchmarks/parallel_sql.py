@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Compare single-query and partitioned parallel execution of aggregate SQL.
+
+Runs every query through ``SQLExecutor`` once as a single query and once
+with a ``ParallelAggregator``, checks that both return the same rows and
+reports the best-of-N times and the speedup. The result cache and the
+columnar cache are not involved. Connection settings are read from the
+usual ``POSTGRESQL_*`` environment variables.
+
+With ``--create ROWS`` a table ``parallel_bench`` with an integer primary
+key is (re)created and filled first, and the default queries run against it.
+
+Usage:
+    python benchmarks/parallel_sql.py --create 20000000 [--workers 8] [--repeat 3]
+    python benchmarks/parallel_sql.py --workers 8 --sql "SELECT region, SUM(amount) FROM orders GROUP BY region"
+"""
+
+import argparse
+import math
+import os
+import pathlib
+import sys
+import time
+from decimal import Decimal
+from typing import Any, List
+
+# Importing the agent package builds the graph, which needs an API key
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "src"))
+
+from psycopg2.pool import ThreadedConnectionPool  # noqa: E402
+
+from agent.configuration import Configuration  # noqa: E402
+from agent.parallel_sql import ParallelAggregator, decompose  # noqa: E402
+from agent.sql_executor import SQLExecutor  # noqa: E402
+from agent.utils import get_database_connection  # noqa: E402
+
+DEFAULT_QUERIES = [
+    "SELECT region, COUNT(*), SUM(amount), AVG(amount), MIN(amount), MAX(amount) "
+    "FROM parallel_bench GROUP BY region ORDER BY region",
+    "SELECT COUNT(*), AVG(quantity) FROM parallel_bench WHERE amount > 50",
+    "SELECT region, status, SUM(quantity) AS total FROM parallel_bench "
+    "GROUP BY region, status ORDER BY total DESC LIMIT 5",
+]
+
+
+def create_table(config: Configuration, rows: int) -> None:
+    connection = get_database_connection(config)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS parallel_bench")
+            cursor.execute(
+                "CREATE TABLE parallel_bench (id bigint PRIMARY KEY, region text, status text, "
+                "amount numeric(12, 2), quantity int)"
+            )
+            cursor.execute(
+                "INSERT INTO parallel_bench "
+                "SELECT i, (ARRAY['eu', 'us', 'apac', 'latam'])[1 + i % 4], "
+                "(ARRAY['open', 'paid', 'refunded'])[1 + (i / 7) % 3], "
+                "round((random() * 100)::numeric, 2), (random() * 10)::int "
+                "FROM generate_series(1, %s) AS i",
+                (rows,),
+            )
+            cursor.execute("ANALYZE parallel_bench")
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def best_of(executor: SQLExecutor, sql: str, repeat: int):
+    best, result = math.inf, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = executor.execute(sql)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def same_rows(left: List[tuple], right: List[tuple], ordered: bool) -> bool:
+    def normalize(row: tuple) -> tuple:
+        return tuple(round(float(v), 6) if isinstance(v, (float, Decimal)) else v for v in row)
+
+    def key(row: tuple) -> Any:
+        return tuple((v is None, str(v)) for v in row)
+
+    left, right = [normalize(r) for r in left], [normalize(r) for r in right]
+    if not ordered:
+        left, right = sorted(left, key=key), sorted(right, key=key)
+    return left == right
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sql", action="append", help="Aggregate query to compare (repeatable)")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent pieces")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--create", type=int, metavar="ROWS", help="Create parallel_bench with ROWS rows")
+    args = parser.parse_args()
+
+    config = Configuration.from_runnable_config()
+    if args.create:
+        print(f"Creating parallel_bench with {args.create} rows...")
+        create_table(config, args.create)
+
+    connect = lambda: get_database_connection(config)  # noqa: E731
+    pool = ThreadedConnectionPool(
+        0,
+        args.workers,
+        host=config.postgresql_host,
+        port=config.postgresql_port,
+        database=config.postgresql_database,
+        user=config.postgresql_username,
+        password=config.postgresql_password,
+    )
+    limits = dict(max_rows=config.analysis_max_rows, max_bytes=config.analysis_max_bytes)
+    single = SQLExecutor(connect, **limits)
+    parallel = SQLExecutor(connect, parallel=ParallelAggregator(pool, args.workers, min_cost=0), **limits)
+
+    print(f"{'query':<60} {'single':>9} {'parallel':>9} {'pieces':>7} {'speedup':>8}")
+    for sql in args.sql or DEFAULT_QUERIES:
+        if decompose(sql) is None:
+            print(f"{sql[:60]:<60} not a decomposable aggregate, skipped")
+            continue
+        single_seconds, single_result = best_of(single, sql, args.repeat)
+        parallel_seconds, parallel_result = best_of(parallel, sql, args.repeat)
+        ordered = " ORDER BY " in sql.upper()
+        if not same_rows(single_result.rows, parallel_result.rows, ordered):
+            print(f"{sql[:60]:<60} RESULTS DIFFER")
+            continue
+        print(
+            f"{sql[:60]:<60} {single_seconds:8.3f}s {parallel_seconds:8.3f}s "
+            f"{parallel_result.parallel_pieces:>7} {single_seconds / parallel_seconds:7.1f}x"
+        )
+    pool.closeall()
+
+
+if __name__ == "__main__":
+    main()
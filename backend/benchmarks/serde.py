@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Compare the default serializers with ``agent.serde`` on a large graph state.
+
+Builds the state of a long research thread: a multi-turn ``messages``
+history with multi-kilobyte answers, many ``web_research_result`` summaries
+and ``sources_gathered`` entries. It then times:
+
+- checkpoints: writing and reading every channel with LangGraph's
+  ``JsonPlusSerializer`` and with ``StateSerializer``;
+- stream events: encoding a ``finalize_answer`` update and the full state
+  with ``json.dumps`` (messages via ``model_dump``) and with
+  ``dumps_json(encode_update(...))``.
+
+Usage:
+    python benchmarks/serde.py [--turns 20] [--results 40] [--repeat 200]
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import random
+import sys
+import time
+from typing import Any, Callable, Dict
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+# Importing the agent package builds the graph, which needs an API key
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "src"))
+
+from agent.serde import StateSerializer, dumps_json, encode_update  # noqa: E402
+
+
+def text(rng: random.Random, words: int) -> str:
+    return " ".join(f"word{rng.randrange(5000)}" for _ in range(words))
+
+
+def build_state(turns: int, results: int) -> Dict[str, Any]:
+    rng = random.Random(0)
+    messages = []
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"Question {i}: {text(rng, 30)}", id=f"h{i}"))
+        messages.append(
+            AIMessage(
+                content=text(rng, 600),
+                id=f"a{i}",
+                response_metadata={"finish_reason": "stop", "model_name": "gpt-4o"},
+                usage_metadata={"input_tokens": 4000, "output_tokens": 800, "total_tokens": 4800},
+            )
+        )
+    return {
+        "messages": messages,
+        "search_query": [text(rng, 8) for _ in range(results)],
+        "web_research_result": [text(rng, 450) for _ in range(results)],
+        "sources_gathered": [
+            {
+                "label": f"source{i}",
+                "short_url": f"https://search.example/id/{i}",
+                "value": f"https://example.com/{text(rng, 4).replace(' ', '/')}",
+            }
+            for i in range(results * 4)
+        ],
+        "research_loop_count": 3,
+        "reasoning_model": "gpt-4o",
+    }
+
+
+def default_json(obj: Any) -> bytes:
+    def fallback(value: Any) -> Any:
+        return value.model_dump() if hasattr(value, "model_dump") else str(value)
+
+    return json.dumps(obj, default=fallback).encode("utf-8")
+
+
+def timeit(fn: Callable[[], Any], repeat: int) -> float:
+    """Best-of-5 mean seconds per call."""
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best
+
+
+def row(name: str, seconds: float, size: int, baseline: float) -> None:
+    print(f"  {name:<34} {seconds * 1e6:10.1f} us {size / 1024:9.1f} KiB {baseline / seconds:6.1f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--turns", type=int, default=20, help="Question/answer turns in messages")
+    parser.add_argument("--results", type=int, default=40, help="Research summaries in the state")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    state = build_state(args.turns, args.results)
+    print(f"State: {len(state['messages'])} messages, {len(state['web_research_result'])} summaries, "
+          f"{len(state['sources_gathered'])} sources\n")
+
+    print("Checkpoint (every channel)")
+    for name, serde in (("JsonPlusSerializer", JsonPlusSerializer()), ("StateSerializer", StateSerializer())):
+        blobs = {key: serde.dumps_typed(value) for key, value in state.items()}
+        size = sum(len(blob) for _, blob in blobs.values())
+        write = timeit(lambda: [serde.dumps_typed(value) for value in state.values()], args.repeat)
+        read = timeit(lambda: [serde.loads_typed(blob) for blob in blobs.values()], args.repeat)
+        if name == "JsonPlusSerializer":
+            base_write, base_read = write, read
+        assert {k: serde.loads_typed(b) for k, b in blobs.items()} == state
+        row(f"{name} write", write, size, base_write)
+        row(f"{name} read", read, size, base_read)
+
+    update = {"finalize_answer": {"messages": [state["messages"][-1]], "sources_gathered": state["sources_gathered"]}}
+    for label, payload in (("Stream event (finalize_answer update)", update), ("Stream event (full state)", {"values": state})):
+        print(f"\n{label}")
+        base = timeit(lambda: default_json(payload), args.repeat)
+        row("json.dumps", base, len(default_json(payload)), base)
+        fast = timeit(lambda: dumps_json(encode_update(payload)), args.repeat)
+        row("dumps_json(encode_update)", fast, len(dumps_json(encode_update(payload))), base)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""Soak test: thousands of graph runs against a local stub LLM.
+
+Starts an OpenAI-compatible stub server in process, points the agent at it
+and runs the graph repeatedly in two phases:
+
+1. ``--runs`` untraced runs. Every ``--interval`` runs the test samples RSS
+   and the number of live objects tracked by the garbage collector.
+2. ``--traced-runs`` runs under ``tracemalloc``. Tracing makes runs tens of
+   times slower, so it only covers this window. At the end the test reports
+   the allocation sites whose retained memory grew the most, grouped by the
+   graph node (function in ``agent/graph.py``) that allocated them.
+
+The test fails (exit code 1) if memory per run does not plateau. That is
+the case when RSS, live objects or traced memory keep growing faster than
+their per-run limits over the second half of their samples.
+
+Usage:
+    python benchmarks/soak.py [--runs 2000] [--traced-runs 100] [--checkpointer]
+
+With ``--checkpointer`` every run uses a fresh thread in an in-memory
+checkpointer and the thread is deleted afterwards, so checkpoint payloads
+that are kept after deletion show up as growth.
+"""
+
+import argparse
+import ast
+import gc
+import json
+import os
+import pathlib
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+SRC = pathlib.Path(__file__).resolve().parent.parent / "src"
+GRAPH_FILE = SRC / "agent" / "graph.py"
+
+# Frames kept per traced allocation, enough to reach the node function.
+TRACE_DEPTH = 40
+
+
+# ---------------------------------------------------------------------------
+# Stub OpenAI server
+
+
+def example_value(schema: Dict[str, Any], name: str, defs: Dict[str, Any], rng: random.Random) -> Any:
+    """Return a value matching a JSON schema (the subset pydantic emits)."""
+    if "$ref" in schema:
+        return example_value(defs[schema["$ref"].split("/")[-1]], name, defs, rng)
+    if "anyOf" in schema:
+        return example_value(schema["anyOf"][0], name, defs, rng)
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type", "string")
+    if kind == "object":
+        return {
+            key: example_value(value, key, defs, rng)
+            for key, value in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        return [example_value(schema.get("items", {}), f"{name} {i + 1}", defs, rng) for i in range(2)]
+    if kind == "boolean":
+        # Random verdicts exercise both ends of the research loop
+        return rng.random() < 0.5
+    if kind in ("number", "integer"):
+        return 0.9 if kind == "number" else 1
+    if name == "task_type":
+        return "web_research"
+    return f"stub {name} {rng.randrange(10_000)}"
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """Answers ``/chat/completions`` with schema-conforming stub output."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; avoid delayed-ACK stalls
+    disable_nagle_algorithm = True
+    answer_words = 300
+    rng = random.Random(0)
+    rng_lock = threading.Lock()
+
+    def log_message(self, format, *args):  # noqa: A002 - silence request logs
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        with self.rng_lock:
+            content, tool_calls = self._output(request)
+        if request.get("stream"):
+            self._stream(request, content)
+        else:
+            self._complete(request, content, tool_calls)
+
+    def _output(self, request: Dict[str, Any]) -> Tuple[Optional[str], Optional[List[dict]]]:
+        response_format = request.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            schema = response_format["json_schema"]["schema"]
+            value = example_value(schema, "root", schema.get("$defs", {}), self.rng)
+            return json.dumps(value), None
+        tools = request.get("tools") or []
+        if tools:
+            function = tools[0]["function"]
+            parameters = function.get("parameters", {})
+            value = example_value(parameters, "root", parameters.get("$defs", {}), self.rng)
+            return None, [
+                {
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "type": "function",
+                    "function": {"name": function["name"], "arguments": json.dumps(value)},
+                }
+            ]
+        words = " ".join(f"word{self.rng.randrange(1000)}" for _ in range(self.answer_words))
+        return f"Stub answer. {words}", None
+
+    def _usage(self) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": 500,
+            "completion_tokens": self.answer_words,
+            "total_tokens": 500 + self.answer_words,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+
+    def _complete(self, request, content, tool_calls) -> None:
+        message: Dict[str, Any] = {"role": "assistant", "content": content}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        body = json.dumps(
+            {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": message,
+                        "finish_reason": "tool_calls" if tool_calls else "stop",
+                    }
+                ],
+                "usage": self._usage(),
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, request, content) -> None:
+        base = {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+        }
+        words = (content or "").split(" ")
+        chunks = [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]
+        for i in range(0, len(words), 20):
+            text = " ".join(words[i : i + 20]) + " "
+            chunks.append({"index": 0, "delta": {"content": text}, "finish_reason": None})
+        chunks.append({"index": 0, "delta": {}, "finish_reason": "stop"})
+        events = [{**base, "choices": [choice]} for choice in chunks]
+        if (request.get("stream_options") or {}).get("include_usage"):
+            events.append({**base, "choices": [], "usage": self._usage()})
+        body = b"".join(f"data: {json.dumps(event)}\n\n".encode() for event in events)
+        body += b"data: [DONE]\n\n"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_stub_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLLMHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ---------------------------------------------------------------------------
+# Memory sampling
+
+
+def rss_bytes() -> int:
+    """Return the resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+
+        # Peak RSS where /proc is not available (kilobytes on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def graph_functions() -> List[Tuple[int, int, str]]:
+    """Return ``(first_line, last_line, name)`` of the functions in graph.py."""
+    tree = ast.parse(GRAPH_FILE.read_text())
+    return [
+        (node.lineno, node.end_lineno, node.name)
+        for node in ast.walk(tree)
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+    ]
+
+
+def node_of(traceback: tracemalloc.Traceback, functions: List[Tuple[int, int, str]]) -> str:
+    """Attribute an allocation to the innermost graph.py function on its stack."""
+    graph_file = str(GRAPH_FILE)
+    for frame in reversed(traceback):  # frames are stored oldest first
+        if frame.filename == graph_file:
+            for first, last, name in functions:
+                if first <= frame.lineno <= last:
+                    return name
+            return "graph.py (module)"
+    return "(outside graph nodes)"
+
+
+def site_of(traceback: tracemalloc.Traceback) -> Tuple[str, int]:
+    """Return the innermost ``agent/`` frame of an allocation, else its innermost frame."""
+    agent_dir = str(SRC / "agent") + os.sep
+    frame = next((f for f in reversed(traceback) if f.filename.startswith(agent_dir)), traceback[-1])
+    return frame.filename, frame.lineno
+
+
+def slope(points: List[Tuple[int, int]]) -> float:
+    """Least-squares slope of ``(run, bytes)`` points, in bytes per run."""
+    n = len(points)
+    if n < 2:
+        return 0.0
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var = sum((x - mean_x) ** 2 for x, _ in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var if var else 0.0
+
+
+# ---------------------------------------------------------------------------
+# Soak run
+
+
+def report_growth(baseline: tracemalloc.Snapshot, snapshot: tracemalloc.Snapshot, top: int) -> None:
+    """Print the retained growth between two snapshots, grouped by graph node."""
+    functions = graph_functions()
+    # Allocations of the stub server threads are not the agent's
+    stub = [tracemalloc.Filter(False, f"*/{name}", all_frames=True) for name in ("http/server.py", "socketserver.py")]
+    baseline, snapshot = baseline.filter_traces(stub), snapshot.filter_traces(stub)
+    # Tracebacks that differ only outside the printed frame are merged into one site
+    by_node: Dict[str, Dict[Tuple[str, int], List[int]]] = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+    for stat in snapshot.compare_to(baseline, "traceback"):
+        if stat.size_diff > 0:
+            site = by_node[node_of(stat.traceback, functions)][site_of(stat.traceback)]
+            site[0] += stat.size_diff
+            site[1] += stat.count_diff
+    print("\nRetained growth in the traced runs by node:")
+    for node, sites in sorted(by_node.items(), key=lambda item: -sum(size for size, _ in item[1].values())):
+        total = sum(size for size, _ in sites.values())
+        print(f"\n{node}: +{total / 1024:.1f} KiB in {len(sites)} sites")
+        for (filename, lineno), (size, count) in sorted(sites.items(), key=lambda item: -item[1][0])[:top]:
+            print(f"  +{size / 1024:8.1f} KiB  {count:+6d} blocks  {filename}:{lineno}")
+
+
+def check_plateau(name: str, unit: str, samples: List[Tuple[int, int]], limit: float) -> bool:
+    """Print the growth over the second half of ``samples``; return False if above ``limit``."""
+    tail = samples[len(samples) // 2 :]
+    growth = slope(tail)
+    ok = growth <= limit
+    status = "ok" if ok else "FAIL"
+    print(f"{status:>4}  {name}: {growth:.1f} {unit}/run over the last {len(tail)} samples (limit {limit:g})")
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=2000, help="Untraced runs")
+    parser.add_argument("--traced-runs", type=int, default=100, help="Runs under tracemalloc")
+    parser.add_argument("--warmup", type=int, default=50, help="Runs before sampling starts")
+    parser.add_argument("--interval", type=int, default=100, help="Untraced runs between samples")
+    parser.add_argument("--max-rss-growth-per-run", type=float, default=8192.0, help="Bytes per run")
+    parser.add_argument("--max-object-growth-per-run", type=float, default=5.0, help="Objects per run")
+    parser.add_argument("--max-traced-growth-per-run", type=float, default=1024.0, help="Bytes per run")
+    parser.add_argument("--top", type=int, default=10, help="Growth sites reported per node")
+    parser.add_argument("--checkpointer", action="store_true", help="Run each invocation in a checkpointed thread")
+    args = parser.parse_args()
+
+    server = start_stub_server()
+    os.environ["OPENAI_API_KEY"] = "stub"
+    os.environ["OPENAI_API_BASE"] = f"http://127.0.0.1:{server.server_port}/v1"
+    # The graph would otherwise reach for PostgreSQL tables
+    os.environ["DATA_ANALYSIS_TABLES"] = ""
+    sys.path.insert(0, str(SRC))
+
+    from langchain_core.messages import HumanMessage
+
+    from agent.graph import builder
+
+    checkpointer = None
+    if args.checkpointer:
+        from langgraph.checkpoint.memory import MemorySaver
+
+        from agent.serde import StateSerializer
+
+        checkpointer = MemorySaver(serde=StateSerializer())
+    graph = builder.compile(checkpointer=checkpointer)
+
+    def run_once(i: int) -> None:
+        config: Dict[str, Any] = {"configurable": {"thread_id": f"soak-{i}"}}
+        graph.invoke(
+            {
+                "messages": [HumanMessage(content=f"Soak question {i}: what changed in topic {i % 50}?")],
+                "initial_search_query_count": 2,
+                "max_research_loops": 2,
+            },
+            config=config,
+        )
+        if checkpointer is not None:
+            checkpointer.delete_thread(config["configurable"]["thread_id"])
+
+    start = time.perf_counter()
+    for i in range(args.warmup):
+        run_once(i)
+    print(f"warm-up: {args.warmup} runs in {time.perf_counter() - start:.1f}s")
+
+    # Phase 1: untraced runs
+    rss_samples: List[Tuple[int, int]] = []
+    object_samples: List[Tuple[int, int]] = []
+    print(f"{'run':>7} {'rss MiB':>9} {'objects':>9} {'runs/s':>7}")
+    last = time.perf_counter()
+    done = args.warmup
+    for i in range(args.warmup, args.warmup + args.runs + 1):
+        if (i - args.warmup) % args.interval == 0:
+            gc.collect()
+            now = time.perf_counter()
+            rss, objects = rss_bytes(), len(gc.get_objects())
+            rss_samples.append((i, rss))
+            object_samples.append((i, objects))
+            rate = f"{args.interval / (now - last):7.1f}" if i > args.warmup else f"{'':>7}"
+            print(f"{i:>7} {rss / 2**20:>9.1f} {objects:>9} {rate}")
+            last = now
+        if i < args.warmup + args.runs:
+            run_once(i)
+            done = i + 1
+
+    # Phase 2: traced runs
+    traced_samples: List[Tuple[int, int]] = []
+    snapshot = baseline = None
+    if args.traced_runs:
+        tracemalloc.start(TRACE_DEPTH)
+        gc.collect()
+        baseline = tracemalloc.take_snapshot()
+        traced_interval = max(1, args.traced_runs // 10)
+        start = time.perf_counter()
+        for i in range(done, done + args.traced_runs):
+            run_once(i)
+            if (i + 1 - done) % traced_interval == 0:
+                gc.collect()
+                traced_samples.append((i + 1, tracemalloc.get_traced_memory()[0]))
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        print(f"traced: {args.traced_runs} runs in {time.perf_counter() - start:.1f}s")
+    server.shutdown()
+
+    if baseline is not None and snapshot is not None:
+        report_growth(baseline, snapshot, args.top)
+
+    print()
+    ok = check_plateau("RSS", "B", rss_samples, args.max_rss_growth_per_run)
+    ok &= check_plateau("live objects", "objects", object_samples, args.max_object_growth_per_run)
+    if traced_samples:
+        ok &= check_plateau("traced memory", "B", traced_samples, args.max_traced_growth_per_run)
+    print("OK: memory per run plateaus" if ok else "FAIL: memory per run does not plateau")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Compare plain StaticFiles with precompressed frontend serving.
+
+Replays a first visit (every file of the build) and a repeat visit
+(revalidation with the ETags of the first visit) against both routers, in
+process over ASGI, and reports bytes sent and latency per request. On the
+repeat visit a browser does not request assets marked immutable at all, so
+those are counted as skipped.
+
+Usage:
+    python benchmarks/static_serving.py [--dist ../frontend/dist] [--rounds 50]
+
+Without a frontend build a synthetic one is generated.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import pathlib
+import random
+import statistics
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+from starlette.staticfiles import StaticFiles
+
+# Loaded by path: importing the agent package builds the graph, which needs
+# the LLM settings.
+_spec = importlib.util.spec_from_file_location(
+    "static_files",
+    pathlib.Path(__file__).resolve().parent.parent / "src" / "agent" / "static_files.py",
+)
+static_files = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(static_files)
+PrecompressedStaticFiles = static_files.PrecompressedStaticFiles
+
+ACCEPT_ENCODING = "gzip, deflate, br"
+
+
+async def request(
+    app, path: str, headers: Dict[str, str]
+) -> Tuple[int, Dict[str, str], int, float]:
+    """Send one GET to ``app``; return status, headers, body bytes and seconds."""
+    scope = {
+        "type": "http",
+        # 2.4: responses need not watch for disconnects while sending
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        "client": ("127.0.0.1", 0),
+        "server": ("127.0.0.1", 80),
+    }
+    response: Dict = {"status": 0, "headers": {}, "bytes": 0}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {k.decode(): v.decode() for k, v in message["headers"]}
+        elif message["type"] == "http.response.body":
+            response["bytes"] += len(message.get("body", b""))
+
+    start = time.perf_counter()
+    await app(scope, receive, send)
+    return response["status"], response["headers"], response["bytes"], time.perf_counter() - start
+
+
+async def visit(
+    app, paths: List[str], etags: Optional[Dict[str, str]] = None
+) -> Tuple[int, int, int, List[float], Dict[str, str]]:
+    """Request every path once; return requests, skipped, bytes, latencies and ETags."""
+    sent = requests = skipped = 0
+    latencies: List[float] = []
+    new_etags: Dict[str, str] = {}
+    for path in paths:
+        headers = {"Accept-Encoding": ACCEPT_ENCODING}
+        if etags is not None:
+            cached = etags.get(path)
+            if cached == "immutable":
+                skipped += 1
+                continue
+            if cached:
+                headers["If-None-Match"] = cached
+        status, response_headers, body_bytes, seconds = await request(app, path, headers)
+        requests += 1
+        sent += body_bytes
+        latencies.append(seconds)
+        if "immutable" in response_headers.get("cache-control", ""):
+            new_etags[path] = "immutable"
+        elif "etag" in response_headers:
+            new_etags[path] = response_headers["etag"]
+    return requests, skipped, sent, latencies, new_etags
+
+
+def synthetic_dist(directory: pathlib.Path) -> None:
+    """Write a small Vite-like build with realistic, compressible assets."""
+    random.seed(0)
+    words = [f"identifier{i}" for i in range(400)] + ["function", "return", "const", "=>", "{", "}"]
+    js = " ".join(random.choice(words) for _ in range(120_000))
+    css = "\n".join(f".c{i} {{ margin: {i % 7}px; color: #{i % 4096:03x}; }}" for i in range(8000))
+    (directory / "assets").mkdir(parents=True)
+    (directory / "assets" / "index-3f9a1c2b.js").write_text(js)
+    (directory / "assets" / "index-8d0e7a41.css").write_text(css)
+    (directory / "vite.svg").write_text("<svg xmlns='http://www.w3.org/2000/svg'>" + "<g/>" * 200 + "</svg>")
+    (directory / "index.html").write_text(
+        "<!doctype html><html><head>"
+        '<script type="module" src="/app/assets/index-3f9a1c2b.js"></script>'
+        '<link rel="stylesheet" href="/app/assets/index-8d0e7a41.css"></head>'
+        '<body><div id="root"></div></body></html>'
+    )
+
+
+def report(name: str, first, repeat) -> None:
+    requests, _, sent, latencies, _ = first
+    print(f"{name}")
+    print(
+        f"  first visit:  {requests} requests, {sent / 1024:9.1f} KiB, "
+        f"mean {statistics.mean(latencies) * 1e3:.3f} ms/request"
+    )
+    requests, skipped, sent, latencies, _ = repeat
+    mean = f"mean {statistics.mean(latencies) * 1e3:.3f} ms/request" if latencies else "no requests"
+    print(f"  repeat visit: {requests} requests ({skipped} cached), {sent / 1024:9.1f} KiB, {mean}")
+
+
+async def benchmark(dist: pathlib.Path, rounds: int) -> None:
+    paths = ["/"] + [
+        "/" + p.relative_to(dist).as_posix()
+        for p in sorted(dist.rglob("*"))
+        if p.is_file() and p.suffix not in (".gz", ".br") and p.name != "index.html"
+    ]
+    start = time.perf_counter()
+    precompressed = PrecompressedStaticFiles(dist)
+    print(f"Precompressed startup: {time.perf_counter() - start:.2f}s for {len(precompressed.assets)} files\n")
+    for name, app in (
+        ("StaticFiles", StaticFiles(directory=dist, html=True)),
+        ("PrecompressedStaticFiles", precompressed),
+    ):
+        firsts, repeats = [], []
+        for _ in range(rounds):
+            first = await visit(app, paths)
+            firsts.append(first)
+            repeats.append(await visit(app, paths, first[4]))
+        # Bytes are the same every round; latencies are pooled over rounds
+        report(
+            name,
+            firsts[0][:3] + ([s for f in firsts for s in f[3]], None),
+            repeats[0][:3] + ([s for r in repeats for s in r[3]], None),
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--dist", type=pathlib.Path, default=pathlib.Path(__file__).resolve().parents[2] / "frontend" / "dist")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    if (args.dist / "index.html").is_file():
+        asyncio.run(benchmark(args.dist, args.rounds))
+        return
+    print(f"No build at {args.dist}, using a synthetic one\n")
+    with tempfile.TemporaryDirectory() as tmp:
+        synthetic_dist(pathlib.Path(tmp))
+        asyncio.run(benchmark(pathlib.Path(tmp), args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,16 @@
-from agent.graph import graph
+"""LangGraph research and data analysis agent.
+
+``graph`` is imported on first access, so processes that only need a
+submodule, such as the analysis pool's workers, do not build the graph.
+"""
 
 __all__ = ["graph"]
+
+
+def __getattr__(name):
+    if name == "graph":
+        from agent.graph import graph
+
+        globals()["graph"] = graph
+        return graph
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
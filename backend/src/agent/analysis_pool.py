@@ -0,0 +1,149 @@
+"""Process pool for CPU-bound post-processing of analysis results.
+
+pandas/NumPy transforms such as result digests hold the GIL for long
+stretches, which would stall the threads serving LangGraph requests.
+``AnalysisPool`` runs them in worker processes instead; the worker side
+lives in ``agent.analysis_worker``.
+
+DataFrames cross the process boundary as Arrow IPC files in shared memory
+(``/dev/shm`` where available), which workers memory-map without copying, so
+no DataFrame is ever pickled. DataFrame results come back as Arrow IPC bytes.
+Each task runs under a CPU-time limit enforced with ``RLIMIT_CPU`` in the
+worker, and the pool keeps utilization metrics from the time the workers
+spend on tasks.
+
+Requires the optional ``pyarrow`` package; without it ``AnalysisPool.run``
+executes the transform inline.
+"""
+
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Any, Dict
+
+import pandas as pd
+
+from agent.analysis_worker import TRANSFORMS, CPUTimeExceeded, init_worker, run_task
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+
+_SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+# Failures of the pool rather than of the task (a dead worker, a frame that
+# Arrow can not convert, such as mixed Decimal and str values); the caller can
+# still run the task in its own process.
+POOL_ERRORS = (BrokenProcessPool,) + ((pa.ArrowException,) if pa is not None else ())
+
+
+class AnalysisPool:
+    """Run registered transforms on DataFrames in worker processes.
+
+    Args:
+        max_workers: Number of worker processes.
+        cpu_seconds: CPU-time limit per task; 0 disables it.
+    """
+
+    def __init__(self, max_workers: int = 2, cpu_seconds: float = 30.0):
+        """Create the pool; worker processes start on first use."""
+        self.max_workers = max_workers
+        self.cpu_seconds = cpu_seconds
+        self._executor = None
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self._metrics = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "cpu_time_exceeded": 0,
+            "active": 0,
+            "busy_seconds": 0.0,
+            "cpu_seconds": 0.0,
+        }
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a multi-threaded server process is unsafe.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=get_context("spawn"),
+                    initializer=init_worker,
+                )
+            return self._executor
+
+    def _count(self, key: str, amount: float = 1) -> None:
+        with self._lock:
+            self._metrics[key] += amount
+
+    def run(self, name: str, df: pd.DataFrame, **kwargs) -> Any:
+        """Run transform ``name`` on ``df`` and return its output.
+
+        Raises:
+            CPUTimeExceeded: If the task used more than ``cpu_seconds``.
+            POOL_ERRORS: If ``df`` can not be converted to Arrow or a worker died.
+        """
+        if pa is None:
+            return TRANSFORMS[name](df, **kwargs)
+
+        path = os.path.join(_SHM_DIR, f"agent-analysis-{uuid.uuid4().hex}.arrow")
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(path, "wb") as sink, ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+        self._count("submitted")
+        self._count("active")
+        try:
+            future = self._get_executor().submit(
+                run_task, name, path, kwargs, self.cpu_seconds
+            )
+            kind, output, cpu_time, busy_time = future.result()
+        except CPUTimeExceeded:
+            self._count("cpu_time_exceeded")
+            self._count("failed")
+            raise
+        except BrokenProcessPool:
+            # A worker died (e.g. hit the hard CPU limit); start a new pool.
+            with self._lock:
+                self._executor = None
+            self._count("failed")
+            raise
+        except Exception:
+            self._count("failed")
+            raise
+        finally:
+            self._count("active", -1)
+            os.unlink(path)
+
+        self._count("completed")
+        self._count("busy_seconds", busy_time)
+        self._count("cpu_seconds", cpu_time)
+        if kind == "arrow":
+            return ipc.open_stream(pa.py_buffer(output)).read_all().to_pandas()
+        return output
+
+    def metrics(self) -> Dict[str, float]:
+        """Return counters and the pool utilization since it was created."""
+        with self._lock:
+            metrics = dict(self._metrics)
+        uptime = time.monotonic() - self._started_at
+        metrics["workers"] = self.max_workers
+        metrics["utilization"] = (
+            metrics["busy_seconds"] / (self.max_workers * uptime) if uptime > 0 else 0.0
+        )
+        return metrics
+
+    def shutdown(self) -> None:
+        """Stop the worker processes."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
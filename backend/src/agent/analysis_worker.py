@@ -0,0 +1,85 @@
+"""Worker-process side of ``AnalysisPool``.
+
+Spawned workers import only this module, pandas, pyarrow and the digest
+code; they never import ``agent.graph``, so they neither build the graph
+nor need the LLM settings of the server process.
+"""
+
+import math
+import signal
+import time
+from typing import Any, Callable, Dict
+
+import pandas as pd
+
+from agent.result_digest import digest_dataframe
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+
+class CPUTimeExceeded(Exception):
+    """Raised in a worker when a task exceeds its CPU-time limit."""
+
+
+TRANSFORMS: Dict[str, Callable[..., Any]] = {
+    "digest": digest_dataframe,
+}
+
+
+def _raise_cpu_time_exceeded(signum, frame):
+    raise CPUTimeExceeded("Analysis task exceeded its CPU-time limit")
+
+
+def init_worker() -> None:
+    """Install the CPU-time limit handler in a new worker process."""
+    if resource is not None:
+        signal.signal(signal.SIGXCPU, _raise_cpu_time_exceeded)
+
+
+def _set_cpu_limit(seconds: float) -> None:
+    if resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if seconds > 0:
+        # RLIMIT_CPU counts the process's total CPU time, so the limit is
+        # set relative to what this worker has used so far.
+        soft = math.ceil(time.process_time() + seconds)
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+    else:
+        soft = hard
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def run_task(name: str, path: str, kwargs: Dict[str, Any], cpu_seconds: float):
+    """Run transform ``name`` on the Arrow file at ``path``.
+
+    Returns ``(kind, output, cpu_seconds, busy_seconds)``, where the busy
+    time is measured in the worker and so excludes the time queued.
+    """
+    start = time.monotonic()
+    cpu_start = time.process_time()
+    _set_cpu_limit(cpu_seconds)
+    try:
+        with pa.memory_map(path, "r") as source:
+            df = ipc.open_file(source).read_all().to_pandas()
+        output = TRANSFORMS[name](df, **kwargs)
+    finally:
+        _set_cpu_limit(0)
+    cpu_time = time.process_time() - cpu_start
+    if isinstance(output, pd.DataFrame):
+        sink = pa.BufferOutputStream()
+        table = pa.Table.from_pandas(output, preserve_index=False)
+        with ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return "arrow", sink.getvalue().to_pybytes(), cpu_time, time.monotonic() - start
+    return "value", output, cpu_time, time.monotonic() - start
@@ -0,0 +1,156 @@
+"""Cache of whole answers, served in front of the graph.
+
+Identical questions asked within a freshness window get the stored final
+message and sources without running the graph. Entries are keyed by the
+normalized question and a hash of the effective configuration and run
+settings, so a different model or research effort never shares an answer.
+
+Concurrent requests for a key that is being computed wait for that
+computation instead of starting their own (single flight).
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Normalize a question for use as a cache key.
+
+    Case, whitespace runs and trailing punctuation are ignored.
+    """
+    return _WHITESPACE.sub(" ", question).strip().rstrip("?!.。？！ ").casefold()
+
+
+def answer_key(question: str, settings: Dict[str, Any]) -> str:
+    """Return the cache key of ``question`` under the given run settings."""
+    payload = json.dumps(
+        {"question": normalize_question(question), "settings": settings},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """LRU cache of final answers with a freshness window.
+
+    Args:
+        max_entries: Maximum number of cached answers.
+        ttl: Seconds an answer stays fresh.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600.0):
+        """Create an empty cache."""
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, Tuple[float, Dict[str, Any]]] = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._waiters: Dict[asyncio.Future, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key: str, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Return the answer for ``key`` if it is fresher than ``max_age``."""
+        max_age = self.ttl if max_age is None else min(max_age, self.ttl)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] > max_age:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, answer: Dict[str, Any]) -> None:
+        """Store ``answer`` under ``key``, evicting the least recently used entries."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time(), answer)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def purge(self, key: Optional[str] = None) -> int:
+        """Drop the answer for ``key``, or all answers; return how many were dropped."""
+        with self._lock:
+            if key is None:
+                count = len(self._entries)
+                self._entries.clear()
+                return count
+            return 1 if self._entries.pop(key, None) is not None else 0
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Dict[str, Any]]],
+        max_age: Optional[float] = None,
+        bypass: bool = False,
+    ) -> Tuple[Dict[str, Any], str]:
+        """Return the cached answer for ``key`` or compute and store it.
+
+        Args:
+            key: The cache key from :func:`answer_key`.
+            compute: Coroutine function producing the answer.
+            max_age: Maximum age of a cached answer in seconds; capped at the TTL.
+            bypass: Ignore cached answers and in-flight computations; the fresh
+                answer is still stored.
+
+        Returns:
+            The answer and how it was served: ``hit``, ``coalesced``, ``miss``
+            or ``bypass``.
+        """
+        if not bypass:
+            answer = self.get(key, max_age)
+            if answer is not None:
+                self.hits += 1
+                return answer, "hit"
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                self.coalesced += 1
+                return await self._wait(inflight), "coalesced"
+        self.misses += 1
+
+        # The computation runs as its own task so that a disconnecting first
+        # requester does not cancel it for the requests waiting on it; it is
+        # cancelled once no requester waits for it any more.
+        task = asyncio.ensure_future(compute())
+        if not bypass:
+            self._inflight[key] = task
+        task.add_done_callback(lambda t: self._computed(key, t))
+        return await self._wait(task), "bypass" if bypass else "miss"
+
+    async def _wait(self, task: asyncio.Future) -> Dict[str, Any]:
+        """Wait for a computation, cancelling it when its last waiter goes away."""
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    task.cancel()
+
+    def _computed(self, key: str, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is None:
+            self.put(key, task.result())
+
+    def stats(self) -> Dict[str, Any]:
+        """Return entry count, hits, misses and coalesced requests."""
+        with self._lock:
+            entries = len(self._entries)
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
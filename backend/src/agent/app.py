@@ -1,17 +1,349 @@
 # mypy: disable - error - code = "no-untyped-def,misc"
+import asyncio
 import pathlib
-from fastapi import FastAPI, Response
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Header, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from langchain_core.messages import HumanMessage
+from pydantic import BaseModel
+
+from agent.answer_cache import AnswerCache, answer_key
+from agent.cascade import cascade_stats
+from agent.configuration import Configuration
+from agent.graph import graph
+from agent.hedging import hedger
+from agent.scheduler import BATCH, INTERACTIVE, RunRejected, RunScheduler
+from agent.serde import dumps_json, encode_update
+from agent.static_files import PrecompressedStaticFiles
+from agent.tracing import trace_log
+from agent.usage import usage_tracker
+from agent.utils import get_analysis_pool_metrics
 
 # Define the FastAPI app
 app = FastAPI()
 
 
-def create_frontend_router(build_dir="../frontend/dist"):
+@app.get("/metrics/analysis-pool")
+def analysis_pool_metrics():
+    """Return utilization metrics of the analysis worker pool."""
+    return get_analysis_pool_metrics()
+
+
+@app.get("/metrics/llm-usage")
+def llm_usage_metrics():
+    """Return token usage per node and model, including prompt cache hit rates."""
+    return usage_tracker.snapshot()
+
+
+@app.get("/metrics/cascade")
+def cascade_metrics():
+    """Return model cascade escalation rates and latency saved per node."""
+    return cascade_stats.snapshot()
+
+
+@app.get("/metrics/hedging")
+def hedging_metrics():
+    """Return hedged request counts, hedge wins and latency percentiles per model."""
+    return hedger.metrics()
+
+
+class AnswerRequest(BaseModel):
+    """A question for the /answer route, with the run's settings."""
+
+    question: str
+    configurable: Dict[str, Any] = {}
+    initial_search_query_count: Optional[int] = None
+    max_research_loops: Optional[int] = None
+    reasoning_model: Optional[str] = None
+    bypass_cache: bool = False
+    max_age_seconds: Optional[float] = None
+
+
+class BatchRequest(BaseModel):
+    """Questions for the /batch route, answered with the same settings."""
+
+    questions: List[str]
+    configurable: Dict[str, Any] = {}
+    initial_search_query_count: Optional[int] = None
+    max_research_loops: Optional[int] = None
+    reasoning_model: Optional[str] = None
+    bypass_cache: bool = False
+    max_age_seconds: Optional[float] = None
+
+
+class PurgeRequest(BaseModel):
+    """Purge one cached answer, or all answers if ``question`` is omitted."""
+
+    question: Optional[str] = None
+    configurable: Dict[str, Any] = {}
+    initial_search_query_count: Optional[int] = None
+    max_research_loops: Optional[int] = None
+    reasoning_model: Optional[str] = None
+
+
+# Settings that only control the cache itself are left out of the key
+_UNCACHED_SETTINGS = {
+    "answer_cache_max_entries",
+    "answer_cache_ttl_seconds",
+    "profile_nodes",
+    "profile_dir",
+    "profile_interval_ms",
+    "profile_format",
+}
+
+_answer_cache: Optional[AnswerCache] = None
+_scheduler: Optional[RunScheduler] = None
+
+
+def get_answer_cache() -> AnswerCache:
+    """Return the process-wide answer cache, sized from the environment."""
+    global _answer_cache
+    if _answer_cache is None:
+        configuration = Configuration.from_runnable_config()
+        _answer_cache = AnswerCache(
+            max_entries=configuration.answer_cache_max_entries,
+            ttl=configuration.answer_cache_ttl_seconds,
+        )
+    return _answer_cache
+
+
+def get_scheduler() -> RunScheduler:
+    """Return the process-wide run scheduler, sized from the environment."""
+    global _scheduler
+    if _scheduler is None:
+        configuration = Configuration.from_runnable_config()
+        _scheduler = RunScheduler(
+            max_concurrent=configuration.scheduler_max_concurrent_runs,
+            max_queue_depth=configuration.scheduler_max_queue_depth,
+            max_wait={
+                INTERACTIVE: configuration.scheduler_max_wait_seconds,
+                BATCH: configuration.scheduler_batch_max_wait_seconds,
+            },
+        )
+    return _scheduler
+
+
+def _run_inputs(request) -> Dict[str, Any]:
+    return {
+        name: getattr(request, name)
+        for name in ("initial_search_query_count", "max_research_loops", "reasoning_model")
+        if getattr(request, name) is not None
+    }
+
+
+def _answer_key(question: str, request) -> str:
+    """Key a question on the effective configuration and run inputs."""
+    configuration = Configuration.from_runnable_config({"configurable": request.configurable})
+    settings = configuration.model_dump(exclude=_UNCACHED_SETTINGS)
+    settings.update(_run_inputs(request))
+    return answer_key(question, settings)
+
+
+def _enable_profiling(request, x_profile: Optional[str]) -> Optional[str]:
+    """Turn on node profiling for the request's run if ``X-Profile`` asks for it.
+
+    Returns the run id the profiles are written under.
+    """
+    if not x_profile or x_profile.lower() in ("0", "false", "no"):
+        return None
+    run_id = uuid.uuid4().hex
+    request.configurable = {**request.configurable, "profile_nodes": True, "run_id": run_id}
+    return run_id
+
+
+async def _answer_question(
+    question: str, request, tenant: str, priority: str, bypass: bool
+) -> Tuple[Dict[str, Any], str]:
+    """Answer ``question`` from the cache or with a scheduled graph run."""
+
+    async def run_graph() -> Dict[str, Any]:
+        async with get_scheduler().slot(tenant, priority):
+            state = await graph.ainvoke(
+                {"messages": [HumanMessage(content=question)], **_run_inputs(request)},
+                config={"configurable": request.configurable},
+            )
+        return {
+            "answer": state["messages"][-1].content,
+            "sources_gathered": state.get("sources_gathered", []),
+            "trace_id": trace_log.add(state.get("trace") or []),
+        }
+
+    cache = get_answer_cache()
+    if cache.max_entries <= 0:
+        return await run_graph(), "disabled"
+    return await cache.get_or_compute(
+        _answer_key(question, request),
+        run_graph,
+        max_age=request.max_age_seconds,
+        bypass=bypass,
+    )
+
+
+@app.post("/answer")
+async def answer(
+    request: AnswerRequest,
+    response: Response,
+    cache_control: Optional[str] = Header(default=None),
+    x_tenant: str = Header(default="anonymous"),
+    x_profile: Optional[str] = Header(default=None),
+):
+    """Answers a question, served from the answer cache when possible.
+
+    Identical questions under the same settings within the freshness window
+    reuse the stored answer; concurrent identical questions share one run.
+    Set ``bypass_cache`` or send ``Cache-Control: no-cache`` to force a run.
+    Runs are queued as interactive runs of the ``X-Tenant`` tenant; a shed run
+    is answered with 429 and ``Retry-After``. With ``X-Profile: 1`` the run
+    is profiled per node (never served from the cache) and ``X-Profile-Run``
+    names the profile directory.
+    """
+    profile_run = _enable_profiling(request, x_profile)
+    bypass = request.bypass_cache or "no-cache" in (cache_control or "") or profile_run is not None
+    try:
+        result, status = await _answer_question(
+            request.question, request, x_tenant, INTERACTIVE, bypass
+        )
+    except RunRejected as e:
+        raise HTTPException(
+            status_code=429, detail=str(e), headers={"Retry-After": str(int(e.retry_after))}
+        )
+    response.headers["X-Answer-Cache"] = status
+    if profile_run is not None:
+        response.headers["X-Profile-Run"] = profile_run
+    return {**result, "cache": status}
+
+
+@app.post("/batch")
+async def batch(request: BatchRequest, x_tenant: str = Header(default="anonymous")):
+    """Answers many questions as batch-priority runs.
+
+    Results are streamed back as newline-delimited JSON in completion order,
+    one object per question with its ``index``. A batch keeps at most as many
+    questions in the run queue as there are run slots, so a large batch waits
+    its turn instead of being shed.
+    """
+    scheduler = get_scheduler()
+    in_flight = asyncio.Semaphore(max(1, scheduler.max_concurrent))
+
+    async def answer_one(index: int, question: str) -> Dict[str, Any]:
+        async with in_flight:
+            try:
+                result, status = await _answer_question(
+                    question, request, x_tenant, BATCH, request.bypass_cache
+                )
+            except RunRejected as e:
+                return {"index": index, "question": question, "error": str(e), "retry_after": e.retry_after}
+            except Exception as e:
+                return {"index": index, "question": question, "error": str(e)}
+        return {"index": index, "question": question, **result, "cache": status}
+
+    async def results() -> AsyncIterator[bytes]:
+        tasks = [asyncio.ensure_future(answer_one(i, q)) for i, q in enumerate(request.questions)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield dumps_json(await next_result) + b"\n"
+        finally:
+            # The client went away: stop waiting for the unfinished questions;
+            # the answer cache cancels a run once nobody else waits for it
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@app.post("/stream")
+async def stream(
+    request: AnswerRequest,
+    x_tenant: str = Header(default="anonymous"),
+    x_profile: Optional[str] = Header(default=None),
+):
+    """Streams the run of one question as newline-delimited JSON events.
+
+    Each line is ``{"event": "updates" | "custom", "data": ...}``, carrying
+    the state update of a node or a branch progress event. Node updates
+    include their spans under ``trace``; the last line is a ``trace`` event
+    with the run's trace id and analysis. The run is queued like an
+    interactive ``/answer`` run but not cached; a shed run is reported as an
+    ``error`` event. ``X-Profile`` works as for ``/answer``.
+    """
+    profile_run = _enable_profiling(request, x_profile)
+
+    async def events() -> AsyncIterator[bytes]:
+        spans: List[Dict[str, Any]] = []
+        try:
+            async with get_scheduler().slot(x_tenant, INTERACTIVE):
+                async for mode, chunk in graph.astream(
+                    {"messages": [HumanMessage(content=request.question)], **_run_inputs(request)},
+                    config={"configurable": request.configurable},
+                    stream_mode=["updates", "custom"],
+                ):
+                    if mode == "updates":
+                        for update in chunk.values():
+                            if isinstance(update, dict):
+                                spans.extend(update.get("trace", []))
+                    data = encode_update(chunk) if mode == "updates" else chunk
+                    yield dumps_json({"event": mode, "data": data}) + b"\n"
+            trace_id = trace_log.add(spans)
+            if trace_id is not None:
+                trace = trace_log.get(trace_id)
+                yield dumps_json({"event": "trace", "data": {"id": trace_id, "analysis": trace["analysis"]}}) + b"\n"
+        except RunRejected as e:
+            yield dumps_json({"event": "error", "data": {"error": str(e), "retry_after": e.retry_after}}) + b"\n"
+
+    headers = {"X-Profile-Run": profile_run} if profile_run else None
+    return StreamingResponse(events(), media_type="application/x-ndjson", headers=headers)
+
+
+@app.post("/answer-cache/purge")
+def purge_answer_cache(request: PurgeRequest):
+    """Drop the cached answer of one question, or every cached answer."""
+    cache = get_answer_cache()
+    key = None if request.question is None else _answer_key(request.question, request)
+    return {"purged": cache.purge(key)}
+
+
+@app.get("/traces")
+def recent_traces():
+    """List the traces of recent /answer, /batch and /stream runs, newest first."""
+    return trace_log.recent()
+
+
+@app.get("/traces/{trace_id}")
+def get_trace(trace_id: str):
+    """Return the spans of a recent run with its critical path and parallelism.
+
+    Runs on LangGraph threads keep their latest run's spans in the thread
+    state under ``trace``; the closing ``run`` span carries the analysis.
+    """
+    trace = trace_log.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired trace id")
+    return trace
+
+
+@app.get("/metrics/scheduler")
+def scheduler_metrics():
+    """Return running and queued runs and admission counters per priority class."""
+    return get_scheduler().metrics()
+
+
+@app.get("/metrics/answer-cache")
+def answer_cache_metrics():
+    """Return answer cache hit, miss and coalesced request counts."""
+    return get_answer_cache().stats()
+
+
+def create_frontend_router(build_dir="../frontend/dist", precompressed=True):
     """Creates a router to serve the React frontend.
 
     Args:
         build_dir: Path to the React build directory relative to this file.
+        precompressed: Serve the build from memory with gzip/brotli variants,
+            strong ETags and long-lived caching of hashed assets. If False,
+            files are served from disk by plain ``StaticFiles``.
 
     Returns:
         A Starlette application serving the frontend.
@@ -34,6 +366,8 @@ def create_frontend_router(build_dir="../frontend/dist"):
 
         return Route("/{path:path}", endpoint=dummy_frontend)
 
+    if precompressed:
+        return PrecompressedStaticFiles(build_path)
     return StaticFiles(directory=build_path, html=True)
 
 
@@ -0,0 +1,231 @@
+"""Approximate answers to aggregate queries from table samples.
+
+A query that ``decompose`` accepts and that only uses SUM, COUNT and AVG is
+run over a ``TABLESAMPLE`` of its table instead of the whole table. The
+sample returns, per group, the sums the estimators need; the estimates and
+their confidence intervals are computed here:
+
+- SUM and COUNT are scaled up by the sampling fraction f (Horvitz-Thompson),
+  with variance (1 - f) / f^2 * sum(t_u^2) over the sampled units u;
+- AVG is the ratio of the sampled sum and count, with the linearized
+  variance (1 - f) * sum((s_u - R * c_u)^2) / (sum c_u)^2.
+
+A unit is a row under ``BERNOULLI`` sampling and a heap block under
+``SYSTEM`` sampling, which picks whole blocks; treating the block as the
+unit keeps the intervals honest when rows in a block are alike.
+
+The sampling rate adapts: the first sample aims at ``sample_rows`` rows of
+the table's estimated size, and if the estimates are less precise than
+``target_relative_error`` the query runs once more at a rate scaled by the
+square of the shortfall, up to ``max_percent``. MIN, MAX, queries that
+would need most of the table and samples in which no row matched run
+exactly.
+"""
+
+import math
+import zlib
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from agent.parallel_sql import AggregatePlan, decompose
+from agent.sql_executor import QueryResult
+
+# Two-sided normal quantile of the 95% confidence intervals
+Z_95 = 1.96
+# SYSTEM sampling reads only the sampled blocks; below this many rows the
+# sample has too few blocks for block-level intervals, so rows are sampled
+SYSTEM_MIN_ROWS = 1_000_000
+# Groups with less of the sample than this do not drive the adaptive rate
+_MIN_GROUP_SHARE = 0.01
+
+
+@dataclass
+class Approximation:
+    """How an approximate result was obtained."""
+
+    method: str
+    sample_percent: float
+    sampled_rows: int
+    relative_error: float  # worst 95% half-width over estimate in the larger groups
+    attempts: int = 1
+    confidence: float = 0.95
+
+    def describe(self) -> str:
+        """Return a one-line description for the result digest."""
+        error = f"{self.relative_error:.1%}" if math.isfinite(self.relative_error) else "unknown"
+        return (
+            f"Approximate result: estimated from a {self.sample_percent:.3g}% {self.method} sample "
+            f"({self.sampled_rows} rows). Each <column>_error column is the half-width of the "
+            f"{self.confidence:.0%} confidence interval (estimate ± error); the worst relative "
+            f"error is {error}. Groups absent from the sample are missing."
+        )
+
+
+@dataclass
+class _Argument:
+    """The sums collected for one aggregate argument."""
+
+    index: int
+    expression: str
+    needs_sum: bool = False
+    columns: List[int] = field(default_factory=list)
+
+
+def approximate_plan(sql: str) -> Optional[AggregatePlan]:
+    """Return the plan of ``sql`` if it can be estimated from a sample, else None."""
+    plan = decompose(sql)
+    if plan is None:
+        return None
+    if any(c.function not in (None, "sum", "count", "avg") for c in plan.columns):
+        return None
+    return plan
+
+
+def sampling_percent(table_rows: int, sample_rows: int, max_percent: float) -> Optional[float]:
+    """Return the initial sampling rate in percent, or None to run exactly."""
+    if table_rows <= 0:
+        return None
+    percent = 100.0 * sample_rows / table_rows
+    return None if percent >= max_percent else max(percent, 0.0001)
+
+
+def _arguments(plan: AggregatePlan) -> List[_Argument]:
+    arguments: Dict[str, _Argument] = {}
+    for i, column in enumerate(plan.columns):
+        if column.function is None or column.argument == "*":
+            continue
+        key = " ".join(column.argument.split()).lower()
+        argument = arguments.setdefault(key, _Argument(len(arguments), column.argument))
+        argument.needs_sum = argument.needs_sum or column.function != "count"
+        argument.columns.append(i)
+    return list(arguments.values())
+
+
+def sample_sql(plan: AggregatePlan, method: str, percent: float, seed: int) -> str:
+    """Return the query collecting per-group unit sums over a sample of the table."""
+    q = plan.qualifier
+    unit = f"{q}.tableoid, ({q}.ctid::text::point)[0]" if method == "SYSTEM" else f"{q}.tableoid, {q}.ctid"
+    inner = [f"{expr} AS g{i}" for i, expr in enumerate(plan.groups)]
+    outer = [f"g{i}" for i in range(len(plan.groups))]
+    for argument in _arguments(plan):
+        k = argument.index
+        if argument.needs_sum:
+            inner.append(f"SUM(({argument.expression})::float8) AS s{k}")
+            outer += [f"SUM(s{k}) AS s{k}_1", f"SUM(s{k} * s{k}) AS s{k}_2", f"SUM(s{k} * c{k}) AS sc{k}"]
+        inner.append(f"COUNT({argument.expression}) AS c{k}")
+        outer += [f"SUM(c{k}) AS c{k}_1", f"SUM(c{k}::float8 * c{k}) AS c{k}_2"]
+    inner.append("COUNT(*) AS n")
+    outer += ["SUM(n) AS n_1", "SUM(n::float8 * n) AS n_2"]
+
+    sql = (
+        f"SELECT {', '.join(inner)} FROM {plan.table} AS {q} "
+        f"TABLESAMPLE {method} ({percent:.6g}) REPEATABLE ({seed})"
+    )
+    if plan.where:
+        sql += f" WHERE {plan.where}"
+    sql += f" GROUP BY {', '.join([*plan.groups, unit])}"
+    sql = f"SELECT {', '.join(outer)} FROM ({sql}) AS sample_units"
+    if plan.groups:
+        sql += f" GROUP BY {', '.join(outer[: len(plan.groups)])}"
+    return sql
+
+
+def estimate(plan: AggregatePlan, sample: QueryResult, percent: float) -> Tuple[List[str], List[tuple], float, int]:
+    """Turn the rows of ``sample_sql`` into estimates with 95% error half-widths.
+
+    Returns the columns, the rows (ordered and limited as the query asks),
+    the worst relative error in groups holding at least 1% of the sample,
+    and the number of sampled rows.
+    """
+    frame = pd.DataFrame(sample.rows, columns=sample.columns, dtype=object)
+    frame = frame[frame["n_1"].notna()]
+    sums = frame.drop(columns=[f"g{i}" for i in range(len(plan.groups))]).apply(pd.to_numeric).astype(float)
+    fraction = percent / 100.0
+    scale = (1.0 - fraction) / fraction**2
+    counted = {i: argument for argument in _arguments(plan) for i in argument.columns}
+
+    outputs, errors, relative = [], [], []
+    for i, column in enumerate(plan.columns):
+        if column.group is not None:
+            outputs.append(frame[f"g{column.group}"].tolist())
+            continue
+        k = counted[i].index if i in counted else None
+        if k is None:
+            value, variance = sums["n_1"] / fraction, scale * sums["n_2"]
+        elif column.function == "count":
+            value, variance = sums[f"c{k}_1"] / fraction, scale * sums[f"c{k}_2"]
+        elif column.function == "sum":
+            value, variance = sums[f"s{k}_1"] / fraction, scale * sums[f"s{k}_2"]
+        else:
+            count = sums[f"c{k}_1"].where(sums[f"c{k}_1"] > 0)
+            value = sums[f"s{k}_1"] / count
+            residual = sums[f"s{k}_2"] - 2 * value * sums[f"sc{k}"] + value**2 * sums[f"c{k}_2"]
+            variance = (1.0 - fraction) * residual / count**2
+        error = Z_95 * variance.clip(lower=0).pow(0.5)
+        cast = int if column.function == "count" else float
+        outputs.append([None if pd.isna(v) else cast(round(v) if cast is int else v) for v in value])
+        errors.append([None if pd.isna(e) else float(e) for e in error])
+        larger = sums["n_1"] >= _MIN_GROUP_SHARE * sums["n_1"].sum()
+        relative.append((error / value.abs().where(value != 0)).where(larger))
+
+    worst = max((r.max() for r in relative if r.notna().any()), default=math.inf)
+    rows = [tuple(values) for values in zip(*outputs, *errors)] if len(frame) else []
+    columns = [c.name for c in plan.columns] + [f"{c.name}_error" for c in plan.columns if c.group is None]
+    return columns, plan.apply_order(rows), float(worst), int(sums["n_1"].sum())
+
+
+def run_approximate(
+    plan: AggregatePlan,
+    execute: Callable[[str], QueryResult],
+    table_rows: int,
+    sample_rows: int,
+    max_percent: float,
+    target_relative_error: float,
+) -> Optional[QueryResult]:
+    """Estimate ``plan`` from samples of its table, or return None to run it exactly.
+
+    ``execute`` runs a query and returns its ``QueryResult``; the result
+    returned here carries the sampled query's SQL and an ``Approximation``.
+    """
+    percent = sampling_percent(table_rows, sample_rows, max_percent)
+    if percent is None:
+        return None
+    method = "SYSTEM" if table_rows >= SYSTEM_MIN_ROWS else "BERNOULLI"
+    # A fixed seed per query makes the same question give the same answer
+    seed = zlib.crc32(plan.sql.encode())
+    elapsed, attempts = 0.0, 0
+    while True:
+        attempts += 1
+        sample = execute(sample_sql(plan, method, percent, seed))
+        elapsed += sample.elapsed
+        columns, rows, error, sampled = estimate(plan, sample, percent)
+        if attempts > 1 or error <= target_relative_error or percent >= max_percent:
+            break
+        # The interval width falls with the square root of the sample size
+        growth = 10.0 if not math.isfinite(error) else (error / target_relative_error) ** 2 * 1.2
+        percent = min(max_percent, percent * max(growth, 2.0))
+    if not sampled:
+        # Nothing matched in the sample, so there is nothing to scale up
+        return None
+
+    result = QueryResult(
+        sql=sample.sql,
+        columns=columns,
+        rows=rows,
+        truncated=sample.truncated,
+        bytes_read=sample.bytes_read,
+        elapsed=elapsed,
+        source=sample.source,
+        estimated_cost=sample.estimated_cost,
+        estimated_rows=sample.estimated_rows,
+        approximation=Approximation(
+            method=method,
+            sample_percent=percent,
+            sampled_rows=sampled,
+            relative_error=error,
+            attempts=attempts,
+        ),
+    )
+    return result
@@ -0,0 +1,127 @@
+"""Cheap-first model cascade for structured-output nodes.
+
+A cheap model answers first. The call escalates to the strong model only when
+the cheap output fails validation or when the node's acceptance check
+rejects it (for example because the cheap model reports a knowledge gap or
+low confidence). Per-node escalation rates, escalation reasons and the
+latency saved by calls that did not escalate are tracked so the thresholds
+can be tuned.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Type
+
+from langchain_core.messages import BaseMessage
+from pydantic import BaseModel
+
+from agent.llm_calls import invoke_structured
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest sample in the moving average of strong-model latency.
+_EMA_ALPHA = 0.2
+
+
+class CascadeStats:
+    """Escalation and latency statistics per node."""
+
+    def __init__(self):
+        """Create empty statistics."""
+        self._stats: Dict[str, Dict[str, Any]] = defaultdict(
+            lambda: {
+                "calls": 0,
+                "escalations": 0,
+                "reasons": defaultdict(int),
+                "cheap_seconds": 0.0,
+                "strong_seconds": 0.0,
+                "strong_latency_ema": None,
+                "saved_seconds": 0.0,
+            }
+        )
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        node: str,
+        cheap_latency: float,
+        reason: Optional[str],
+        strong_latency: Optional[float] = None,
+    ) -> None:
+        """Record one cascaded call; ``reason`` is None if it did not escalate."""
+        with self._lock:
+            stats = self._stats[node]
+            stats["calls"] += 1
+            stats["cheap_seconds"] += cheap_latency
+            if reason is None:
+                # Saved time is estimated against the strong model's recent latency.
+                if stats["strong_latency_ema"] is not None:
+                    stats["saved_seconds"] += stats["strong_latency_ema"] - cheap_latency
+                return
+            stats["escalations"] += 1
+            stats["reasons"][reason] += 1
+            stats["strong_seconds"] += strong_latency
+            ema = stats["strong_latency_ema"]
+            stats["strong_latency_ema"] = (
+                strong_latency if ema is None else ema + _EMA_ALPHA * (strong_latency - ema)
+            )
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return the statistics with escalation rates."""
+        with self._lock:
+            report = {}
+            for node, stats in self._stats.items():
+                entry = dict(stats)
+                entry["reasons"] = dict(stats["reasons"])
+                entry["escalation_rate"] = (
+                    stats["escalations"] / stats["calls"] if stats["calls"] else 0.0
+                )
+                report[node] = entry
+            return report
+
+
+cascade_stats = CascadeStats()
+
+
+def invoke_cascade(
+    node: str,
+    cheap_llm: Any,
+    strong_llm: Any,
+    schema: Type[BaseModel],
+    messages: List[BaseMessage],
+    accept: Callable[[BaseModel], Optional[str]],
+) -> BaseModel:
+    """Invoke ``cheap_llm`` first and escalate to ``strong_llm`` if needed.
+
+    Args:
+        node: Node name used for usage and cascade statistics.
+        cheap_llm: The cheap chat model.
+        strong_llm: The chat model used on escalation.
+        schema: The structured output schema.
+        messages: The prompt messages.
+        accept: Returns None to accept the cheap output, or the escalation reason.
+
+    Returns:
+        The accepted cheap output or the strong model's output.
+    """
+    start = time.perf_counter()
+    try:
+        result = invoke_structured(cheap_llm, schema, messages, node)
+        reason = accept(result)
+    except Exception as e:
+        logger.info("cascade %s: cheap output failed validation: %s", node, e)
+        reason = "validation"
+    cheap_latency = time.perf_counter() - start
+
+    if reason is None:
+        cascade_stats.record(node, cheap_latency, None)
+        return result
+
+    start = time.perf_counter()
+    result = invoke_structured(strong_llm, schema, messages, node)
+    strong_latency = time.perf_counter() - start
+    cascade_stats.record(node, cheap_latency, reason, strong_latency)
+    logger.info("cascade %s: escalated (%s)", node, reason)
+    return result
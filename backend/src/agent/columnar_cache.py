@@ -0,0 +1,374 @@
+"""Optional local columnar cache of data analysis tables.
+
+Configured tables are snapshotted from PostgreSQL into Arrow IPC files under
+``columnar_cache_dir`` and memory-mapped at query time, so repeated analytical
+queries read zero-copy local columns instead of going over the network to the
+primary. Queries are run locally with DuckDB over the mapped Arrow tables.
+
+Each table has a staleness limit. A query is only answered locally when every
+table it references was refreshed within its limit; otherwise the caller falls
+back to PostgreSQL and a background refresh is started. Tables configured with
+an incremental column (for example a monotonically increasing id) are
+refreshed by appending a new segment with the rows past the last watermark,
+which assumes the table is append-only.
+
+DuckDB runs with PostgreSQL's integer division, and NUMERIC columns are kept
+as exact decimals, so cached answers match the database's. Tables with an
+unconstrained NUMERIC column are not cached.
+
+Requires the optional ``pyarrow`` and ``duckdb`` packages
+(``pip install agent[analytics]``).
+"""
+
+import datetime
+import decimal
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from agent.sql_executor import QueryResult, read_capped, referenced_tables
+from agent.table_stats import quote_ident
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc as ipc
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+
+try:
+    import duckdb
+except ImportError:  # pragma: no cover - optional dependency
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+# Segments are compacted into a fresh full snapshot beyond this many files.
+_MAX_SEGMENTS = 16
+
+
+def _arrow_type(column) -> Any:
+    """Map a column of ``cursor.description`` to an Arrow type.
+
+    NUMERIC columns keep their exact values as decimals; an unconstrained
+    NUMERIC, or one wider than 38 digits, has no exact Arrow type and keeps
+    its table out of the cache.
+    """
+    type_code = column[1]
+    if type_code == 1700:
+        precision, scale = column[4], column[5]
+        if precision is None or not 0 < precision <= 38:
+            raise ValueError(f"NUMERIC column {column[0]} has no exact Arrow type")
+        return pa.decimal128(precision, scale or 0)
+    return {
+        16: pa.bool_(),
+        20: pa.int64(),
+        21: pa.int64(),
+        23: pa.int64(),
+        700: pa.float64(),
+        701: pa.float64(),
+        1082: pa.date32(),
+        1114: pa.timestamp("us"),
+        1184: pa.timestamp("us", tz="UTC"),
+    }.get(type_code, pa.string())
+
+
+def _convert(value: Any, arrow_type) -> Any:
+    """Convert a psycopg2 value into something Arrow accepts for ``arrow_type``."""
+    if value is None:
+        return None
+    if pa.types.is_string(arrow_type) and not isinstance(value, str):
+        return str(value)
+    return value
+
+
+def _json_watermark(value: Any) -> Any:
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        # Passed back as a literal, which PostgreSQL reads as an exact numeric
+        return str(value)
+    return value
+
+
+@dataclass
+class TableManifest:
+    """On-disk description of a cached table."""
+
+    table: str
+    refreshed_at: float = 0.0
+    segments: List[str] = field(default_factory=list)
+    row_count: int = 0
+    watermark: Any = None
+
+
+class ColumnarCache:
+    """Snapshot analysis tables to Arrow IPC files and query them locally.
+
+    Args:
+        cache_dir: Directory holding one sub-directory per cached table.
+        connect: Callable returning a new psycopg2 connection.
+        staleness: Maximum age in seconds per table; tables not listed here
+            are not cached.
+        incremental_columns: Optional per-table column used as an append
+            watermark for incremental refreshes.
+        batch_size: Rows fetched per round trip while snapshotting.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        connect: Callable[[], Any],
+        staleness: Dict[str, float],
+        incremental_columns: Optional[Dict[str, str]] = None,
+        batch_size: int = 10000,
+    ):
+        """Create the cache; snapshots are written on first use."""
+        if pa is None or duckdb is None:
+            raise ImportError(
+                "The columnar cache requires pyarrow and duckdb: pip install agent[analytics]"
+            )
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._connect = connect
+        self.staleness = staleness
+        self.incremental_columns = incremental_columns or {}
+        self.batch_size = batch_size
+        self._refreshing: Dict[str, threading.Thread] = {}
+        self._lock = threading.Lock()
+        # Segments being mapped by readers, and replaced segments whose
+        # deletion waits for those readers
+        self._readers: Dict[pathlib.Path, int] = {}
+        self._retired: Set[pathlib.Path] = set()
+
+    # Manifest handling
+
+    def _table_dir(self, table: str) -> pathlib.Path:
+        return self.cache_dir / table.replace('"', "")
+
+    def manifest(self, table: str) -> TableManifest:
+        """Return the manifest of ``table`` (empty if never cached)."""
+        path = self._table_dir(table) / "manifest.json"
+        if not path.is_file():
+            return TableManifest(table=table)
+        return TableManifest(**json.loads(path.read_text()))
+
+    def _write_manifest(self, manifest: TableManifest) -> None:
+        directory = self._table_dir(manifest.table)
+        tmp = directory / f"manifest.{uuid.uuid4().hex}.tmp"
+        tmp.write_text(json.dumps(asdict(manifest)))
+        os.replace(tmp, directory / "manifest.json")
+
+    def is_fresh(self, table: str) -> bool:
+        """Return whether ``table`` is cached and within its staleness limit."""
+        if table not in self.staleness:
+            return False
+        manifest = self.manifest(table)
+        return bool(manifest.segments) and (
+            time.time() - manifest.refreshed_at <= self.staleness[table]
+        )
+
+    # Refresh
+
+    def refresh(self, table: str, full: bool = False) -> TableManifest:
+        """Snapshot ``table``, or append its new rows if it is incremental."""
+        directory = self._table_dir(table)
+        directory.mkdir(parents=True, exist_ok=True)
+        manifest = self.manifest(table)
+        column = self.incremental_columns.get(table)
+        incremental = (
+            not full
+            and column is not None
+            and manifest.segments
+            and manifest.watermark is not None
+            and len(manifest.segments) < _MAX_SEGMENTS
+        )
+
+        relation = ".".join(quote_ident(part) for part in table.split("."))
+        sql = f"SELECT * FROM {relation}"
+        params = None
+        if incremental:
+            sql += f" WHERE {quote_ident(column)} > %s"
+            params = (manifest.watermark,)
+
+        segment = f"{uuid.uuid4().hex}.arrow"
+        rows, watermark = self._write_segment(directory / segment, sql, params, column)
+
+        if incremental:
+            if rows:
+                manifest.segments.append(segment)
+                manifest.row_count += rows
+                manifest.watermark = watermark
+            else:
+                (directory / segment).unlink(missing_ok=True)
+        else:
+            old_segments = manifest.segments
+            manifest = TableManifest(
+                table=table, segments=[segment], row_count=rows, watermark=watermark
+            )
+        manifest.refreshed_at = time.time()
+        with self._lock:
+            self._write_manifest(manifest)
+            if not incremental:
+                # Readers that mapped the old files keep their mappings valid;
+                # files still being opened are deleted when the reader is done.
+                for name in old_segments:
+                    path = directory / name
+                    if self._readers.get(path):
+                        self._retired.add(path)
+                    else:
+                        path.unlink(missing_ok=True)
+        return manifest
+
+    def _write_segment(
+        self,
+        path: pathlib.Path,
+        sql: str,
+        params: Optional[tuple],
+        watermark_column: Optional[str],
+    ) -> tuple:
+        connection = self._connect()
+        tmp = path.with_suffix(".tmp")
+        rows = 0
+        watermark = None
+        try:
+            cursor = connection.cursor(name=f"snapshot_{uuid.uuid4().hex}")
+            cursor.itersize = self.batch_size
+            cursor.execute(sql, params)
+            batch = cursor.fetchmany(self.batch_size)
+            names = [c[0] for c in cursor.description]
+            schema = pa.schema(
+                [(c[0], _arrow_type(c)) for c in cursor.description]
+            )
+            with pa.OSFile(str(tmp), "wb") as sink, ipc.new_file(sink, schema) as writer:
+                while batch:
+                    arrays = [
+                        pa.array(
+                            [_convert(row[i], schema.field(i).type) for row in batch],
+                            type=schema.field(i).type,
+                        )
+                        for i in range(len(names))
+                    ]
+                    record_batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+                    writer.write_batch(record_batch)
+                    rows += record_batch.num_rows
+                    if watermark_column in names:
+                        batch_max = pc.max(record_batch.column(names.index(watermark_column))).as_py()
+                        if batch_max is not None and (watermark is None or batch_max > watermark):
+                            watermark = batch_max
+                    batch = cursor.fetchmany(self.batch_size)
+            cursor.close()
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+            connection.rollback()
+            connection.close()
+        return rows, _json_watermark(watermark)
+
+    def refresh_in_background(self, table: str) -> None:
+        """Start a refresh of ``table`` unless one is already running."""
+        with self._lock:
+            running = self._refreshing.get(table)
+            if running is not None and running.is_alive():
+                return
+            thread = threading.Thread(
+                target=self._refresh_quietly, args=(table,), daemon=True
+            )
+            self._refreshing[table] = thread
+            thread.start()
+
+    def _refresh_quietly(self, table: str) -> None:
+        try:
+            self.refresh(table)
+        except Exception as e:
+            logger.warning("列式缓存刷新失败 %s: %s", table, e)
+
+    # Query
+
+    def open_table(self, table: str):
+        """Return ``table`` as an Arrow table backed by memory-mapped files."""
+        directory = self._table_dir(table)
+        # The manifest is read and its segments pinned together, so a
+        # concurrent refresh can not delete them before they are mapped
+        with self._lock:
+            paths = [directory / segment for segment in self.manifest(table).segments]
+            for path in paths:
+                self._readers[path] = self._readers.get(path, 0) + 1
+        try:
+            tables = [ipc.open_file(pa.memory_map(str(path), "r")).read_all() for path in paths]
+        finally:
+            with self._lock:
+                for path in paths:
+                    self._readers[path] -= 1
+                    if not self._readers[path]:
+                        del self._readers[path]
+                        if path in self._retired:
+                            self._retired.discard(path)
+                            path.unlink(missing_ok=True)
+        return pa.concat_tables(tables) if len(tables) > 1 else tables[0]
+
+    def query(
+        self,
+        sql: str,
+        max_rows: int,
+        max_bytes: int,
+        batch_size: int = 1000,
+    ) -> Optional[QueryResult]:
+        """Answer ``sql`` from local columns, or return None to fall back.
+
+        Returns None when a referenced table is not cached, is stale (a
+        background refresh is started in that case), when its segment files
+        can not be read (for example removed by another process's refresh,
+        or corrupt) or when DuckDB cannot run the statement.
+        """
+        tables = referenced_tables(sql)
+        if not tables or any(t not in self.staleness for t in tables):
+            return None
+        stale = [t for t in tables if not self.is_fresh(t)]
+        if stale:
+            for table in stale:
+                self.refresh_in_background(table)
+            return None
+
+        result = QueryResult(sql=sql, source="columnar_cache")
+        start = time.perf_counter()
+        connection = duckdb.connect()
+        try:
+            # Generated SQL must not be able to read or write local files.
+            connection.execute("SET enable_external_access = false")
+            # PostgreSQL divides integers without a fraction; DuckDB by default
+            # does not, so sum(a) / count(*) would differ from the database
+            connection.execute("SET integer_division = true")
+            for index, table in enumerate(tables):
+                alias = f"_arrow_{index}"
+                connection.register(alias, self.open_table(table))
+                if "." in table:
+                    schema = table.split(".", 1)[0]
+                    connection.execute(f"CREATE SCHEMA IF NOT EXISTS {quote_ident(schema)}")
+                relation = ".".join(quote_ident(part) for part in table.split("."))
+                connection.execute(f"CREATE VIEW {relation} AS SELECT * FROM {alias}")
+            cursor = connection.execute(sql)
+            read_capped(cursor, result, batch_size, max_rows, max_bytes)
+        except (duckdb.Error, OSError, pa.ArrowException) as e:
+            logger.warning("列式缓存查询失败，回退到PostgreSQL: %s", e)
+            return None
+        finally:
+            connection.close()
+        result.elapsed = time.perf_counter() - start
+        return result
+
+
+def parse_table_settings(value: str) -> Dict[str, str]:
+    """Parse ``"table=value,table=value"`` configuration strings."""
+    settings = {}
+    for item in value.split(","):
+        if "=" in item:
+            table, setting = item.split("=", 1)
+            settings[table.strip()] = setting.strip()
+    return settings
@@ -29,6 +29,171 @@ class Configuration(BaseModel):
         },
     )
 
+    cascade_mode: bool = Field(
+        default=False,
+        metadata={
+            "description": "Answer reflection and query generation with the cascade model first and escalate to the configured model only when needed."
+        },
+    )
+
+    cascade_model: str = Field(
+        default="gpt-4o-mini",
+        metadata={"description": "The cheap language model tried first in cascade mode."},
+    )
+
+    cascade_confidence_threshold: float = Field(
+        default=0.7,
+        metadata={
+            "description": "Cheap reflections with a lower self-reported confidence are escalated."
+        },
+    )
+
+    hedge_requests: bool = Field(
+        default=False,
+        metadata={
+            "description": "Hedge the temperature-0 calls of web_research, data_analysis and finalize_answer: send a duplicate request when the first one is slow to answer."
+        },
+    )
+
+    hedge_latency_percentile: float = Field(
+        default=95.0,
+        metadata={
+            "description": "Per-model time-to-first-token percentile after which a duplicate request is sent."
+        },
+    )
+
+    hedge_min_delay_seconds: float = Field(
+        default=1.0,
+        metadata={"description": "Minimum delay before a duplicate request is sent."},
+    )
+
+    hedge_budget_ratio: float = Field(
+        default=0.1,
+        metadata={
+            "description": "Maximum long-run fraction of hedged calls that may send a duplicate request."
+        },
+    )
+
+    run_timeout_seconds: float = Field(
+        default=0.0,
+        metadata={
+            "description": "Deadline of a run in seconds unless the request passes an absolute deadline. Research stops at the deadline and the answer is written from what has completed. 0 disables it."
+        },
+    )
+
+    node_timeout_seconds: float = Field(
+        default=120.0,
+        metadata={"description": "Time limit of every node's LLM calls and of each research branch. 0 disables it."},
+    )
+
+    branch_quorum: float = Field(
+        default=1.0,
+        metadata={
+            "description": "Fraction of the parallel research branches that must complete before the remaining ones get straggler_grace_seconds to finish. 1 waits for all branches."
+        },
+    )
+
+    straggler_grace_seconds: float = Field(
+        default=5.0,
+        metadata={"description": "Time the remaining branches get once the branch quorum has completed."},
+    )
+
+    answer_cache_max_entries: int = Field(
+        default=256,
+        metadata={"description": "Maximum number of final answers cached by the /answer route. 0 disables the cache."},
+    )
+
+    answer_cache_ttl_seconds: float = Field(
+        default=3600.0,
+        metadata={"description": "Freshness window of cached answers in seconds."},
+    )
+
+    pipelined_research: bool = Field(
+        default=False,
+        metadata={
+            "description": "Run research as a continuous work queue: gap analysis starts as results arrive and follow-up queries are dispatched without waiting for the whole round."
+        },
+    )
+
+    pipelined_max_workers: int = Field(
+        default=4,
+        metadata={"description": "Number of research queries run at the same time in pipelined mode."},
+    )
+
+    scheduler_max_concurrent_runs: int = Field(
+        default=4,
+        metadata={"description": "Number of graph runs the /answer and /batch routes execute at the same time."},
+    )
+
+    scheduler_max_queue_depth: int = Field(
+        default=100,
+        metadata={"description": "Maximum number of queued runs per priority class; further runs are rejected."},
+    )
+
+    scheduler_max_wait_seconds: float = Field(
+        default=30.0,
+        metadata={"description": "Interactive runs queued longer than this are rejected. 0 disables the limit."},
+    )
+
+    scheduler_batch_max_wait_seconds: float = Field(
+        default=0.0,
+        metadata={"description": "Batch runs queued longer than this are rejected. 0 disables the limit."},
+    )
+
+    reflection_context_tokens: int = Field(
+        default=12000,
+        metadata={
+            "description": "Token budget for the research results in the reflection prompt; the most relevant passages are kept when they exceed it. 0 disables the limit."
+        },
+    )
+
+    answer_context_tokens: int = Field(
+        default=24000,
+        metadata={
+            "description": "Token budget for the research results in the answer prompt. 0 disables the limit."
+        },
+    )
+
+    history_max_turns: int = Field(
+        default=0,
+        metadata={
+            "description": "Question/answer turns kept verbatim in a thread; older turns are folded into a summary message and removed from the thread, so clients rendering the thread's messages no longer show them. 0 keeps the full history."
+        },
+    )
+
+    history_context_max_chars: int = Field(
+        default=2000,
+        metadata={
+            "description": "Maximum characters of earlier conversation given to the query and answer prompts."
+        },
+    )
+
+    profile_nodes: bool = Field(
+        default=False,
+        metadata={
+            "description": "Sample every node call with a stack profiler and write per-run, per-node profiles to profile_dir."
+        },
+    )
+
+    profile_dir: str = Field(
+        default="profiles",
+        metadata={
+            "description": "Directory the node profiles are written to, one subdirectory per run. Only read from the PROFILE_DIR environment variable; a configurable value is ignored."
+        },
+    )
+
+    profile_interval_ms: float = Field(
+        default=5.0,
+        metadata={"description": "Sampling interval of the node profiler in milliseconds."},
+    )
+
+    profile_format: str = Field(
+        default="speedscope,collapsed",
+        metadata={
+            "description": "Comma-separated profile formats: speedscope (JSON for speedscope.app) and collapsed (folded stacks for flamegraph.pl)."
+        },
+    )
+
     openai_api_base: Optional[str] = Field(
         default=None,
         metadata={
@@ -36,6 +201,27 @@ class Configuration(BaseModel):
         },
     )
 
+    task_classifier_threshold: float = Field(
+        default=0.9,
+        metadata={
+            "description": "Minimum confidence of the local task-type classifier; below it the LLM router decides. Values above 1 always use the LLM."
+        },
+    )
+
+    task_classifier_weights: str = Field(
+        default="",
+        metadata={
+            "description": "Path to trained task-type classifier weights. If empty, every question goes to the LLM router and the built-in keyword priors only score the routing log."
+        },
+    )
+
+    routing_log_path: str = Field(
+        default="",
+        metadata={
+            "description": "JSONL file that routing decisions are appended to for retraining the classifier."
+        },
+    )
+
     number_of_initial_queries: int = Field(
         default=3,
         metadata={"description": "The number of initial search queries to generate."},
@@ -72,6 +258,151 @@ class Configuration(BaseModel):
         metadata={"description": "PostgreSQL数据库密码"},
     )
 
+    data_analysis_tables: str = Field(
+        default="",
+        metadata={"description": "用于数据分析的表名，多个表用逗号分隔"},
+    )
+
+    table_stats_ttl_seconds: int = Field(
+        default=300,
+        metadata={"description": "表统计信息缓存的有效时间（秒）"},
+    )
+
+    exact_count_max_rows: int = Field(
+        default=10000,
+        metadata={"description": "估计行数不超过该值的小表使用精确COUNT(*)统计"},
+    )
+
+    analysis_batch_size: int = Field(
+        default=1000,
+        metadata={"description": "服务端游标每批读取的行数"},
+    )
+
+    analysis_max_rows: int = Field(
+        default=10000,
+        metadata={"description": "单个数据分析查询最多读取的行数"},
+    )
+
+    analysis_max_bytes: int = Field(
+        default=8_000_000,
+        metadata={"description": "单个数据分析查询最多读取的字节数（估计值）"},
+    )
+
+    analysis_max_cost: float = Field(
+        default=1e7,
+        metadata={"description": "EXPLAIN估计代价超过该值的查询会被拒绝"},
+    )
+
+    analysis_max_plan_rows: float = Field(
+        default=1e6,
+        metadata={"description": "EXPLAIN估计返回行数超过该值的查询会被加上LIMIT"},
+    )
+
+    analysis_statement_timeout_ms: int = Field(
+        default=30000,
+        metadata={"description": "数据分析查询的statement_timeout（毫秒），0表示不限制"},
+    )
+
+    analysis_parallel_workers: int = Field(
+        default=0,
+        metadata={"description": "并行执行可分解聚合查询（按分区或主键范围拆分）的并发连接数，0表示不启用"},
+    )
+
+    analysis_parallel_min_cost: float = Field(
+        default=1e6,
+        metadata={"description": "EXPLAIN估计代价达到该值的可分解聚合查询才并行执行"},
+    )
+
+    approximate_queries: bool = Field(
+        default=False,
+        metadata={"description": "用TABLESAMPLE抽样近似执行只含SUM/COUNT/AVG的单表聚合查询，并给出95%置信区间"},
+    )
+
+    approximate_suggest_cost: float = Field(
+        default=1e6,
+        metadata={"description": "未启用近似模式时，精确查询的EXPLAIN估计代价达到该值会在结果中建议启用近似模式"},
+    )
+
+    approximate_sample_rows: int = Field(
+        default=100000,
+        metadata={"description": "近似查询首次抽样的目标行数（按表的估计行数换算抽样比例）"},
+    )
+
+    approximate_max_sample_percent: float = Field(
+        default=10.0,
+        metadata={"description": "近似查询的最大抽样比例（百分比）；需要更高比例时改为精确执行"},
+    )
+
+    approximate_target_relative_error: float = Field(
+        default=0.05,
+        metadata={"description": "近似结果的目标相对误差（95%置信区间半宽/估计值），超过时提高抽样比例重试一次"},
+    )
+
+    digest_top_k: int = Field(
+        default=5,
+        metadata={"description": "查询结果摘要中每个非数值列列出的高频值个数"},
+    )
+
+    digest_max_chars: int = Field(
+        default=6000,
+        metadata={"description": "查询结果摘要的最大字符数"},
+    )
+
+    analysis_pool_workers: int = Field(
+        default=2,
+        metadata={"description": "执行CPU密集型结果后处理的工作进程数，0表示在当前线程执行"},
+    )
+
+    analysis_pool_min_rows: int = Field(
+        default=5000,
+        metadata={"description": "结果行数达到该值时才交给工作进程处理"},
+    )
+
+    analysis_task_cpu_seconds: float = Field(
+        default=30.0,
+        metadata={"description": "每个后处理任务的CPU时间上限（秒），0表示不限制"},
+    )
+
+    columnar_cache_dir: str = Field(
+        default="",
+        metadata={"description": "本地列式缓存目录（Arrow IPC文件），为空时不启用"},
+    )
+
+    columnar_cache_max_staleness_seconds: int = Field(
+        default=900,
+        metadata={"description": "列式缓存中表快照的默认最大过期时间（秒）"},
+    )
+
+    columnar_cache_staleness: str = Field(
+        default="",
+        metadata={"description": "按表覆盖最大过期时间，例如 orders=300,customers=3600"},
+    )
+
+    columnar_cache_incremental_columns: str = Field(
+        default="",
+        metadata={"description": "只追加表的增量刷新列，例如 orders=id"},
+    )
+
+    result_cache_max_entries: int = Field(
+        default=256,
+        metadata={"description": "数据分析SQL结果缓存的最大条目数，0表示不启用"},
+    )
+
+    result_cache_version_table: str = Field(
+        default="",
+        metadata={"description": "由触发器维护的表版本表；为空时使用pg_stat_user_tables计数器"},
+    )
+
+    result_cache_version_ttl_seconds: float = Field(
+        default=1.0,
+        metadata={"description": "表版本号的复用时间（秒），0表示每次查询都检查"},
+    )
+
+    @property
+    def analysis_tables(self) -> list[str]:
+        """Return the configured data analysis tables as a list."""
+        return [t.strip() for t in self.data_analysis_tables.split(",") if t.strip()]
+
     @classmethod
     def from_runnable_config(
         cls, config: Optional[RunnableConfig] = None
@@ -0,0 +1,190 @@
+"""Token-budgeted packing of research results into prompts.
+
+``reflection`` and ``finalize_answer`` put every research result into one
+prompt. When the results exceed a node's token budget, the packer splits
+them into chunks of whole sentences, ranks the chunks by BM25 relevance to
+the research topic and greedily keeps the best chunks that fit. The kept
+chunks are emitted in their original order, with the text of each chunk
+unchanged, so citation markers (``[label](short_url)``) stay intact and
+``finalize_answer`` can still resolve the short URLs. A marker is never
+split from the sentence it cites.
+
+Tokens are counted with tiktoken when it is installed and its vocabulary
+can be loaded (once per model), otherwise estimated from the text length.
+"""
+
+import functools
+import logging
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Same tokenization as the task classifier: words and single CJK characters
+_TERM = re.compile(r"[a-z0-9_]+|[一-鿿]")
+_MARKER = re.compile(r"\[[^\]\n]*\]\([^)\s]*\)")
+_PLACEHOLDER = re.compile(r"\x00(\d+)\x00")
+# Sentence ends with the citation markers that follow them, or line breaks
+_BOUNDARY = re.compile(r"[.!?。！？](?:[ \t]*\x00\d+\x00)*(?:[ \t]*\n+|[ \t]+)|\n+")
+
+# Target size of a chunk; longer sentences form a chunk of their own
+_CHUNK_TOKENS = 200
+# BM25 parameters
+_K1 = 1.2
+_B = 0.75
+# Small preference for the lead of each result, which usually summarizes it
+_LEAD_BONUS = 0.1
+
+
+@functools.lru_cache(maxsize=16)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # tiktoken downloads its vocabularies on first use; offline, estimate instead
+        logger.warning("tokenizer for %s unavailable, estimating token counts: %s", model, e)
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """Count the tokens of ``text`` for ``model``."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split ``text`` into sentences that keep their trailing whitespace.
+
+    Citation markers stay with the sentence they follow; joining the
+    sentences gives back ``text``.
+    """
+    markers: List[str] = []
+
+    def hide(match: re.Match) -> str:
+        markers.append(match.group(0))
+        return f"\x00{len(markers) - 1}\x00"
+
+    hidden = _MARKER.sub(hide, text)
+    sentences, start = [], 0
+    for match in _BOUNDARY.finditer(hidden):
+        sentences.append(hidden[start:match.end()])
+        start = match.end()
+    if start < len(hidden):
+        sentences.append(hidden[start:])
+    return [_PLACEHOLDER.sub(lambda m: markers[int(m.group(1))], s) for s in sentences]
+
+
+@dataclass
+class Chunk:
+    """Consecutive sentences of one result."""
+
+    result: int
+    position: int
+    text: str
+    tokens: int
+    score: float = 0.0
+
+
+def split_chunks(results: Sequence[str], model: str, chunk_tokens: int = _CHUNK_TOKENS) -> List[Chunk]:
+    """Split every result into chunks of about ``chunk_tokens`` tokens."""
+    chunks: List[Chunk] = []
+    for index, result in enumerate(results):
+        text, tokens, position = "", 0, 0
+        for sentence in split_sentences(result):
+            sentence_tokens = count_tokens(sentence, model)
+            if text and tokens + sentence_tokens > chunk_tokens:
+                chunks.append(Chunk(index, position, text, tokens))
+                text, tokens, position = "", 0, position + 1
+            text += sentence
+            tokens += sentence_tokens
+        if text:
+            chunks.append(Chunk(index, position, text, tokens))
+    return chunks
+
+
+def _terms(text: str) -> List[str]:
+    return _TERM.findall(_MARKER.sub(" ", text).lower())
+
+
+def score_chunks(chunks: List[Chunk], topic: str) -> None:
+    """Set the BM25 score of every chunk for the terms of ``topic``."""
+    query = set(_terms(topic))
+    documents = [Counter(_terms(chunk.text)) for chunk in chunks]
+    if not documents:
+        return
+    average_length = sum(sum(d.values()) for d in documents) / len(documents) or 1.0
+    document_frequency = Counter(term for d in documents for term in query if term in d)
+    for chunk, counts in zip(chunks, documents):
+        length = sum(counts.values())
+        score = 0.0
+        for term in query:
+            frequency = counts.get(term, 0)
+            if not frequency:
+                continue
+            df = document_frequency[term]
+            idf = math.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+            score += idf * frequency * (_K1 + 1) / (
+                frequency + _K1 * (1 - _B + _B * length / average_length)
+            )
+        chunk.score = score + (_LEAD_BONUS if chunk.position == 0 else 0.0)
+
+
+def pack_results(
+    results: Sequence[str],
+    topic: str,
+    budget_tokens: int,
+    model: str = "gpt-4o",
+    separator: str = "\n\n---\n\n",
+) -> str:
+    """Join ``results`` with ``separator``, keeping within ``budget_tokens``.
+
+    Results that fit the budget are joined unchanged. Otherwise the most
+    relevant chunks that fit are kept in their original order, and a note
+    says how much was left out. A budget of 0 disables packing.
+    """
+    joined = separator.join(results)
+    if budget_tokens <= 0 or count_tokens(joined, model) <= budget_tokens:
+        return joined
+
+    chunks = split_chunks(results, model)
+    score_chunks(chunks, topic)
+    separator_tokens = count_tokens(separator, model)
+    used, kept = 0, []
+    opened = set()
+    # Stable sort: equal scores keep the original order
+    for chunk in sorted(chunks, key=lambda c: -c.score):
+        cost = chunk.tokens + (0 if chunk.result in opened else separator_tokens)
+        if used + cost > budget_tokens:
+            continue
+        used += cost
+        opened.add(chunk.result)
+        kept.append(chunk)
+
+    packed: List[str] = []
+    previous: Optional[Chunk] = None
+    for chunk in sorted(kept, key=lambda c: (c.result, c.position)):
+        if previous is None or previous.result != chunk.result:
+            packed.append(chunk.text)
+        elif previous.position + 1 == chunk.position:
+            packed[-1] += chunk.text
+        else:
+            packed[-1] = packed[-1].rstrip() + " [...] " + chunk.text
+        previous = chunk
+    omitted = len(chunks) - len(kept)
+    note = f"\n\n[{omitted} of {len(chunks)} passages left out to fit the context budget]"
+    return separator.join(packed) + note
@@ -0,0 +1,249 @@
+"""Run deadlines, per-node timeouts and straggler cutoff for fan-out branches.
+
+A run gets an absolute deadline (wall clock seconds) from the request, either
+as ``deadline`` in the input state or derived from ``run_timeout_seconds``.
+The deadline is kept in state and copied into every ``Send`` payload, so each
+node can bound its LLM calls with :func:`node_timeout`; the last node of the
+run clears it again so the next turn of the thread starts without it.
+
+Branches of one fan-out share a :class:`FanOutJoin`. Once a quorum of them
+has completed, the remaining branches get a grace period; branches still
+running after it, or after the run deadline, are cancelled and reported in
+``missing_branches`` instead of holding up or failing the join.
+"""
+
+import contextvars
+import logging
+import math
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from agent.profiling import run_in_context
+
+logger = logging.getLogger(__name__)
+
+# Lower bound for LLM call timeouts so a nearly expired deadline still gets
+# a usable request instead of an immediate timeout.
+_MIN_TIMEOUT = 1.0
+
+
+class BranchCancelled(Exception):
+    """Raised inside a branch that was cut off."""
+
+
+def run_deadline(state: Dict[str, Any], run_timeout_seconds: float) -> Optional[float]:
+    """Return the run deadline from the input state or the configured run timeout.
+
+    A deadline that has already passed is left over from an earlier run of
+    the thread that did not finish, and is ignored.
+    """
+    if state.get("deadline") and not expired(float(state["deadline"])):
+        return float(state["deadline"])
+    if run_timeout_seconds > 0:
+        return time.time() + run_timeout_seconds
+    return None
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """Return the seconds left until ``deadline``, or None without a deadline."""
+    if deadline is None:
+        return None
+    return deadline - time.time()
+
+
+def expired(deadline: Optional[float]) -> bool:
+    """Return True if ``deadline`` is set and has passed."""
+    left = remaining(deadline)
+    return left is not None and left <= 0
+
+
+def node_timeout(node_timeout_seconds: float, deadline: Optional[float]) -> Optional[float]:
+    """Return the timeout for an LLM call of a node.
+
+    The smaller of the per-node timeout and the time left until the deadline,
+    or None if neither applies.
+    """
+    timeouts = [t for t in (node_timeout_seconds or None, remaining(deadline)) if t is not None]
+    if not timeouts:
+        return None
+    return max(min(timeouts), _MIN_TIMEOUT)
+
+
+class CancelScope:
+    """Cancellation handle passed into a branch.
+
+    Branches call :meth:`check` between steps. The scope can also be passed
+    as the ``attempt`` of a streamed LLM call, which then closes its response
+    stream on cancellation.
+    """
+
+    def __init__(self):
+        """Create a scope that is not cancelled."""
+        self._cancelled = threading.Event()
+        self._callbacks: List[Callable[[], Any]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the scope has been cancelled."""
+        return self._cancelled.is_set()
+
+    def claim(self) -> bool:
+        """Return True while the branch may still publish its result."""
+        return not self.cancelled
+
+    def check(self) -> None:
+        """Raise :class:`BranchCancelled` if the scope has been cancelled."""
+        if self.cancelled:
+            raise BranchCancelled()
+
+    def on_cancel(self, callback: Callable[[], Any]) -> None:
+        """Run ``callback`` on cancellation, or right away if already cancelled."""
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self) -> None:
+        """Cancel the scope and run its callbacks once; later calls do nothing."""
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug("cancel callback failed: %s", e)
+
+
+class FanOutJoin:
+    """Completion tracking of the branches of one fan-out."""
+
+    def __init__(self, size: int, quorum: float, grace_seconds: float):
+        """Track ``size`` branches, ``quorum`` of which must finish before the grace period."""
+        self.size = size
+        self.needed = min(size, max(1, math.ceil(size * quorum)))
+        self.grace_seconds = grace_seconds
+        self.completed = 0
+        self.left = 0
+        self.quorum_at: Optional[float] = None
+        self.cond = threading.Condition()
+
+    def cutoff(self, deadline: Optional[float]) -> Optional[float]:
+        """Return the wall-clock time after which stragglers are cancelled."""
+        times = [deadline]
+        if self.quorum_at is not None and self.completed < self.size:
+            times.append(self.quorum_at + self.grace_seconds)
+        times = [t for t in times if t is not None]
+        return min(times) if times else None
+
+    def branch_completed(self) -> None:
+        """Count a finished branch and wake up the waiting join."""
+        with self.cond:
+            self.completed += 1
+            if self.quorum_at is None and self.completed >= self.needed:
+                self.quorum_at = time.time()
+            self.cond.notify_all()
+
+
+_joins: Dict[str, FanOutJoin] = {}
+_joins_lock = threading.Lock()
+
+
+def new_fanout_id() -> str:
+    """Return a fresh id shared by the branches of one fan-out."""
+    return uuid.uuid4().hex
+
+
+def _acquire_join(fanout_id: str, size: int, quorum: float, grace_seconds: float) -> FanOutJoin:
+    with _joins_lock:
+        join = _joins.get(fanout_id)
+        if join is None:
+            join = _joins[fanout_id] = FanOutJoin(size, quorum, grace_seconds)
+        return join
+
+
+def _release_join(fanout_id: str, join: FanOutJoin) -> None:
+    with _joins_lock:
+        join.left += 1
+        if join.left >= join.size:
+            _joins.pop(fanout_id, None)
+
+
+def run_branch(
+    state: Dict[str, Any],
+    fn: Callable[[CancelScope], Dict[str, Any]],
+    node: str,
+    query: str,
+    node_timeout_seconds: float,
+    quorum: float,
+    grace_seconds: float,
+) -> Dict[str, Any]:
+    """Run a fan-out branch under the run deadline and the straggler cutoff.
+
+    Args:
+        state: The ``Send`` payload, with ``id`` and optionally ``deadline``,
+            ``fanout_id`` and ``fanout_size``.
+        fn: The branch body; it receives a :class:`CancelScope` and returns the
+            state update.
+        node: Node name reported for missing branches.
+        query: Query reported for missing branches.
+        node_timeout_seconds: Time limit of the branch, 0 for none.
+        quorum: Fraction of the fan-out's branches to wait for before the
+            stragglers get ``grace_seconds`` to finish.
+        grace_seconds: Grace period for stragglers once the quorum is reached.
+
+    Returns:
+        The branch's state update, or an update that records the branch in
+        ``missing_branches`` if it was cut off or failed.
+    """
+    deadlines = [state.get("deadline")]
+    if node_timeout_seconds > 0:
+        deadlines.append(time.time() + node_timeout_seconds)
+    deadlines = [d for d in deadlines if d is not None]
+    deadline = min(deadlines) if deadlines else None
+
+    fanout_id = state.get("fanout_id") or new_fanout_id()
+    join = _acquire_join(fanout_id, state.get("fanout_size") or 1, quorum, grace_seconds)
+    scope = CancelScope()
+    outcome: Dict[str, Any] = {}
+    context = contextvars.copy_context()
+
+    def work():
+        try:
+            outcome["update"] = run_in_context(context, fn, scope)
+        except BaseException as e:
+            outcome["error"] = e
+        with join.cond:
+            outcome["done"] = True
+            join.cond.notify_all()
+
+    threading.Thread(target=work, name=f"{node}-{state.get('id')}", daemon=True).start()
+    try:
+        with join.cond:
+            while "done" not in outcome:
+                cutoff = join.cutoff(deadline)
+                timeout = None if cutoff is None else cutoff - time.time()
+                if timeout is not None and timeout <= 0:
+                    break
+                join.cond.wait(timeout)
+
+        if "done" not in outcome:
+            scope.cancel()
+            reason = "deadline" if expired(deadline) else "straggler"
+            logger.warning("%s branch %s cut off (%s)", node, state.get("id"), reason)
+        elif "error" in outcome:
+            reason = "error"
+            logger.warning("%s branch %s failed: %s", node, state.get("id"), outcome["error"])
+        else:
+            join.branch_completed()
+            return outcome["update"]
+    finally:
+        _release_join(fanout_id, join)
+
+    return {"missing_branches": [{"node": node, "id": state.get("id"), "query": query, "reason": reason}]}
@@ -1,11 +1,21 @@
+import logging
 import os
-
-from agent.tools_and_schemas import SearchQueryList, Reflection, TaskType, DataAnalysisQuery
+from functools import partial
+from typing import Optional
+
+from agent.tools_and_schemas import (
+    SearchQueryList,
+    Reflection,
+    TaskType,
+    DataAnalysisQuery,
+    AnalysisSQL,
+)
 from dotenv import load_dotenv
-from langchain_core.messages import AIMessage
-from langgraph.types import Send
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.types import Overwrite, Send
 from langgraph.graph import StateGraph
 from langgraph.graph import START, END
+from langgraph.store.base import BaseStore
 from langchain_core.runnables import RunnableConfig
 from openai import OpenAI
 
@@ -19,13 +29,28 @@ from agent.state import (
 from agent.configuration import Configuration
 from agent.prompts import (
     get_current_date,
+    build_messages,
     query_writer_instructions,
+    query_writer_input,
     task_type_instructions,
+    task_type_input,
     data_analysis_instructions,
+    data_analysis_input,
     web_searcher_instructions,
+    web_searcher_input,
+    sql_generator_instructions,
+    sql_generator_input,
+    sql_rejected_input,
+    approximate_suggestion,
     data_analyzer_instructions,
+    data_analyzer_input,
     reflection_instructions,
+    reflection_input,
     answer_instructions,
+    answer_input,
+    conversation_context_block,
+    history_summary_instructions,
+    history_summary_input,
 )
 from langchain_openai import ChatOpenAI
 from agent.utils import (
@@ -34,11 +59,35 @@ from agent.utils import (
     insert_citation_markers,
     resolve_urls,
     get_table_schema,
+    get_analysis_table_stats,
+    get_task_classifier,
+    get_routing_log,
+    run_analysis_query,
+    run_approximate_query,
+    should_suggest_approximate,
+    digest_analysis_result,
     can_analyze_with_data_analysis,
 )
+from agent.cascade import invoke_cascade
+from agent.context_packer import pack_results
+from agent.deadlines import CancelScope, expired, new_fanout_id, node_timeout, run_branch, run_deadline
+from agent.hedging import hedger
+from agent.history import compact_history as compact_messages
+from agent.history import conversation_context, fallback_summary
+from agent.llm_calls import invoke_chat, invoke_structured, stream_chat, stream_chat_completion
+from agent.pipeline import ResearchPipeline
+from agent.profiling import profiled
+from agent.progress import BranchProgress
+from agent.sql_executor import SQLExecutionError
+from agent.sql_guard import QueryRejected
+from agent.table_stats import format_table_stats
+from agent.task_classifier import schema_terms
+from agent.tracing import span, traced
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 if os.getenv("OPENAI_API_KEY") is None:
     raise ValueError("OPENAI_API_KEY is not set")
 
@@ -53,17 +102,21 @@ openai_client = OpenAI(
 def determine_task_type(state: OverallState, config: RunnableConfig) -> OverallState:
     """LangGraph node that determines whether to perform web research or data analysis.
 
-    Uses OpenAI GPT to analyze the user's question and determine the appropriate task type.
-    Also initializes database schema information for data analysis capabilities.
+    A local classifier over hashed n-grams and schema terms decides confident cases;
+    otherwise OpenAI GPT analyzes the user's question and determines the task type.
+    Also initializes database schema information for data analysis capabilities,
+    and starts the run with a fresh deadline and no missing branches.
 
     Args:
         state: Current graph state containing the User's question
         config: Configuration for the runnable, including LLM provider settings
 
     Returns:
-        Dictionary with state update, including task_type key and database_schema
+        Dictionary with state update, including task_type key, database_schema
+        and the run deadline
     """
     configurable = Configuration.from_runnable_config(config)
+    deadline = run_deadline(state, configurable.run_timeout_seconds)
 
     # 获取数据库表结构信息
     database_schema = {}
@@ -72,31 +125,59 @@ def determine_task_type(state: OverallState, config: RunnableConfig) -> OverallS
     except Exception as e:
         print(f"获取数据库表结构失败: {str(e)}")
 
+    # 没有可分析的数据库表时只能进行网络搜索，无需判断
+    if not database_schema:
+        return {
+            "task_type": "web_research",
+            "database_schema": database_schema,
+            "deadline": deadline,
+            "missing_branches": Overwrite([]),
+        }
+
+    research_topic = get_research_topic(state["messages"])
+    terms = schema_terms(database_schema)
+    routing_log = get_routing_log(configurable)
+
+    # Let the local classifier decide when it is trained and confident enough
+    classifier = get_task_classifier(configurable)
+    task_type, confidence = classifier.predict(research_topic, terms)
+    if classifier.trained and confidence >= configurable.task_classifier_threshold:
+        if routing_log is not None:
+            routing_log.record(research_topic, terms, task_type, "local", confidence)
+        return {
+            "task_type": task_type,
+            "database_schema": database_schema,
+            "deadline": deadline,
+            "missing_branches": Overwrite([]),
+        }
+
     # init OpenAI GPT
     llm = ChatOpenAI(
         model=configurable.query_generator_model,
         temperature=0.5,
         max_retries=2,
+        timeout=node_timeout(configurable.node_timeout_seconds, deadline),
         api_key=os.getenv("OPENAI_API_KEY"),
         base_url=os.getenv("OPENAI_API_BASE"),
     )
-    structured_llm = llm.with_structured_output(TaskType)
 
     # Format the prompt
-    formatted_prompt = task_type_instructions.format(
-        research_topic=get_research_topic(state["messages"]),
+    messages = build_messages(
+        task_type_instructions,
+        task_type_input,
+        research_topic=research_topic,
     )
     
     # Determine the task type
-    result = structured_llm.invoke(formatted_prompt)
-    
-    # 如果任务类型是data_analysis，但数据库表结构为空，则改为web_research
-    if result.task_type == "data_analysis" and not database_schema:
-        result.task_type = "web_research"
+    result = invoke_structured(llm, TaskType, messages, "determine_task_type")
+    if routing_log is not None:
+        routing_log.record(research_topic, terms, result.task_type, "llm", confidence)
     
     return {
         "task_type": result.task_type,
-        "database_schema": database_schema
+        "database_schema": database_schema,
+        "deadline": deadline,
+        "missing_branches": Overwrite([]),
     }
 
 
@@ -124,20 +205,42 @@ def generate_query(state: OverallState, config: RunnableConfig) -> QueryGenerati
         model=configurable.query_generator_model,
         temperature=1.0,
         max_retries=2,
+        timeout=node_timeout(configurable.node_timeout_seconds, state.get("deadline")),
         api_key=os.getenv("OPENAI_API_KEY"),
         base_url=os.getenv("OPENAI_API_BASE"),
     )
-    structured_llm = llm.with_structured_output(SearchQueryList)
 
     # Format the prompt
     current_date = get_current_date()
-    formatted_prompt = query_writer_instructions.format(
+    messages = build_messages(
+        query_writer_instructions,
+        query_writer_input,
         current_date=current_date,
+        conversation_context=_conversation_context(state, configurable),
         research_topic=get_research_topic(state["messages"]),
         number_queries=state["initial_search_query_count"],
     )
     # Generate the search queries
-    result = structured_llm.invoke(formatted_prompt)
+    if configurable.cascade_mode and configurable.cascade_model != configurable.query_generator_model:
+        number_queries = state["initial_search_query_count"]
+        cheap_llm = ChatOpenAI(
+            model=configurable.cascade_model,
+            temperature=1.0,
+            max_retries=0,
+            timeout=node_timeout(configurable.node_timeout_seconds, state.get("deadline")),
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_API_BASE"),
+        )
+        result = invoke_cascade(
+            "generate_query",
+            cheap_llm,
+            llm,
+            SearchQueryList,
+            messages,
+            lambda r: None if 0 < len(r.query) <= number_queries else "query_count",
+        )
+    else:
+        result = invoke_structured(llm, SearchQueryList, messages, "generate_query")
     return {"search_query": result.query}
 
 
@@ -160,41 +263,65 @@ def generate_data_analysis_query(state: OverallState, config: RunnableConfig) ->
         model=configurable.query_generator_model,
         temperature=1.0,
         max_retries=2,
+        timeout=node_timeout(configurable.node_timeout_seconds, state.get("deadline")),
         api_key=os.getenv("OPENAI_API_KEY"),
         base_url=os.getenv("OPENAI_API_BASE"),
     )
-    structured_llm = llm.with_structured_output(DataAnalysisQuery)
 
     # Format the prompt
-    formatted_prompt = data_analysis_instructions.format(
+    messages = build_messages(
+        data_analysis_instructions,
+        data_analysis_input,
         research_topic=get_research_topic(state["messages"]),
     )
     
     # Generate the data analysis queries
-    result = structured_llm.invoke(formatted_prompt)
+    result = invoke_structured(llm, DataAnalysisQuery, messages, "generate_data_analysis_query")
     return {"data_analysis_query": result.analysis_query}
 
 
-def continue_to_web_research(state: QueryGenerationState):
-    """LangGraph node that sends the search queries to the web research node.
+def _send_branches(node: str, key: str, queries: list, state: OverallState, first_id: int = 0):
+    """Build the ``Send`` payloads of one fan-out.
 
-    This is used to spawn n number of web research nodes, one for each search query.
+    Every payload carries the run deadline and the fan-out id and size, which
+    the branches use for the straggler cutoff.
     """
+    fanout_id = new_fanout_id()
     return [
-        Send("web_research", {"search_query": search_query, "id": int(idx)})
-        for idx, search_query in enumerate(state["search_query"])
+        Send(
+            node,
+            {
+                key: query,
+                "id": first_id + int(idx),
+                "deadline": state.get("deadline"),
+                "fanout_id": fanout_id,
+                "fanout_size": len(queries),
+            },
+        )
+        for idx, query in enumerate(queries)
     ]
 
 
-def continue_to_data_analysis(state: OverallState):
+def continue_to_web_research(state: QueryGenerationState, config: RunnableConfig):
+    """LangGraph node that sends the search queries to the web research node.
+
+    This is used to spawn n number of web research nodes, one for each search query.
+    In pipelined mode all queries go to the pipelined research node instead.
+    """
+    if Configuration.from_runnable_config(config).pipelined_research:
+        return "pipelined_research"
+    return _send_branches("web_research", "search_query", state["search_query"], state)
+
+
+def continue_to_data_analysis(state: OverallState, config: RunnableConfig):
     """LangGraph node that sends the analysis queries to the data analysis node.
 
     This is used to spawn n number of data analysis nodes, one for each analysis query.
+    In pipelined mode all queries go to the pipelined research node instead.
     """
-    return [
-        Send("data_analysis", {"analysis_query": analysis_query, "id": int(idx)})
-        for idx, analysis_query in enumerate(state["data_analysis_query"])
-    ]
+    if Configuration.from_runnable_config(config).pipelined_research:
+        return "pipelined_research"
+    return _send_branches("data_analysis", "analysis_query", state["data_analysis_query"], state)
 
 
 def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
@@ -211,7 +338,36 @@ def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
     """
     # Configure
     configurable = Configuration.from_runnable_config(config)
-    formatted_prompt = web_searcher_instructions.format(
+    return _run_web_research(state, configurable)
+
+
+def _run_web_research(state: WebSearchState, configurable: Configuration) -> OverallState:
+    """Run one web research query under the branch deadline."""
+    progress = BranchProgress("web_research", state["id"])
+    progress.emit("query_started", query=state["search_query"])
+    update = run_branch(
+        state,
+        partial(_web_research_branch, state, configurable, progress),
+        "web_research",
+        state["search_query"],
+        configurable.node_timeout_seconds,
+        configurable.branch_quorum,
+        configurable.straggler_grace_seconds,
+    )
+    if "missing_branches" in update:
+        progress.emit("cancelled", reason=update["missing_branches"][0]["reason"])
+        # Keep the query counted so that follow-up branch ids stay unique
+        update["search_query"] = [state["search_query"]]
+    return update
+
+
+def _web_research_branch(
+    state: WebSearchState, configurable: Configuration, progress: BranchProgress, scope: CancelScope
+) -> OverallState:
+    """Body of ``web_research``, run under the branch deadline."""
+    messages = build_messages(
+        web_searcher_instructions,
+        web_searcher_input,
         current_date=get_current_date(),
         research_topic=state["search_query"],
     )
@@ -219,15 +375,26 @@ def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
     # Uses the OpenAI client for web search
     # Note: This is a simplified implementation. You may need to implement
     # a proper web search tool or use a different approach for web search
-    response = openai_client.chat.completions.create(
-        model=configurable.query_generator_model,
-        messages=[{"role": "user", "content": formatted_prompt}],
-        temperature=0,
+    search_result = _call_hedged(
+        configurable,
+        configurable.query_generator_model,
+        partial(
+            stream_chat_completion,
+            openai_client,
+            configurable.query_generator_model,
+            messages,
+            "web_research",
+            on_text=progress.add_text,
+            temperature=0,
+            timeout=node_timeout(configurable.node_timeout_seconds, state.get("deadline")),
+        ),
+        scope,
     )
+    progress.step("search")
     
     # For now, we'll create a simple response structure
     # In a real implementation, you'd need to integrate with a web search API
-    search_result = response.choices[0].message.content or "No search results found."
+    search_result = search_result or "No search results found."
     
     # Create a simple citation structure
     citations = [{
@@ -242,6 +409,13 @@ def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
     
     modified_text = insert_citation_markers(search_result, citations)
     sources_gathered = [item for citation in citations for item in citation["segments"]]
+    progress.emit(
+        "sources_found",
+        count=len(sources_gathered),
+        labels=[source["label"] for source in sources_gathered],
+    )
+    progress.step("citations")
+    progress.finished(query=state["search_query"])
 
     return {
         "sources_gathered": sources_gathered,
@@ -251,9 +425,11 @@ def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
 
 
 def data_analysis(state: DataAnalysisState, config: RunnableConfig) -> OverallState:
-    """LangGraph node that performs data analysis using numerical data and calculations.
+    """LangGraph node that performs data analysis on the configured database tables.
 
-    Executes data analysis using OpenAI GPT to analyze numerical data and perform calculations.
+    Generates a single SQL query for the analysis question with aggregations, filters
+    and joins pushed down to PostgreSQL, streams its result through a server-side
+    cursor, and uses OpenAI GPT to interpret the numbers.
 
     Args:
         state: Current graph state containing the analysis query
@@ -264,19 +440,116 @@ def data_analysis(state: DataAnalysisState, config: RunnableConfig) -> OverallSt
     """
     # Configure
     configurable = Configuration.from_runnable_config(config)
-    formatted_prompt = data_analyzer_instructions.format(
+    return _run_data_analysis(state, configurable)
+
+
+def _run_data_analysis(state: DataAnalysisState, configurable: Configuration) -> OverallState:
+    """Run one data analysis query under the branch deadline."""
+    progress = BranchProgress("data_analysis", state["id"])
+    progress.emit("query_started", query=state["analysis_query"])
+    update = run_branch(
+        state,
+        partial(_data_analysis_branch, state, configurable, progress),
+        "data_analysis",
+        state["analysis_query"],
+        configurable.node_timeout_seconds,
+        configurable.branch_quorum,
+        configurable.straggler_grace_seconds,
+    )
+    if "missing_branches" in update:
+        progress.emit("cancelled", reason=update["missing_branches"][0]["reason"])
+    return update
+
+
+def _data_analysis_branch(
+    state: DataAnalysisState, configurable: Configuration, progress: BranchProgress, scope: CancelScope
+) -> OverallState:
+    """Body of ``data_analysis``, run under the branch deadline."""
+    table_statistics = format_table_stats(get_analysis_table_stats(configurable))
+    progress.step("table_stats")
+
+    query_results = "No query was executed because no analysis tables are configured."
+    if configurable.analysis_tables:
+        llm = ChatOpenAI(
+            model=configurable.query_generator_model,
+            temperature=0,
+            max_retries=2,
+            timeout=node_timeout(configurable.node_timeout_seconds, state.get("deadline")),
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_API_BASE"),
+        )
+        sql_messages = build_messages(
+            sql_generator_instructions,
+            sql_generator_input,
+            research_topic=state["analysis_query"],
+            table_statistics=table_statistics,
+        )
+        # A query rejected by the cost guard gets one retry with the reason
+        for _ in range(2):
+            scope.check()
+            analysis_sql = invoke_structured(llm, AnalysisSQL, sql_messages, "data_analysis")
+            progress.step("sql")
+            scope.check()
+            try:
+                query_result = None
+                if configurable.approximate_queries:
+                    query_result = run_approximate_query(configurable, analysis_sql.sql)
+                if query_result is None:
+                    query_result = run_analysis_query(configurable, analysis_sql.sql)
+            except QueryRejected as e:
+                query_results = f"SQL:\n{analysis_sql.sql}\n\nQuery rejected: {str(e)}"
+                if should_suggest_approximate(configurable, analysis_sql.sql, e.estimated_cost):
+                    progress.emit("approximate_suggested", approximate_cost=e.estimated_cost)
+                    query_results += "\n\n" + approximate_suggestion.format(cost=e.estimated_cost)
+                sql_messages.append(
+                    HumanMessage(content=sql_rejected_input.format(sql=analysis_sql.sql, reason=str(e)))
+                )
+                continue
+            except SQLExecutionError as e:
+                query_results = f"SQL:\n{analysis_sql.sql}\n\nQuery failed: {str(e)}"
+                break
+            progress.step("query")
+            found = {"count": query_result.row_count, "source": query_result.source}
+            if query_result.approximation is not None:
+                found["sample_percent"] = float(f"{query_result.approximation.sample_percent:.3g}")
+            progress.emit("sources_found", **found)
+            digest = digest_analysis_result(configurable, query_result, analysis_sql.dimensions)
+            query_results = f"SQL:\n{query_result.sql}\n\n{digest}"
+            if should_suggest_approximate(configurable, analysis_sql.sql, query_result.estimated_cost):
+                progress.emit("approximate_suggested", approximate_cost=query_result.estimated_cost)
+                query_results += "\n\n" + approximate_suggestion.format(cost=query_result.estimated_cost)
+            progress.step("digest")
+            break
+
+    scope.check()
+    messages = build_messages(
+        data_analyzer_instructions,
+        data_analyzer_input,
         research_topic=state["analysis_query"],
+        table_statistics=table_statistics,
+        query_results=query_results,
     )
 
     # Uses the OpenAI client for data analysis
-    response = openai_client.chat.completions.create(
-        model=configurable.query_generator_model,
-        messages=[{"role": "user", "content": formatted_prompt}],
-        temperature=0,
+    analysis_result = _call_hedged(
+        configurable,
+        configurable.query_generator_model,
+        partial(
+            stream_chat_completion,
+            openai_client,
+            configurable.query_generator_model,
+            messages,
+            "data_analysis",
+            on_text=progress.add_text,
+            temperature=0,
+            timeout=node_timeout(configurable.node_timeout_seconds, state.get("deadline")),
+        ),
+        scope,
     )
+    progress.step("analysis")
     
     # Create analysis result
-    analysis_result = response.choices[0].message.content or "No analysis results found."
+    analysis_result = analysis_result or "No analysis results found."
     
     # Create a simple citation structure for data analysis
     citations = [{
@@ -291,6 +564,7 @@ def data_analysis(state: DataAnalysisState, config: RunnableConfig) -> OverallSt
     
     modified_text = insert_citation_markers(analysis_result, citations)
     sources_gathered = [item for citation in citations for item in citation["segments"]]
+    progress.finished(query=state["analysis_query"])
 
     return {
         "sources_gathered": sources_gathered,
@@ -298,6 +572,23 @@ def data_analysis(state: DataAnalysisState, config: RunnableConfig) -> OverallSt
     }
 
 
+def _call_hedged(configurable: Configuration, model: str, fn, scope: Optional[CancelScope] = None):
+    """Call ``fn(attempt=...)``, hedged if enabled in the configuration.
+
+    Without hedging, the branch's cancel ``scope`` is passed as the attempt.
+    """
+    if not configurable.hedge_requests:
+        return fn(attempt=scope)
+    return hedger.call(
+        model,
+        fn,
+        percentile=configurable.hedge_latency_percentile,
+        min_delay=configurable.hedge_min_delay_seconds,
+        budget_ratio=configurable.hedge_budget_ratio,
+        scope=scope,
+    )
+
+
 def reflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
     """LangGraph node that identifies knowledge gaps and generates potential follow-up queries.
 
@@ -317,9 +608,16 @@ def reflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
     state["research_loop_count"] = state.get("research_loop_count", 0) + 1
     reasoning_model = state.get("reasoning_model", configurable.reflection_model)
 
-    # Format the prompt
-    current_date = get_current_date()
-    
+    # Past the deadline there is no time for another research loop
+    if expired(state.get("deadline")):
+        return {
+            "is_sufficient": True,
+            "knowledge_gap": "",
+            "follow_up_queries": [],
+            "research_loop_count": state["research_loop_count"],
+            "number_of_ran_queries": len(state.get("search_query", [])) + len(state.get("data_analysis_query", [])),
+        }
+
     # Combine web research and data analysis results
     all_results = []
     if state.get("web_research_result"):
@@ -327,11 +625,33 @@ def reflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
     if state.get("data_analysis_result"):
         all_results.extend(state["data_analysis_result"])
     
-    summaries = "\n\n---\n\n".join(all_results) if all_results else "No results available."
-    
-    formatted_prompt = reflection_instructions.format(
-        current_date=current_date,
-        research_topic=get_research_topic(state["messages"]),
+    research_topic = get_research_topic(state["messages"])
+    summaries = (
+        pack_results(all_results, research_topic, configurable.reflection_context_tokens, reasoning_model)
+        if all_results
+        else "No results available."
+    )
+    summaries += _missing_branches_note(state)
+    result = _reflect(configurable, reasoning_model, research_topic, summaries)
+
+    return {
+        "is_sufficient": result.is_sufficient,
+        "knowledge_gap": result.knowledge_gap,
+        "follow_up_queries": result.follow_up_queries,
+        "research_loop_count": state["research_loop_count"],
+        "number_of_ran_queries": len(state.get("search_query", [])) + len(state.get("data_analysis_query", [])),
+    }
+
+
+def _reflect(
+    configurable: Configuration, reasoning_model: str, research_topic: str, summaries: str
+) -> Reflection:
+    """Run the gap analysis of ``summaries``, through the cascade if enabled."""
+    messages = build_messages(
+        reflection_instructions,
+        reflection_input,
+        current_date=get_current_date(),
+        research_topic=research_topic,
         summaries=summaries,
     )
     # init Reasoning Model
@@ -339,18 +659,118 @@ def reflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
         model=reasoning_model,
         temperature=1.0,
         max_retries=2,
+        timeout=node_timeout(configurable.node_timeout_seconds, None),
         api_key=os.getenv("OPENAI_API_KEY"),
         base_url=os.getenv("OPENAI_API_BASE"),
     )
-    result = llm.with_structured_output(Reflection).invoke(formatted_prompt)
+    if configurable.cascade_mode and configurable.cascade_model != reasoning_model:
+        cheap_llm = ChatOpenAI(
+            model=configurable.cascade_model,
+            temperature=1.0,
+            max_retries=0,
+            timeout=node_timeout(configurable.node_timeout_seconds, None),
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_API_BASE"),
+        )
+        result = invoke_cascade(
+            "reflection",
+            cheap_llm,
+            llm,
+            Reflection,
+            messages,
+            lambda r: _reflection_escalation_reason(r, configurable.cascade_confidence_threshold),
+        )
+    else:
+        result = invoke_structured(llm, Reflection, messages, "reflection")
+    return result
 
-    return {
-        "is_sufficient": result.is_sufficient,
-        "knowledge_gap": result.knowledge_gap,
-        "follow_up_queries": result.follow_up_queries,
-        "research_loop_count": state["research_loop_count"],
-        "number_of_ran_queries": len(state.get("search_query", [])) + len(state.get("data_analysis_query", [])),
-    }
+
+def pipelined_research(state: OverallState, config: RunnableConfig) -> OverallState:
+    """LangGraph node that runs research as a continuous work queue.
+
+    Used instead of the ``Send`` fan-out and the ``reflection`` loop when
+    ``pipelined_research`` is enabled. Queries run concurrently, a gap analysis
+    starts as soon as results arrive, and its follow-up queries are dispatched
+    without waiting for the slowest query of the round.
+
+    Args:
+        state: Current graph state containing the generated queries
+        config: Configuration for the runnable, including research loop settings
+
+    Returns:
+        Dictionary with state update, including the research results and sources
+    """
+    configurable = Configuration.from_runnable_config(config)
+    max_research_loops = (
+        state.get("max_research_loops")
+        if state.get("max_research_loops") is not None
+        else configurable.max_research_loops
+    )
+    reasoning_model = state.get("reasoning_model") or configurable.reflection_model
+    research_topic = get_research_topic(state["messages"])
+    deadline = state.get("deadline")
+
+    if state.get("task_type") == "data_analysis":
+        queries = state["data_analysis_query"]
+        result_key = "data_analysis_result"
+
+        def run_query(query: str, query_id: int) -> OverallState:
+            with span("query", "data_analysis", branch=query_id):
+                return _run_data_analysis(
+                    {"analysis_query": query, "id": query_id, "deadline": deadline}, configurable
+                )
+
+    else:
+        queries = state["search_query"]
+        result_key = "web_research_result"
+
+        def run_query(query: str, query_id: int) -> OverallState:
+            with span("query", "web_research", branch=query_id):
+                return _run_web_research(
+                    {"search_query": query, "id": query_id, "deadline": deadline}, configurable
+                )
+
+    pipeline = ResearchPipeline(
+        run_query=run_query,
+        result_texts=lambda update: update.get(result_key, []),
+        analyze=lambda texts: _reflect(
+            configurable,
+            reasoning_model,
+            research_topic,
+            pack_results(texts, research_topic, configurable.reflection_context_tokens, reasoning_model)
+            if texts
+            else "No results available.",
+        ),
+        max_depth=max_research_loops,
+        max_workers=configurable.pipelined_max_workers,
+        deadline=deadline,
+    )
+    outcome = pipeline.run(queries)
+
+    update = outcome.updates
+    if state.get("task_type") == "data_analysis":
+        # web_research records the queries it ran; analysis follow-ups are added here
+        update["data_analysis_query"] = outcome.follow_ups
+    update["research_loop_count"] = outcome.max_depth_reached + 1
+    return update
+
+
+def _missing_branches_note(state: OverallState) -> str:
+    """Describe the research branches that were cut off, for the prompts."""
+    missing = state.get("missing_branches") or []
+    if not missing:
+        return ""
+    lines = [f"- {branch['query']} ({branch['reason']})" for branch in missing]
+    return "\n\n---\n\nThese queries did not finish and have no results:\n" + "\n".join(lines)
+
+
+def _reflection_escalation_reason(result: Reflection, threshold: float):
+    """Return why a cheap reflection must be escalated, or None to accept it."""
+    if not result.is_sufficient:
+        return "knowledge_gap"
+    if result.confidence < threshold:
+        return "low_confidence"
+    return None
 
 
 def evaluate_research(
@@ -375,33 +795,31 @@ def evaluate_research(
         if state.get("max_research_loops") is not None
         else configurable.max_research_loops
     )
-    if state["is_sufficient"] or state["research_loop_count"] >= max_research_loops:
+    if (
+        state["is_sufficient"]
+        or state["research_loop_count"] >= max_research_loops
+        or expired(state.get("deadline"))
+    ):
         return "finalize_answer"
     else:
         # Determine task type for follow-up queries based on original task type
         task_type = state.get("task_type", "web_research")
         if task_type == "data_analysis":
-            return [
-                Send(
-                    "data_analysis",
-                    {
-                        "analysis_query": follow_up_query,
-                        "id": state["number_of_ran_queries"] + int(idx),
-                    },
-                )
-                for idx, follow_up_query in enumerate(state["follow_up_queries"])
-            ]
+            return _send_branches(
+                "data_analysis",
+                "analysis_query",
+                state["follow_up_queries"],
+                state,
+                first_id=state["number_of_ran_queries"],
+            )
         else:
-            return [
-                Send(
-                    "web_research",
-                    {
-                        "search_query": follow_up_query,
-                        "id": state["number_of_ran_queries"] + int(idx),
-                    },
-                )
-                for idx, follow_up_query in enumerate(state["follow_up_queries"])
-            ]
+            return _send_branches(
+                "web_research",
+                "search_query",
+                state["follow_up_queries"],
+                state,
+                first_id=state["number_of_ran_queries"],
+            )
 
 
 def finalize_answer(state: OverallState, config: RunnableConfig):
@@ -430,11 +848,27 @@ def finalize_answer(state: OverallState, config: RunnableConfig):
     if state.get("data_analysis_result"):
         all_results.extend(state["data_analysis_result"])
     
-    summaries = "\n---\n\n".join(all_results) if all_results else "No results available."
+    research_topic = get_research_topic(state["messages"])
+    # Packing keeps whole sentences with their citation markers, so the short urls still resolve
+    summaries = (
+        pack_results(
+            all_results,
+            research_topic,
+            configurable.answer_context_tokens,
+            reasoning_model,
+            separator="\n---\n\n",
+        )
+        if all_results
+        else "No results available."
+    )
+    summaries += _missing_branches_note(state)
     
-    formatted_prompt = answer_instructions.format(
+    messages = build_messages(
+        answer_instructions,
+        answer_input,
         current_date=current_date,
-        research_topic=get_research_topic(state["messages"]),
+        conversation_context=_conversation_context(state, configurable),
+        research_topic=research_topic,
         summaries=summaries,
     )
 
@@ -443,10 +877,14 @@ def finalize_answer(state: OverallState, config: RunnableConfig):
         model=reasoning_model,
         temperature=0,
         max_retries=2,
+        # The answer is always written, even past the run deadline
+        timeout=node_timeout(configurable.node_timeout_seconds, None),
         api_key=os.getenv("OPENAI_API_KEY"),
         base_url=os.getenv("OPENAI_API_BASE"),
     )
-    result = llm.invoke(formatted_prompt)
+    result = _call_hedged(
+        configurable, reasoning_model, partial(stream_chat, llm, messages, "finalize_answer")
+    )
 
     # Replace the short urls with the original urls and add all used urls to the sources_gathered
     unique_sources = []
@@ -463,6 +901,65 @@ def finalize_answer(state: OverallState, config: RunnableConfig):
     }
 
 
+def _conversation_context(state: OverallState, configurable: Configuration) -> str:
+    """Earlier turns of the thread formatted for the query and answer prompts."""
+    context = conversation_context(state["messages"], configurable.history_context_max_chars)
+    return conversation_context_block.format(context=context) if context else ""
+
+
+def compact_history(
+    state: OverallState, config: RunnableConfig, *, store: Optional[BaseStore] = None
+) -> OverallState:
+    """LangGraph node that bounds the message history of the thread.
+
+    Keeps the last ``history_max_turns`` turns and folds older ones into a
+    summary message; the full text of removed messages goes to the store
+    when the graph runs with one.
+
+    Args:
+        state: Current graph state containing the messages of the thread
+        config: Configuration for the runnable, including the thread id
+        store: Store provided by the LangGraph runtime, if any
+
+    Returns:
+        Dictionary with state update replacing the messages and clearing the
+        run deadline
+    """
+    configurable = Configuration.from_runnable_config(config)
+
+    def summarize(previous: str, turns: str) -> str:
+        llm = ChatOpenAI(
+            model=configurable.query_generator_model,
+            temperature=0,
+            max_retries=2,
+            timeout=node_timeout(configurable.node_timeout_seconds, None),
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_API_BASE"),
+        )
+        messages = build_messages(
+            history_summary_instructions,
+            history_summary_input,
+            summary=previous or "(none)",
+            turns=turns,
+        )
+        try:
+            return invoke_chat(llm, messages, "compact_history").content
+        except Exception as e:
+            # The answer is already written; a failed summary must not fail the run
+            logger.warning("history summary failed, keeping the questions only: %s", e)
+            return fallback_summary(previous, turns)
+
+    update = compact_messages(
+        state["messages"],
+        configurable.history_max_turns,
+        summarize,
+        store=store,
+        thread_id=(config.get("configurable") or {}).get("thread_id"),
+    )
+    # The deadline belonged to this run; the next turn gets its own
+    return {"messages": update, "deadline": None} if update else {"deadline": None}
+
+
 def route_by_task_type(state: OverallState):
     """LangGraph routing function that determines whether to perform web research or data analysis.
 
@@ -481,17 +978,24 @@ def route_by_task_type(state: OverallState):
         return "generate_query"
 
 
+def _node(name: str, fn, **trace_options):
+    """Wrap a node function: always traced, profiled when profile_nodes is on."""
+    return traced(name, profiled(name, fn), **trace_options)
+
+
 # Create our Agent Graph
 builder = StateGraph(OverallState, config_schema=Configuration)
 
 # Define the nodes we will cycle between
-builder.add_node("determine_task_type", determine_task_type)
-builder.add_node("generate_query", generate_query)
-builder.add_node("generate_data_analysis_query", generate_data_analysis_query)
-builder.add_node("web_research", web_research)
-builder.add_node("data_analysis", data_analysis)
-builder.add_node("reflection", reflection)
-builder.add_node("finalize_answer", finalize_answer)
+builder.add_node("determine_task_type", _node("determine_task_type", determine_task_type, opens_run=True))
+builder.add_node("generate_query", _node("generate_query", generate_query))
+builder.add_node("generate_data_analysis_query", _node("generate_data_analysis_query", generate_data_analysis_query))
+builder.add_node("web_research", _node("web_research", web_research))
+builder.add_node("data_analysis", _node("data_analysis", data_analysis))
+builder.add_node("reflection", _node("reflection", reflection))
+builder.add_node("pipelined_research", _node("pipelined_research", pipelined_research))
+builder.add_node("finalize_answer", _node("finalize_answer", finalize_answer))
+builder.add_node("compact_history", _node("compact_history", compact_history, closes_run=True))
 
 # Set the entrypoint as `determine_task_type`
 builder.add_edge(START, "determine_task_type")
@@ -503,24 +1007,28 @@ builder.add_conditional_edges(
 
 # Add conditional edge to continue with search queries in a parallel branch
 builder.add_conditional_edges(
-    "generate_query", continue_to_web_research, ["web_research"]
+    "generate_query", continue_to_web_research, ["web_research", "pipelined_research"]
 )
 
 # Add conditional edge to continue with data analysis queries in a parallel branch
 builder.add_conditional_edges(
-    "generate_data_analysis_query", continue_to_data_analysis, ["data_analysis"]
+    "generate_data_analysis_query",
+    continue_to_data_analysis,
+    ["data_analysis", "pipelined_research"],
 )
 
 # Reflect on the research results (both web research and data analysis)
 builder.add_edge("web_research", "reflection")
 builder.add_edge("data_analysis", "reflection")
+builder.add_edge("pipelined_research", "finalize_answer")
 
 # Evaluate the research
 builder.add_conditional_edges(
     "reflection", evaluate_research, ["web_research", "data_analysis", "finalize_answer"]
 )
 
-# Finalize the answer
-builder.add_edge("finalize_answer", END)
+# Finalize the answer, then bound the history the thread carries to its next turn
+builder.add_edge("finalize_answer", "compact_history")
+builder.add_edge("compact_history", END)
 
 graph = builder.compile(name="pro-search-agent")
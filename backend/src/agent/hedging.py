@@ -0,0 +1,306 @@
+"""Hedged LLM requests to cut tail latency.
+
+A hedged call starts the request and, if no output has arrived after a delay
+taken from a latency percentile of the model, starts an identical second
+request. The first attempt to produce output wins and the other attempt is
+cancelled. Calls are streamed, so "output" is the first token: a stalled
+request is one that has not started answering.
+
+Only idempotent temperature-0 calls should be hedged. A budget caps the extra
+load: every call deposits ``budget_ratio`` tokens (up to a small burst) and
+every hedge spends one, so at most about ``budget_ratio`` of the calls are
+hedged over time.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+from agent.profiling import run_in_context
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Latency samples kept per model.
+_WINDOW = 200
+# Calls are not hedged before a model has this many samples.
+_MIN_SAMPLES = 20
+# Maximum number of unspent hedge tokens.
+_BUDGET_BURST = 5.0
+
+
+class HedgeCancelled(Exception):
+    """Raised inside an attempt that lost the race."""
+
+
+class LatencyTracker:
+    """Sliding window of time-to-first-output samples per model."""
+
+    def __init__(self, window: int = _WINDOW, min_samples: int = _MIN_SAMPLES):
+        """Keep the last ``window`` samples; percentiles need ``min_samples``."""
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float) -> None:
+        """Add a time-to-first-output sample of ``model``."""
+        with self._lock:
+            self._samples[model].append(seconds)
+
+    def percentile(self, model: str, q: float) -> Optional[float]:
+        """Return the ``q``-th percentile, or None without enough samples."""
+        with self._lock:
+            samples = sorted(self._samples[model])
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))
+        return samples[index]
+
+
+class HedgeBudget:
+    """Token bucket limiting hedges to a fraction of all calls."""
+
+    def __init__(self, burst: float = _BUDGET_BURST):
+        """Create a full bucket holding at most ``burst`` hedges."""
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def deposit(self, ratio: float) -> None:
+        """Add ``ratio`` of a hedge for a call, up to the burst size."""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + ratio)
+
+    def try_spend(self) -> bool:
+        """Take one hedge from the bucket; False if it is empty."""
+        with self._lock:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+
+class Attempt:
+    """One of the racing requests of a hedged call.
+
+    The attempt calls :meth:`claim` when it produces its first output and
+    stops when the claim fails or :attr:`cancelled` becomes true. Callbacks
+    registered with :meth:`on_cancel` run when the attempt is cancelled, for
+    example to close its response stream.
+    """
+
+    def __init__(self, race: "_Race", index: int):
+        """Create attempt number ``index`` of ``race``."""
+        self.index = index
+        self._race = race
+        self._cancelled = threading.Event()
+        self._callbacks: List[Callable[[], Any]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the attempt has lost the race or the call was cancelled."""
+        return self._cancelled.is_set()
+
+    def claim(self) -> bool:
+        """Claim the race; False if another attempt produced output first."""
+        return self._race.claim(self)
+
+    def on_cancel(self, callback: Callable[[], Any]) -> None:
+        """Run ``callback`` on cancellation, or right away if already cancelled."""
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self) -> None:
+        """Cancel the attempt and run its callbacks once."""
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:  # the loser's connection may already be broken
+                logger.debug("hedge cancel callback failed: %s", e)
+
+
+class _Race:
+    def __init__(self, tracker: LatencyTracker, model: str):
+        self.tracker = tracker
+        self.model = model
+        self.start = time.perf_counter()
+        self.attempts: List[Attempt] = []
+        self.winner: Optional[Attempt] = None
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    def add(self, attempt: Attempt) -> None:
+        with self._lock:
+            self.attempts.append(attempt)
+            lost = self.cancelled or self.winner is not None
+        if lost:
+            attempt.cancel()
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            attempts = list(self.attempts)
+        for attempt in attempts:
+            attempt.cancel()
+
+    def claim(self, attempt: Attempt) -> bool:
+        with self._lock:
+            if self.cancelled:
+                return False
+            if self.winner is not None:
+                return self.winner is attempt
+            self.winner = attempt
+            others = [a for a in self.attempts if a is not attempt]
+        self.tracker.record(self.model, time.perf_counter() - self.start)
+        for other in others:
+            other.cancel()
+        return True
+
+
+class HedgeStats:
+    """Hedging counters per model."""
+
+    def __init__(self):
+        """Create empty counters."""
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"calls": 0, "hedged": 0, "hedge_wins": 0, "budget_denied": 0}
+        )
+        self._lock = threading.Lock()
+
+    def incr(self, model: str, key: str) -> None:
+        """Increment counter ``key`` of ``model``."""
+        with self._lock:
+            self._stats[model][key] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return a copy of the counters with the hedge rate per model."""
+        with self._lock:
+            report = {}
+            for model, stats in self._stats.items():
+                entry: Dict[str, Any] = dict(stats)
+                entry["hedge_rate"] = stats["hedged"] / stats["calls"] if stats["calls"] else 0.0
+                report[model] = entry
+            return report
+
+
+class Hedger:
+    """Run calls as hedged requests."""
+
+    def __init__(self):
+        """Create a hedger with its own latency samples, budget and counters."""
+        self.tracker = LatencyTracker()
+        self.budget = HedgeBudget()
+        self.stats = HedgeStats()
+
+    def call(
+        self,
+        model: str,
+        fn: Callable[..., T],
+        percentile: float = 95.0,
+        min_delay: float = 1.0,
+        budget_ratio: float = 0.1,
+        scope: Optional[Any] = None,
+    ) -> T:
+        """Call ``fn(attempt=...)`` and hedge it if it is slow to answer.
+
+        Args:
+            model: Model name; delays come from this model's latency percentile.
+            fn: The call. It receives the :class:`Attempt` as ``attempt``.
+            percentile: Latency percentile used as the hedge delay.
+            min_delay: Lower bound of the hedge delay in seconds.
+            budget_ratio: Hedge tokens deposited per call.
+            scope: Optional cancellation scope of the caller; cancelling it
+                cancels every attempt.
+
+        Returns:
+            The result of the winning attempt.
+
+        Raises:
+            Exception: The error of the first attempt if all attempts failed.
+        """
+        self.stats.incr(model, "calls")
+        self.budget.deposit(budget_ratio)
+        race = _Race(self.tracker, model)
+        if scope is not None:
+            scope.on_cancel(race.cancel)
+        futures: Dict[Future, Attempt] = {}
+        # The primary keeps the caller's context so its tokens reach the
+        # graph's message stream; the hedge runs without it so the duplicate
+        # request does not stream tokens to the client.
+        future, attempt = self._start(race, fn, contextvars.copy_context())
+        futures[future] = attempt
+
+        delay = self.tracker.percentile(model, percentile)
+        if delay is not None:
+            done, _ = wait(futures, timeout=max(delay, min_delay))
+            if not done and race.winner is None:
+                if self.budget.try_spend():
+                    self.stats.incr(model, "hedged")
+                    logger.info("hedging %s call after %.2fs", model, max(delay, min_delay))
+                    future, attempt = self._start(race, fn, contextvars.Context())
+                    futures[future] = attempt
+                else:
+                    self.stats.incr(model, "budget_denied")
+
+        errors: List[BaseException] = []
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if isinstance(error, HedgeCancelled):
+                    continue
+                if error is not None:
+                    if futures[future] is not race.winner:
+                        errors.append(error)
+                        continue
+                    raise error
+                attempt = futures[future]
+                # Calls that never claimed (no output) win by completing
+                if not attempt.claim():
+                    continue
+                if attempt.index > 0:
+                    self.stats.incr(model, "hedge_wins")
+                return future.result()
+        raise errors[0] if errors else HedgeCancelled()
+
+    def _start(
+        self, race: _Race, fn: Callable[..., T], context: contextvars.Context
+    ) -> Tuple[Future, Attempt]:
+        attempt = Attempt(race, len(race.attempts))
+        race.add(attempt)
+        future: Future = Future()
+
+        def run():
+            try:
+                future.set_result(run_in_context(context, fn, attempt=attempt))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name=f"hedge-{race.model}-{attempt.index}", daemon=True).start()
+        return future, attempt
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Return hedging counters and current hedge delays per model."""
+        report = self.stats.snapshot()
+        for model, entry in report.items():
+            entry["p50_seconds"] = self.tracker.percentile(model, 50)
+            entry["p95_seconds"] = self.tracker.percentile(model, 95)
+        return report
+
+
+hedger = Hedger()
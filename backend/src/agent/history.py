@@ -0,0 +1,143 @@
+"""Bounded message history for multi-turn threads.
+
+``messages`` is reduced with ``add_messages``, so without a policy a thread
+keeps every question and multi-kilobyte answer forever and re-serializes
+them on every checkpoint, although the nodes only act on the latest
+question.
+
+After each answer the ``compact_history`` node keeps the last ``max_turns``
+turns (a question and the messages answering it) verbatim and folds older
+turns into one summary message: a ``SystemMessage`` with a fixed id at the
+start of the history that is updated incrementally. When the graph runs
+with a LangGraph store, the full text of the removed messages is written to
+it under ``("history", <thread_id>)``, keyed by message id.
+
+The policy is off by default (``history_max_turns`` 0): the removed
+messages also disappear from the thread that chat clients render, so it is
+meant for deployments whose clients keep their own display history.
+"""
+
+from typing import Any, Callable, List, Optional
+
+from langchain_core.messages import BaseMessage, RemoveMessage, SystemMessage
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+SUMMARY_MESSAGE_ID = "history-summary"
+STORE_NAMESPACE = "history"
+
+# Answers quoted in the prompt context are cut to this many characters.
+_ANSWER_PREVIEW_CHARS = 500
+
+
+def is_summary(message: BaseMessage) -> bool:
+    """Return True for the message holding the summary of folded turns."""
+    return message.id == SUMMARY_MESSAGE_ID
+
+
+def message_text(message: BaseMessage) -> str:
+    """Return the text of a message whose content may be a list of parts."""
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(
+        part if isinstance(part, str) else part.get("text", "") for part in message.content
+    )
+
+
+def split_turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    """Group messages into turns, each starting with a human message.
+
+    The summary message is not part of any turn.
+    """
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if is_summary(message):
+            continue
+        if message.type == "human" or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def format_turns(turns: List[List[BaseMessage]], answer_chars: Optional[int] = None) -> str:
+    """Render turns as ``User:``/``Assistant:`` lines, optionally cutting answers."""
+    lines = []
+    for turn in turns:
+        for message in turn:
+            text = message_text(message).strip()
+            if message.type == "human":
+                lines.append(f"User: {text}")
+                continue
+            if answer_chars is not None and len(text) > answer_chars:
+                text = text[:answer_chars].rstrip() + " ..."
+            lines.append(f"Assistant: {text}")
+    return "\n".join(lines)
+
+
+def compact_history(
+    messages: List[BaseMessage],
+    max_turns: int,
+    summarize: Callable[[str, str], str],
+    store: Optional[Any] = None,
+    thread_id: Optional[str] = None,
+) -> Optional[List[BaseMessage]]:
+    """Return the ``messages`` update that bounds the history, if one is needed.
+
+    Args:
+        messages: The current messages of the thread.
+        max_turns: Number of most recent turns kept verbatim; 0 keeps all.
+        summarize: Called with the previous summary and the removed turns,
+            returns the new summary.
+        store: Optional LangGraph store receiving the removed messages.
+        thread_id: Thread the removed messages are stored under.
+
+    Returns:
+        ``None`` if the history is within bounds, otherwise an update that
+        replaces the history with the summary followed by the kept turns.
+    """
+    if max_turns <= 0:
+        return None
+    turns = split_turns(messages)
+    if len(turns) <= max_turns:
+        return None
+    evicted, kept = turns[:-max_turns], turns[-max_turns:]
+
+    if store is not None and thread_id:
+        for turn in evicted:
+            for message in turn:
+                store.put(
+                    (STORE_NAMESPACE, thread_id),
+                    message.id,
+                    {"type": message.type, "content": message_text(message)},
+                )
+
+    previous = next((message_text(m) for m in messages if is_summary(m)), "")
+    summary = summarize(previous, format_turns(evicted))
+    return [
+        RemoveMessage(id=REMOVE_ALL_MESSAGES),
+        SystemMessage(content=summary, id=SUMMARY_MESSAGE_ID),
+        *(message for turn in kept for message in turn),
+    ]
+
+
+def fallback_summary(previous: str, evicted: str) -> str:
+    """Summary without an LLM: the earlier summary plus the removed questions."""
+    questions = [line for line in evicted.splitlines() if line.startswith("User: ")]
+    return "\n".join(part for part in (previous, *questions) if part)
+
+
+def conversation_context(messages: List[BaseMessage], max_chars: int) -> str:
+    """Return the conversation before the current question for the prompts.
+
+    Consists of the summary of older turns and the kept earlier turns with
+    answers cut short; when longer than ``max_chars`` the most recent part
+    is kept. Empty for the first question of a thread.
+    """
+    if max_chars <= 0 or len(messages) < 2:
+        return ""
+    summary = next((message_text(m) for m in messages if is_summary(m)), "")
+    recent = format_turns(split_turns(messages[:-1]), _ANSWER_PREVIEW_CHARS)
+    text = "\n".join(part for part in (summary, recent) if part)
+    if len(text) > max_chars:
+        text = "..." + text[-max_chars:]
+    return text
@@ -0,0 +1,144 @@
+"""Helpers that make LLM calls from graph nodes and record their usage."""
+
+import time
+from typing import Any, Callable, List, Optional, Type
+
+from langchain_core.messages import AIMessage, BaseMessage
+from openai import DefaultHttpxClient
+from pydantic import BaseModel
+
+from agent.hedging import Attempt, HedgeCancelled
+from agent.tracing import span
+from agent.usage import record_completion_usage, record_message_usage
+
+
+def _model_name(llm: Any) -> str:
+    return getattr(llm, "model_name", None) or getattr(llm, "model", "unknown")
+
+
+def invoke_structured(
+    llm: Any, schema: Type[BaseModel], messages: List[BaseMessage], node: str
+) -> BaseModel:
+    """Invoke ``llm`` with structured output and record the raw message's usage.
+
+    Raises:
+        Exception: The parsing error if the output does not match ``schema``.
+    """
+    start = time.perf_counter()
+    with span("llm", _model_name(llm), schema=schema.__name__):
+        output = llm.with_structured_output(schema, include_raw=True).invoke(messages)
+    record_message_usage(node, _model_name(llm), output["raw"], time.perf_counter() - start)
+    if output.get("parsing_error") is not None:
+        raise output["parsing_error"]
+    if output.get("parsed") is None:
+        raise ValueError(f"{schema.__name__} output could not be parsed")
+    return output["parsed"]
+
+
+def invoke_chat(llm: Any, messages: List[BaseMessage], node: str) -> AIMessage:
+    """Invoke ``llm`` and record the response's usage."""
+    start = time.perf_counter()
+    with span("llm", _model_name(llm)):
+        result = llm.invoke(messages)
+    record_message_usage(node, _model_name(llm), result, time.perf_counter() - start)
+    return result
+
+
+def stream_chat(
+    llm: Any, messages: List[BaseMessage], node: str, attempt: Optional[Attempt] = None
+) -> AIMessage:
+    """Stream ``llm`` and return the aggregated message with its usage recorded.
+
+    With an ``attempt`` of a hedged call, the first chunk with content claims
+    the race. The attempt streams over a connection of its own, which is
+    closed when the attempt loses the race.
+    """
+    start = time.perf_counter()
+    message = None
+    claimed = attempt is None
+    root_client = None
+    if attempt is not None and getattr(llm, "root_client", None) is not None:
+        # The default HTTP client is shared by all models, so closing it
+        # would cut the winner's connection as well
+        root_client = llm.root_client.with_options(http_client=DefaultHttpxClient())
+        llm = llm.model_copy(
+            update={"root_client": root_client, "client": root_client.chat.completions}
+        )
+        attempt.on_cancel(root_client.close)
+    try:
+        with span("llm", _model_name(llm)):
+            if attempt is not None and attempt.cancelled:
+                raise HedgeCancelled()
+            for chunk in llm.stream(messages, stream_usage=True):
+                if attempt is not None and attempt.cancelled:
+                    raise HedgeCancelled()
+                if not claimed and chunk.content:
+                    if not attempt.claim():
+                        raise HedgeCancelled()
+                    claimed = True
+                message = chunk if message is None else message + chunk
+    except Exception:
+        if attempt is not None and attempt.cancelled:
+            # The read failed because the lost attempt's connection was closed
+            raise HedgeCancelled()
+        raise
+    finally:
+        if root_client is not None:
+            root_client.close()
+    if message is None:
+        return AIMessage(content="")
+    record_message_usage(node, _model_name(llm), message, time.perf_counter() - start)
+    return message
+
+
+def to_openai_messages(messages: List[BaseMessage]) -> List[dict]:
+    """Convert LangChain messages into OpenAI chat completion messages."""
+    roles = {"system": "system", "human": "user", "ai": "assistant"}
+    return [{"role": roles[m.type], "content": m.content} for m in messages]
+
+
+def stream_chat_completion(
+    client: Any,
+    model: str,
+    messages: List[BaseMessage],
+    node: str,
+    on_text: Optional[Callable[[str], None]] = None,
+    attempt: Optional[Attempt] = None,
+    **kwargs,
+) -> str:
+    """Stream an OpenAI chat completion and return its full text.
+
+    ``on_text`` is called with every text delta as it arrives. With an
+    ``attempt`` of a hedged call, the first delta claims the race, and the
+    response stream is closed when the attempt loses it.
+    """
+    start = time.perf_counter()
+    with span("llm", model):
+        if attempt is not None and attempt.cancelled:
+            raise HedgeCancelled()
+        stream = client.chat.completions.create(
+            model=model,
+            messages=to_openai_messages(messages),
+            stream=True,
+            stream_options={"include_usage": True},
+            **kwargs,
+        )
+        if attempt is not None:
+            attempt.on_cancel(stream.close)
+        parts: List[str] = []
+        usage_chunk = None
+        for chunk in stream:
+            if attempt is not None and attempt.cancelled:
+                raise HedgeCancelled()
+            if chunk.usage is not None:
+                usage_chunk = chunk
+            if chunk.choices and chunk.choices[0].delta.content:
+                if not parts and attempt is not None and not attempt.claim():
+                    raise HedgeCancelled()
+                delta = chunk.choices[0].delta.content
+                parts.append(delta)
+                if on_text is not None:
+                    on_text(delta)
+    if usage_chunk is not None:
+        record_completion_usage(node, model, usage_chunk, time.perf_counter() - start)
+    return "".join(parts)
@@ -0,0 +1,584 @@
+"""Partitioned parallel execution of decomposable aggregate queries.
+
+A query of the form::
+
+    SELECT region, SUM(amount), COUNT(*), AVG(amount) AS avg_amount
+    FROM orders [alias] [WHERE ...] [GROUP BY region] [ORDER BY ...] [LIMIT n]
+
+is split into pieces that each aggregate one slice of the table: one leaf
+partition of a partitioned table, or one range of an integer primary key.
+The pieces run concurrently on pooled connections that import the
+coordinating transaction's snapshot (``pg_export_snapshot``), so together
+they read exactly the rows the single query would. Their partial aggregates
+are merged with pandas: SUM and COUNT partials are summed, MIN and MAX
+partials reduced, and AVG is rebuilt from a partial SUM and COUNT.
+
+Only SUM, COUNT, MIN, MAX and AVG over a single table qualify. Queries with
+joins, subqueries, DISTINCT, HAVING, window functions, grouping sets or
+other aggregates run as one query.
+
+The partial rows of all pieces together are held to the executor's row and
+byte caps while they are fetched. A grouping with more groups than the
+planner expected exceeds them; the pieces are then cancelled and the query
+runs as one streamed query instead.
+"""
+
+import contextvars
+import logging
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+from psycopg2.extensions import ISOLATION_LEVEL_REPEATABLE_READ
+
+from agent.profiling import run_in_context
+from agent.sql_executor import QueryResult, SQLExecutionError, _row_size, append_capped
+from agent.sql_guard import SQLGuard
+from agent.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# String literals and quoted identifiers are masked before the query is split
+_QUOTED = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+_MASK = re.compile(r"\x00(\d+)\x00")
+_CLAUSE = re.compile(
+    r"\b(SELECT|FROM|WHERE|GROUP\s+BY|HAVING|WINDOW|ORDER\s+BY|LIMIT|OFFSET|FETCH|"
+    r"UNION|INTERSECT|EXCEPT|FOR)\b",
+    re.IGNORECASE,
+)
+_CLAUSE_ORDER = ["select", "from", "where", "group by", "order by", "limit"]
+_AGGREGATE = re.compile(r"^(SUM|COUNT|MIN|MAX|AVG)\s*\((.*)\)$", re.IGNORECASE | re.DOTALL)
+_NAME = r"(?:[A-Za-z_][\w$]*|\x00\d+\x00)"
+_IDENTIFIER = re.compile(rf"^(?:{_NAME}\s*\.\s*)*({_NAME})$")
+_ALIAS = re.compile(rf"^(.*?[\w)\x00])(?:\s+AS)?\s+({_NAME})$", re.IGNORECASE | re.DOTALL)
+_TABLE = re.compile(rf"^((?:{_NAME}\.)?({_NAME}))(?:\s+(?:AS\s+)?({_NAME}))?$", re.IGNORECASE)
+_ORDER_ITEM = re.compile(
+    r"^(.*?)(?:\s+(ASC|DESC))?(?:\s+NULLS\s+(FIRST|LAST))?$", re.IGNORECASE | re.DOTALL
+)
+# Words a trailing "alias" can not be
+_RESERVED = {"end", "and", "or", "not", "null", "then", "else", "asc", "desc", "is", "true", "false"}
+
+# Partial aggregates and how their pieces are merged
+_PARTIALS = {"sum": [("sum", "sum")], "count": [("count", "sum")], "min": [("min", "min")],
+             "max": [("max", "max")], "avg": [("sum", "sum"), ("count", "sum")]}
+
+
+@dataclass
+class OutputColumn:
+    """One column of the query's result."""
+
+    name: str
+    group: Optional[int] = None  # index into the GROUP BY expressions
+    function: Optional[str] = None  # aggregate function, lowercase
+    argument: Optional[str] = None  # aggregate argument, "*" for COUNT(*)
+    partials: List[str] = field(default_factory=list)  # partial column names
+
+
+@dataclass
+class AggregatePlan:
+    """A decomposable aggregate query and the slices it runs over."""
+
+    sql: str
+    table: str
+    qualifier: str
+    where: Optional[str]
+    groups: List[str]
+    columns: List[OutputColumn]
+    partials: List[Tuple[str, str, str]]  # (name, SQL expression, merge reducer)
+    order: List[Tuple[int, bool, Optional[bool]]]  # (column, descending, nulls first)
+    limit: Optional[int]
+    slices: List[Tuple[str, Optional[str]]] = field(default_factory=list)  # (source, condition)
+
+    def piece_sql(self, source: str, condition: Optional[str]) -> str:
+        """Return the partial aggregate query over one slice."""
+        items = [f"{expr} AS g{i}" for i, expr in enumerate(self.groups)]
+        items += [f"{expr} AS {name}" for name, expr, _ in self.partials]
+        filters = [f"({f})" for f in (self.where, condition) if f]
+        sql = f"SELECT {', '.join(items)} FROM {source} AS {self.qualifier}"
+        if filters:
+            sql += f" WHERE {' AND '.join(filters)}"
+        if self.groups:
+            sql += f" GROUP BY {', '.join(self.groups)}"
+        return sql
+
+    def merge(self, pieces: Sequence[Sequence[tuple]]) -> List[tuple]:
+        """Merge the rows of every piece into the rows of the original query."""
+        group_names = [f"g{i}" for i in range(len(self.groups))]
+        partial_names = [name for name, _, _ in self.partials]
+        # Object columns keep the database's types (int, Decimal) exact
+        frame = pd.DataFrame(
+            [row for rows in pieces for row in rows], columns=group_names + partial_names, dtype=object
+        )
+        reducers: Dict[str, List[str]] = {}
+        for name, _, reducer in self.partials:
+            reducers.setdefault(reducer, []).append(name)
+
+        if group_names:
+            grouped = frame.groupby(group_names, dropna=False, sort=False)
+            parts = []
+            for reducer, names in reducers.items():
+                if reducer == "sum":
+                    parts.append(grouped[names].sum(min_count=1))
+                else:
+                    parts.append(getattr(grouped[names], reducer)())
+            merged = pd.concat(parts, axis=1).reset_index()
+        else:
+            # Every piece of an aggregate without GROUP BY returns one row
+            values = {}
+            for reducer, names in reducers.items():
+                for name in names:
+                    column = frame[name].dropna()
+                    values[name] = getattr(column, reducer)() if len(column) else None
+            merged = pd.DataFrame([values], dtype=object)
+
+        merged = merged.astype(object).where(merged.notna(), None)
+        output = []
+        for column in self.columns:
+            if column.group is not None:
+                output.append(merged[f"g{column.group}"].tolist())
+            elif column.function == "avg":
+                totals, counts = (merged[name].tolist() for name in column.partials)
+                output.append([_average(t, c) for t, c in zip(totals, counts)])
+            else:
+                values = merged[column.partials[0]].tolist()
+                if column.function == "count":
+                    values = [0 if v is None else v for v in values]
+                output.append(values)
+        rows = list(zip(*output)) if output else []
+        return self.apply_order(rows)
+
+    def apply_order(self, rows: List[tuple]) -> List[tuple]:
+        """Apply the query's ORDER BY and LIMIT to merged ``rows``."""
+        # Stable sorts from the last key to the first; NULLs sort as PostgreSQL does
+        for index, descending, nulls_first in reversed(self.order):
+            flip = nulls_first is not None and nulls_first != descending
+            rows.sort(
+                key=lambda row: ((row[index] is None) != flip, 0 if row[index] is None else row[index]),
+                reverse=descending,
+            )
+        return rows if self.limit is None else rows[: self.limit]
+
+
+def _average(total: Any, count: Any) -> Any:
+    if total is None or not count:
+        return None
+    # PostgreSQL returns numeric for the average of integers
+    if isinstance(total, int):
+        total = Decimal(total)
+    return total / count
+
+
+def _normalize(expression: str) -> str:
+    return " ".join(expression.split()).lower()
+
+
+def _balanced(text: str) -> bool:
+    depth = 0
+    for char in text:
+        depth += {"(": 1, ")": -1}.get(char, 0)
+        if depth < 0:
+            return False
+    return depth == 0
+
+
+def _split_top_level(text: str, separator: str = ",") -> List[str]:
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(text[start:i].strip())
+            start = i + 1
+    parts.append(text[start:].strip())
+    return parts
+
+
+def _clauses(masked: str) -> Optional[Dict[str, str]]:
+    """Split a masked query into its top-level clauses, in the supported order."""
+    depth_at, depth = [], 0
+    for char in masked:
+        depth_at.append(depth)
+        depth += {"(": 1, ")": -1}.get(char, 0)
+    matches = [m for m in _CLAUSE.finditer(masked) if depth_at[m.start()] == 0]
+    if not matches or matches[0].start() != 0:
+        return None
+    clauses: Dict[str, str] = {}
+    for match, following in zip(matches, matches[1:] + [None]):
+        name = " ".join(match.group(1).lower().split())
+        if name not in _CLAUSE_ORDER or name in clauses:
+            return None
+        clauses[name] = masked[match.end(): following.start() if following else len(masked)].strip()
+    order = [name for name in _CLAUSE_ORDER if name in clauses]
+    if list(clauses) != order or "from" not in clauses:
+        return None
+    return clauses
+
+
+def decompose(sql: str) -> Optional[AggregatePlan]:
+    """Return the plan of ``sql`` if it is a decomposable aggregate, else None.
+
+    The plan has no slices yet; ``ParallelAggregator.plan`` adds them.
+    """
+    literals: List[str] = []
+
+    def mask(match: re.Match) -> str:
+        if match.group(0) not in literals:
+            literals.append(match.group(0))
+        return f"\x00{literals.index(match.group(0))}\x00"
+
+    def unmask(text: str) -> str:
+        return _MASK.sub(lambda m: literals[int(m.group(1))], text)
+
+    masked = _QUOTED.sub(mask, sql.strip().rstrip(";"))
+    if len(re.findall(r"\bSELECT\b", masked, re.IGNORECASE)) != 1 or re.search(r"\bOVER\b", masked, re.IGNORECASE):
+        return None
+    clauses = _clauses(masked)
+    if clauses is None or re.match(r"(DISTINCT|ALL)\b", clauses["select"], re.IGNORECASE):
+        return None
+
+    table = _TABLE.match(clauses["from"])
+    if table is None or re.search(r"\b(JOIN|ON|USING)\b", clauses["from"], re.IGNORECASE):
+        return None
+    qualifier = table.group(3) or table.group(2)
+
+    items = _split_top_level(clauses["select"])
+    groups = _split_top_level(clauses["group by"]) if "group by" in clauses else []
+    if any(re.search(r"\b(ROLLUP|CUBE|GROUPING)\b", g, re.IGNORECASE) for g in groups):
+        return None
+
+    expressions, columns, partials = [], [], []
+    for item in items:
+        alias = _ALIAS.match(item)
+        if alias and alias.group(2).lower() not in _RESERVED and not _IDENTIFIER.match(item):
+            expression, name = alias.group(1).strip(), alias.group(2)
+        else:
+            expression, name = item, None
+        expressions.append(expression)
+        aggregate = _AGGREGATE.match(expression)
+        if aggregate and _balanced(aggregate.group(2)):
+            function, argument = aggregate.group(1).lower(), aggregate.group(2).strip()
+            if not argument or re.match(r"(DISTINCT|ALL)\b", argument, re.IGNORECASE) or re.search(
+                r"\bORDER\s+BY\b", argument, re.IGNORECASE
+            ):
+                return None
+            if argument == "*" and function != "count":
+                return None
+            column = OutputColumn(name=name or function, function=function, argument=argument)
+            for partial_function, reducer in _PARTIALS[function]:
+                partial = f"p{len(partials)}"
+                partials.append((partial, f"{partial_function.upper()}({argument})", reducer))
+                column.partials.append(partial)
+            columns.append(column)
+            continue
+        identifier = _IDENTIFIER.match(expression)
+        call = re.match(r"([A-Za-z_]\w*)\s*\(", expression)
+        derived = identifier.group(1) if identifier else call.group(1) if call else "?column?"
+        columns.append(OutputColumn(name=name or derived))
+        columns[-1].group = -1  # resolved against GROUP BY below
+    if not partials:
+        return None
+
+    # GROUP BY positions and output names refer to select items
+    aliases = {_normalize(c.name): i for i, c in enumerate(columns) if c.group is not None}
+    group_expressions = []
+    for group in groups:
+        if re.fullmatch(r"\d+", group):
+            position = int(group) - 1
+            if not 0 <= position < len(items) or columns[position].group is None:
+                return None
+            group = expressions[position]
+        elif _normalize(group) in aliases and _normalize(group) not in map(_normalize, expressions):
+            group = expressions[aliases[_normalize(group)]]
+        group_expressions.append(group)
+    normalized_groups = [_normalize(g) for g in group_expressions]
+    for column, expression in zip(columns, expressions):
+        if column.group is None:
+            continue
+        if _normalize(expression) not in normalized_groups:
+            return None
+        column.group = normalized_groups.index(_normalize(expression))
+
+    order = []
+    if "order by" in clauses:
+        names = [_normalize(c.name) for c in columns]
+        for item in _split_top_level(clauses["order by"]):
+            parsed = _ORDER_ITEM.match(item)
+            reference = _normalize(parsed.group(1))
+            if re.fullmatch(r"\d+", reference):
+                index = int(reference) - 1
+            elif reference in names:
+                index = names.index(reference)
+            elif reference in [_normalize(e) for e in expressions]:
+                index = [_normalize(e) for e in expressions].index(reference)
+            else:
+                return None
+            if not 0 <= index < len(columns):
+                return None
+            descending = (parsed.group(2) or "").upper() == "DESC"
+            nulls = parsed.group(3)
+            order.append((index, descending, None if nulls is None else nulls.upper() == "FIRST"))
+
+    limit = None
+    if "limit" in clauses:
+        if re.fullmatch(r"\d+", clauses["limit"]):
+            limit = int(clauses["limit"])
+        elif clauses["limit"].upper() != "ALL":
+            return None
+
+    for column in columns:
+        if column.argument is not None:
+            column.argument = unmask(column.argument)
+        column.name = unmask(column.name)
+        if column.name.startswith('"'):
+            column.name = column.name[1:-1].replace('""', '"')
+        elif column.name != "?column?":
+            column.name = column.name.lower()
+    return AggregatePlan(
+        sql=sql,
+        table=unmask(table.group(1)),
+        qualifier=unmask(qualifier),
+        where=unmask(clauses["where"]) if "where" in clauses else None,
+        groups=[unmask(g) for g in group_expressions],
+        columns=columns,
+        partials=[(name, unmask(expr), reducer) for name, expr, reducer in partials],
+        order=order,
+        limit=limit,
+    )
+
+
+class _OverBudget(Exception):
+    """Raised in a piece once the pieces together hold more than the caps."""
+
+
+class _PieceBudget:
+    """Rows and bytes the pieces of one query may hold in memory together."""
+
+    def __init__(self, max_rows: int, max_bytes: int):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.rows = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def take(self, rows: Sequence[Sequence[Any]]) -> None:
+        """Count ``rows`` against the caps; raise ``_OverBudget`` past them."""
+        size = sum(_row_size(row) for row in rows)
+        with self.lock:
+            self.rows += len(rows)
+            self.bytes += size
+            if self.rows > self.max_rows or self.bytes > self.max_bytes:
+                raise _OverBudget()
+
+
+def _quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class ParallelAggregator:
+    """Run decomposable aggregate queries as concurrent pieces over table slices.
+
+    Args:
+        pool: A psycopg2 connection pool with room for ``max_workers`` connections.
+        max_workers: Pieces run at the same time, across all queries.
+        min_cost: Queries with a lower planner estimate run as one query.
+        pieces_per_worker: Primary-key ranges per worker, to even out skew.
+        statement_timeout_ms: Per-piece statement timeout; 0 disables it.
+    """
+
+    def __init__(
+        self,
+        pool: Any,
+        max_workers: int,
+        min_cost: float,
+        pieces_per_worker: int = 2,
+        statement_timeout_ms: int = 0,
+    ):
+        """Create the aggregator over connections from ``pool``."""
+        self.pool = pool
+        self.max_workers = max_workers
+        self.min_cost = min_cost
+        self.pieces_per_worker = pieces_per_worker
+        self.statement_timeout_ms = statement_timeout_ms
+        # The pool raises instead of waiting when it is exhausted
+        self._slots = threading.BoundedSemaphore(max_workers)
+
+    def plan(self, cursor: Any, sql: str, estimated_cost: Optional[float]) -> Optional[AggregatePlan]:
+        """Return the plan to run ``sql`` in parallel, or None to run it as one query.
+
+        ``cursor`` belongs to the coordinating read-only transaction; the
+        slices are read in it, under a savepoint so a failure leaves the
+        transaction usable for the single query.
+        """
+        plan = decompose(sql)
+        if plan is None:
+            return None
+        cursor.execute("SAVEPOINT parallel_plan")
+        try:
+            if estimated_cost is None:
+                estimated_cost = SQLGuard.explain(cursor, sql).total_cost
+            if estimated_cost < self.min_cost:
+                return None
+            plan.slices = self._partition_slices(cursor, plan) or self._range_slices(cursor, plan)
+        except Exception as e:
+            logger.warning("parallel aggregate planning failed, running one query: %s", e)
+            cursor.execute("ROLLBACK TO SAVEPOINT parallel_plan")
+            return None
+        cursor.execute("RELEASE SAVEPOINT parallel_plan")
+        return plan if len(plan.slices) > 1 else None
+
+    def _partition_slices(self, cursor: Any, plan: AggregatePlan) -> List[Tuple[str, Optional[str]]]:
+        cursor.execute(
+            "SELECT relid::regclass::text FROM pg_partition_tree(%s::regclass) WHERE isleaf AND level > 0",
+            (plan.table,),
+        )
+        return [(row[0], None) for row in cursor.fetchall()]
+
+    def _range_slices(self, cursor: Any, plan: AggregatePlan) -> List[Tuple[str, Optional[str]]]:
+        cursor.execute(
+            "SELECT a.attname FROM pg_index i "
+            "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey) "
+            "WHERE i.indrelid = %s::regclass AND i.indisprimary "
+            "AND a.atttypid IN ('int2'::regtype, 'int4'::regtype, 'int8'::regtype)",
+            (plan.table,),
+        )
+        keys = cursor.fetchall()
+        if len(keys) != 1:
+            return []
+        column = f"{plan.qualifier}.{_quote_ident(keys[0][0])}"
+        cursor.execute(f"SELECT min({column}), max({column}) FROM {plan.table} AS {plan.qualifier}")
+        low, high = cursor.fetchone()
+        if low is None:
+            return []
+        count = max(1, min(self.max_workers * self.pieces_per_worker, high - low + 1))
+        step = -(-(high - low + 1) // count)
+        bounds = [low + i * step for i in range(1, count)]
+        conditions = [f"{column} < {bounds[0]}"] if bounds else [None]
+        conditions += [f"{column} >= {a} AND {column} < {b}" for a, b in zip(bounds, bounds[1:])]
+        if bounds:
+            conditions.append(f"{column} >= {bounds[-1]}")
+        return [(plan.table, condition) for condition in conditions]
+
+    def execute(
+        self,
+        cursor: Any,
+        plan: AggregatePlan,
+        result: QueryResult,
+        max_rows: int,
+        max_bytes: int,
+        batch_size: int = 1000,
+    ) -> bool:
+        """Run the pieces of ``plan`` and store the merged rows in ``result``.
+
+        Returns False, leaving ``result`` untouched, if the pieces' partial
+        rows exceed ``max_rows`` or ``max_bytes``; the caller then runs the
+        query as one.
+        """
+        cursor.execute("SELECT pg_export_snapshot()")
+        snapshot = cursor.fetchone()[0]
+        start = time.perf_counter()
+        running: Dict[int, Any] = {}
+        lock = threading.Lock()
+        budget = _PieceBudget(max_rows, max_bytes)
+
+        def run_piece(index: int, source: str, condition: Optional[str]) -> Tuple[List[tuple], float]:
+            with self._slots, span("sql", "partition", slice=condition or source):
+                piece_start = time.perf_counter()
+                rows = self._run_piece(
+                    snapshot, plan.piece_sql(source, condition), index, running, lock, budget, batch_size
+                )
+                return rows, time.perf_counter() - piece_start
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="parallel-sql") as executor:
+            futures = [
+                executor.submit(run_in_context, contextvars.copy_context(), run_piece, i, source, condition)
+                for i, (source, condition) in enumerate(plan.slices)
+            ]
+            done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+            failed = next((f for f in done if f.exception() is not None), None)
+            if failed is not None:
+                for future in pending:
+                    future.cancel()
+                with lock:
+                    for connection in running.values():
+                        connection.cancel()
+                if isinstance(failed.exception(), _OverBudget):
+                    logger.info("parallel aggregate: partial rows exceed the caps, running one query")
+                    return False
+                raise SQLExecutionError(f"Parallel aggregate piece failed: {failed.exception()}")
+
+        outcomes = [future.result() for future in futures]
+        rows = plan.merge([rows for rows, _ in outcomes])
+        result.columns = [column.name for column in plan.columns]
+        append_capped(result, rows, max_rows, max_bytes)
+        result.parallel_pieces = len(futures)
+        elapsed = time.perf_counter() - start
+        piece_seconds = sum(seconds for _, seconds in outcomes)
+        logger.info(
+            "parallel aggregate: pieces=%d workers=%d elapsed=%.3fs piece_seconds=%.3fs "
+            "concurrency=%.1fx",
+            len(futures),
+            self.max_workers,
+            elapsed,
+            piece_seconds,
+            piece_seconds / elapsed if elapsed > 0 else 1.0,
+        )
+        return True
+
+    def _run_piece(
+        self,
+        snapshot: str,
+        sql: str,
+        index: int,
+        running: Dict[int, Any],
+        lock: threading.Lock,
+        budget: _PieceBudget,
+        batch_size: int,
+    ) -> List[tuple]:
+        connection = self.pool.getconn()
+        broken = False
+        with lock:
+            running[index] = connection
+        try:
+            connection.set_session(
+                isolation_level=ISOLATION_LEVEL_REPEATABLE_READ, readonly=True
+            )
+            with connection.cursor() as cursor:
+                # Every piece reads the coordinating transaction's snapshot
+                cursor.execute("SET TRANSACTION SNAPSHOT %s", (snapshot,))
+                if self.statement_timeout_ms:
+                    cursor.execute(
+                        "SELECT set_config('statement_timeout', %s, true)", (str(self.statement_timeout_ms),)
+                    )
+            # A named cursor keeps the piece's rows on the server until fetched
+            with connection.cursor(name=f"piece_{uuid.uuid4().hex}") as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(sql)
+                rows: List[tuple] = []
+                while True:
+                    batch = cursor.fetchmany(batch_size)
+                    if not batch:
+                        return rows
+                    budget.take(batch)
+                    rows.extend(tuple(row) for row in batch)
+        except _OverBudget:
+            raise
+        except Exception:
+            broken = True
+            raise
+        finally:
+            with lock:
+                running.pop(index, None)
+            try:
+                connection.rollback()
+            except Exception:
+                broken = True
+            self.pool.putconn(connection, close=broken)
+
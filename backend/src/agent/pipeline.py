@@ -0,0 +1,149 @@
+"""Pipelined research: a continuous work queue instead of lock-stepped rounds.
+
+In the default graph every ``Send`` branch of a round joins at
+``reflection``, so early results wait for the slowest branch before any
+follow-up query is written. :class:`ResearchPipeline` instead runs queries
+on a worker pool and starts a gap analysis as soon as results arrive. The
+follow-up queries of that analysis are dispatched right away, while the
+rest of the first round is still running.
+
+Gap analyses are serialized: while one runs, newly arriving results are
+collected and analysed together by the next one. Each query has a depth (0
+for the initial queries); follow-ups of an analysis that covered results up
+to depth ``d`` get depth ``d + 1`` and are only dispatched below
+``max_depth``. The pipeline ends when no query or analysis is pending. The
+verdict of the last analysis is the final one.
+"""
+
+import contextvars
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from agent.profiling import run_in_context
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PipelineOutcome:
+    """Merged state updates and the last gap analysis of a pipeline run."""
+
+    updates: Dict[str, list] = field(default_factory=dict)
+    queries: List[str] = field(default_factory=list)
+    follow_ups: List[str] = field(default_factory=list)  # queries dispatched at depth > 0
+    analyses: int = 0
+    max_depth_reached: int = 0
+    is_sufficient: bool = False
+    knowledge_gap: str = ""
+
+
+class ResearchPipeline:
+    """Run research queries and incremental gap analysis concurrently.
+
+    Args:
+        run_query: ``run_query(query, query_id)`` runs one query and returns
+            its state update (lists of values per key).
+        result_texts: Returns the result texts of a state update.
+        analyze: ``analyze(texts)`` runs a gap analysis over all result
+            texts so far and returns an object with ``is_sufficient``,
+            ``knowledge_gap`` and ``follow_up_queries``.
+        max_depth: Follow-ups are dispatched only below this depth.
+        max_workers: Number of queries run at the same time.
+        deadline: Wall-clock time after which nothing new is dispatched.
+    """
+
+    def __init__(
+        self,
+        run_query: Callable[[str, int], Dict[str, list]],
+        result_texts: Callable[[Dict[str, list]], List[str]],
+        analyze: Callable[[List[str]], Any],
+        max_depth: int,
+        max_workers: int = 4,
+        deadline: Optional[float] = None,
+    ):
+        """Create the pipeline; nothing runs until :meth:`run`."""
+        self.run_query = run_query
+        self.result_texts = result_texts
+        self.analyze = analyze
+        self.max_depth = max_depth
+        self.max_workers = max_workers
+        self.deadline = deadline
+
+    def _past_deadline(self) -> bool:
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def run(self, queries: List[str], first_id: int = 0) -> PipelineOutcome:
+        """Run ``queries`` and their follow-ups until no work is left."""
+        outcome = PipelineOutcome()
+        texts: List[Tuple[str, int]] = []
+        analysed = 0
+        seen = set()
+        next_id = first_id
+        pending: Dict[Future, Tuple[str, int]] = {}
+
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers + 1, thread_name_prefix="pipeline"
+        ) as executor:
+
+            def submit(kind: str, depth: int, fn: Callable, *args) -> None:
+                # Each task keeps the node's context for stream writers and callbacks
+                context = contextvars.copy_context()
+                pending[executor.submit(run_in_context, context, fn, *args)] = (kind, depth)
+
+            def dispatch(query: str, depth: int) -> None:
+                nonlocal next_id
+                key = " ".join(query.split()).casefold()
+                if key in seen:
+                    return
+                seen.add(key)
+                outcome.queries.append(query)
+                if depth > 0:
+                    outcome.follow_ups.append(query)
+                outcome.max_depth_reached = max(outcome.max_depth_reached, depth)
+                submit("query", depth, self.run_query, query, next_id)
+                next_id += 1
+
+            for query in queries:
+                dispatch(query, 0)
+
+            analysing = False
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, depth = pending.pop(future)
+                    if kind == "query":
+                        update = future.result()
+                        for key, values in update.items():
+                            outcome.updates.setdefault(key, []).extend(values)
+                        texts.extend((text, depth) for text in self.result_texts(update))
+                        continue
+
+                    analysing = False
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.warning("pipelined gap analysis failed: %s", e)
+                        continue
+                    outcome.analyses += 1
+                    outcome.is_sufficient = result.is_sufficient
+                    outcome.knowledge_gap = result.knowledge_gap
+                    if result.is_sufficient or depth + 1 >= self.max_depth or self._past_deadline():
+                        continue
+                    for query in result.follow_up_queries:
+                        dispatch(query, depth + 1)
+
+                # Analyse everything that arrived since the previous analysis
+                if not analysing and len(texts) > analysed:
+                    analysed = len(texts)
+                    analysing = True
+                    submit(
+                        "analysis",
+                        max(depth for _, depth in texts),
+                        self.analyze,
+                        [text for text, _ in texts],
+                    )
+
+        return outcome
@@ -0,0 +1,266 @@
+"""On-demand sampling profiler for graph nodes.
+
+With ``profile_nodes`` enabled (configurable, ``PROFILE_NODES`` or the
+``X-Profile`` header of the HTTP app), every node call is sampled. A
+background thread records the stack of the node's thread, and of the
+worker threads it starts, every ``profile_interval_ms``. At the end of the
+call the profile is written to
+``<profile_dir>/<run>/<step>-<node>-<id>.{collapsed,speedscope.json}``,
+where ``profile_dir`` comes from the ``PROFILE_DIR`` environment variable
+only and ``<run>`` is the run id (or thread id) of the run:
+
+- collapsed stacks (one ``frame;frame;frame count`` line per stack), for
+  ``flamegraph.pl`` or speedscope;
+- speedscope JSON, which opens directly in https://www.speedscope.app.
+
+Samples include time spent waiting, so network calls show up as the frames
+blocked in the HTTP client, next to parsing and string work. Worker threads
+are attributed to the node when they run through ``run_in_context``; the
+duplicate request of a hedged call deliberately runs without the node's
+context and is not sampled.
+
+When profiling is off, a wrapped node costs one configuration lookup; no
+sampler thread runs.
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import pathlib
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from agent.configuration import Configuration
+
+logger = logging.getLogger(__name__)
+
+_active: contextvars.ContextVar[Optional["NodeProfile"]] = contextvars.ContextVar(
+    "node_profile", default=None
+)
+
+_FALSE = ("", "0", "false", "False", "no")
+
+# Run and thread ids come from the client; they name a directory only if they
+# are a single plain path component
+_RUN_NAME = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]*")
+
+
+class NodeProfile:
+    """Stack samples of one node call and the threads it runs on."""
+
+    def __init__(self, node: str, interval: float):
+        """Profile a call of ``node`` sampled every ``interval`` seconds."""
+        self.node = node
+        self.interval = interval
+        self.threads: Dict[int, int] = {}  # thread id -> registrations
+        self.samples: Counter = Counter()  # stack (root first) -> count
+        self.stopped = False
+        self.lock = threading.Lock()
+
+    def add_thread(self, thread_id: int) -> None:
+        """Start sampling ``thread_id`` for this node call."""
+        with self.lock:
+            self.threads[thread_id] = self.threads.get(thread_id, 0) + 1
+
+    def remove_thread(self, thread_id: int) -> None:
+        """Stop sampling ``thread_id`` once all its registrations are removed."""
+        with self.lock:
+            count = self.threads.get(thread_id, 0) - 1
+            if count > 0:
+                self.threads[thread_id] = count
+            else:
+                self.threads.pop(thread_id, None)
+
+    def to_collapsed(self) -> str:
+        """Return the samples in collapsed-stack format for flame graph tools."""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.samples.most_common())
+
+    def to_speedscope(self, name: str) -> Dict[str, Any]:
+        """Return the samples as a speedscope profile titled ``name``."""
+        frames: List[Dict[str, Any]] = []
+        index: Dict[str, int] = {}
+        samples, weights = [], []
+        for stack, count in self.samples.items():
+            indices = []
+            for label in stack:
+                if label not in index:
+                    index[label] = len(frames)
+                    function, _, location = label.partition(" (")
+                    file, _, line = location.rstrip(")").rpartition(":")
+                    frames.append({"name": function, "file": file, "line": int(line or 0)})
+                indices.append(index[label])
+            samples.append(indices)
+            weights.append(count * self.interval * 1000)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "agent.profiling",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": self.node,
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+        }
+
+
+class _Sampler:
+    """One background thread sampling the threads of all active profiles."""
+
+    def __init__(self):
+        self._profiles: List[NodeProfile] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._labels: Dict[Any, str] = {}
+
+    def start(self, profile: NodeProfile) -> None:
+        with self._lock:
+            self._profiles.append(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="node-profiler", daemon=True)
+                self._thread.start()
+
+    def stop(self, profile: NodeProfile) -> None:
+        with self._lock:
+            self._profiles.remove(profile)
+        # A sampling pass in progress must not add to a finished profile
+        with profile.lock:
+            profile.stopped = True
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            path = pathlib.Path(code.co_filename)
+            label = f"{code.co_name} ({path.parent.name}/{path.name}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _stack(self, frame) -> Tuple[str, ...]:
+        stack = []
+        while frame is not None:
+            stack.append(self._label(frame.f_code))
+            frame = frame.f_back
+        return tuple(reversed(stack))
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                profiles = list(self._profiles)
+                if not profiles:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for profile in profiles:
+                with profile.lock:
+                    if profile.stopped:
+                        continue
+                    for thread_id in profile.threads:
+                        frame = frames.get(thread_id)
+                        if frame is not None:
+                            profile.samples[self._stack(frame)] += 1
+            del frames
+            time.sleep(min(p.interval for p in profiles))
+
+
+_sampler = _Sampler()
+
+
+def run_in_context(context: contextvars.Context, fn: Callable, *args, **kwargs):
+    """Run ``fn`` in ``context`` on the current thread, sampled with the node that owns the context."""
+    return context.run(_run_tracked, fn, *args, **kwargs)
+
+
+def _run_tracked(fn: Callable, *args, **kwargs):
+    profile = _active.get()
+    if profile is None:
+        return fn(*args, **kwargs)
+    thread_id = threading.get_ident()
+    profile.add_thread(thread_id)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profile.remove_thread(thread_id)
+
+
+def _profiling_configuration(config: Optional[Dict[str, Any]]) -> Optional[Configuration]:
+    configurable = (config or {}).get("configurable") or {}
+    switch = os.environ.get("PROFILE_NODES", configurable.get("profile_nodes"))
+    if switch is None or switch is False or switch in _FALSE:
+        return None
+    configuration = Configuration.from_runnable_config(config)
+    return configuration if configuration.profile_nodes else None
+
+
+def _profile_directory(configurable: Dict[str, Any]) -> pathlib.Path:
+    """Return the directory of the run's profiles under ``PROFILE_DIR``.
+
+    Raises:
+        ValueError: If the run id is not a plain directory name.
+    """
+    # The directory is a server setting; a configurable value is ignored
+    root = pathlib.Path(
+        os.environ.get("PROFILE_DIR", Configuration.model_fields["profile_dir"].default)
+    ).resolve()
+    run = str(configurable.get("run_id") or configurable.get("thread_id") or "local")
+    if not _RUN_NAME.fullmatch(run):
+        raise ValueError(f"run id {run!r} is not a valid profile directory name")
+    directory = (root / run).resolve()
+    if directory.parent != root:
+        raise ValueError(f"run id {run!r} is not a valid profile directory name")
+    return directory
+
+
+def _write(profile: NodeProfile, configuration: Configuration, config: Dict[str, Any]) -> None:
+    metadata = config.get("metadata") or {}
+    directory = _profile_directory(config.get("configurable") or {})
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f"{metadata.get('langgraph_step', 0):03d}-{profile.node}-{uuid.uuid4().hex[:8]}"
+    formats = {f.strip() for f in configuration.profile_format.split(",")}
+    if "collapsed" in formats:
+        (directory / f"{name}.collapsed").write_text(profile.to_collapsed())
+    if "speedscope" in formats:
+        (directory / f"{name}.speedscope.json").write_text(json.dumps(profile.to_speedscope(name)))
+
+
+def profiled(node: str, fn: Callable) -> Callable:
+    """Wrap the node function ``fn`` so its calls are profiled on demand.
+
+    The wrapper keeps ``fn``'s signature, so LangGraph still passes
+    ``config`` and ``store`` to it.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        config = kwargs.get("config", args[1] if len(args) > 1 else None)
+        configuration = _profiling_configuration(config)
+        if configuration is None:
+            return fn(*args, **kwargs)
+
+        profile = NodeProfile(node, max(configuration.profile_interval_ms, 1) / 1000)
+        token = _active.set(profile)
+        profile.add_thread(threading.get_ident())
+        _sampler.start(profile)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _sampler.stop(profile)
+            _active.reset(token)
+            try:
+                _write(profile, configuration, config)
+            except (OSError, ValueError) as e:
+                logger.warning("writing the profile of %s failed: %s", node, e)
+
+    return wrapper
@@ -0,0 +1,95 @@
+"""Incremental progress events from inside long-running branches.
+
+``web_research`` and ``data_analysis`` branches report progress through
+LangGraph's custom stream writer, so clients streaming with the ``custom``
+stream mode can render each branch while it is still running instead of
+waiting for the node update. Every event is a dict with ``node``, ``branch``,
+``event`` and ``elapsed`` keys plus event-specific data. Events are:
+
+- ``query_started``: the branch started working on ``query``.
+- ``sources_found``: ``count`` sources (or result rows) were found.
+- ``partial_text``: ``text`` is the answer generated since the previous
+  ``partial_text`` event of the branch; clients concatenate the texts.
+- ``finished``: the branch finished; ``timings`` has per-step seconds.
+- ``cancelled``: the branch was cut off; ``reason`` is ``deadline``,
+  ``straggler`` or ``error``.
+
+Outside a streaming run the writer is a no-op.
+"""
+
+import time
+from typing import Any, Callable, Dict, List
+
+try:
+    from langgraph.config import get_stream_writer
+except ImportError:  # pragma: no cover - older langgraph
+    get_stream_writer = None
+
+# Partial text is sent at most this often to keep the event volume low.
+_PARTIAL_TEXT_INTERVAL = 0.5
+
+
+def _get_writer() -> Callable[[Any], None]:
+    if get_stream_writer is None:
+        return lambda chunk: None
+    try:
+        return get_stream_writer()
+    except RuntimeError:
+        # Called outside of a graph run
+        return lambda chunk: None
+
+
+class BranchProgress:
+    """Emit progress events for one fan-out branch.
+
+    Args:
+        node: The node running the branch.
+        branch: The branch id (the ``id`` in the ``Send`` payload).
+    """
+
+    def __init__(self, node: str, branch: Any):
+        """Start timing branch ``branch`` of ``node``."""
+        self.node = node
+        self.branch = branch
+        self._writer = _get_writer()
+        self._start = time.perf_counter()
+        self._step_start = self._start
+        self._last_partial = 0.0
+        self._text_parts: List[str] = []  # text not sent yet
+        self.timings: Dict[str, float] = {}
+
+    def emit(self, event: str, **data) -> None:
+        """Send a progress event."""
+        self._writer(
+            {
+                "node": self.node,
+                "branch": self.branch,
+                "event": event,
+                "elapsed": round(time.perf_counter() - self._start, 3),
+                **data,
+            }
+        )
+
+    def step(self, name: str) -> None:
+        """Record the time spent since the previous step under ``name``."""
+        now = time.perf_counter()
+        self.timings[name] = round(now - self._step_start, 3)
+        self._step_start = now
+
+    def add_text(self, delta: str) -> None:
+        """Append generated text and send what is new, rate-limited."""
+        self._text_parts.append(delta)
+        now = time.perf_counter()
+        if now - self._last_partial >= _PARTIAL_TEXT_INTERVAL:
+            self._last_partial = now
+            self._send_text()
+
+    def _send_text(self) -> None:
+        if self._text_parts:
+            self.emit("partial_text", text="".join(self._text_parts))
+            self._text_parts = []
+
+    def finished(self, **data) -> None:
+        """Send the remaining text and the ``finished`` event with step timings."""
+        self._send_text()
+        self.emit("finished", timings=self.timings, **data)
@@ -1,22 +1,46 @@
 from datetime import datetime
 
+from langchain_core.messages import HumanMessage, SystemMessage
+
 
 # Get current date in a readable format
 def get_current_date():
     return datetime.now().strftime("%B %d, %Y")
 
 
+# Every prompt is split into static instructions, sent as the system message,
+# and an input template with everything that varies per call (date, topic,
+# results), sent as the user message. The instructions are byte-identical
+# across calls, so they form a stable prefix that OpenAI-compatible providers
+# can serve from their prompt cache. Keep variable text out of them.
+def build_messages(instructions: str, input_template: str, **values):
+    """Build the [system, user] messages for a prompt.
+
+    Args:
+        instructions: The static instructions of the prompt.
+        input_template: Template for the variable part of the prompt.
+        **values: Values to format into ``input_template``.
+
+    Returns:
+        A list with a SystemMessage and a HumanMessage.
+    """
+    return [
+        SystemMessage(content=instructions),
+        HumanMessage(content=input_template.format(**values)),
+    ]
+
+
 query_writer_instructions = """Your goal is to generate sophisticated and diverse web search queries. These queries are intended for an advanced automated web research tool capable of analyzing complex results, following links, and synthesizing information.
 
 Instructions:
 - Always prefer a single search query, only add another query if the original question requests multiple aspects or elements and one query is not enough.
 - Each query should focus on one specific aspect of the original question.
-- Don't produce more than {number_queries} queries.
+- Don't produce more than the maximum number of queries given with the context.
 - Queries should be diverse, if the topic is broad, generate more than 1 query.
 - Don't generate multiple similar queries, 1 is enough.
-- Query should ensure that the most current information is gathered. The current date is {current_date}.
+- Query should ensure that the most current information is gathered. The current date is given with the context.
 
-Format: 
+Format:
 - Format your response as a JSON object with ALL two of these exact keys:
    - "rationale": Brief explanation of why these queries are relevant
    - "query": A list of search queries
@@ -25,12 +49,15 @@ Example:
 
 Topic: What revenue grew more last year apple stock or the number of people buying an iphone
 ```json
-{{
+{
     "rationale": "To answer this comparative growth question accurately, we need specific data points on Apple's stock performance and iPhone sales metrics. These queries target the precise financial information needed: company revenue trends, product-specific unit sales figures, and stock price movement over the same fiscal period for direct comparison.",
     "query": ["Apple total revenue growth fiscal year 2024", "iPhone unit sales growth fiscal year 2024", "Apple stock price growth fiscal year 2024"],
-}}
-```
+}
+```"""
 
+query_writer_input = """The current date is {current_date}.
+Maximum number of queries: {number_queries}
+{conversation_context}
 Context: {research_topic}"""
 
 
@@ -54,9 +81,9 @@ Examples:
 
 Format your response as a JSON object with these exact keys:
 - "task_type": Either "web_research" or "data_analysis"
-- "rationale": Brief explanation of why this task type was chosen
+- "rationale": Brief explanation of why this task type was chosen"""
 
-Context: {research_topic}"""
+task_type_input = """Context: {research_topic}"""
 
 
 data_analysis_instructions = """Generate data analysis queries to gather numerical data, statistics, and perform calculations for the research topic.
@@ -73,30 +100,66 @@ Format your response as a JSON object with these exact keys:
 
 Example:
 ```json
-{{
+{
     "rationale": "To analyze the financial performance comparison, we need specific numerical data on revenue growth, stock performance, and sales metrics. These queries target quantitative financial data sources.",
     "analysis_query": ["Apple revenue 2024 vs 2023", "Apple stock price performance 2024", "iPhone sales data 2024"]
-}}
-```
+}
+```"""
 
-Context: {research_topic}"""
+data_analysis_input = """Context: {research_topic}"""
 
 
-web_searcher_instructions = """Conduct targeted Google Searches to gather the most recent, credible information on "{research_topic}" and synthesize it into a verifiable text artifact.
+web_searcher_instructions = """Conduct targeted Google Searches to gather the most recent, credible information on the research topic given below and synthesize it into a verifiable text artifact.
 
 Instructions:
-- Query should ensure that the most current information is gathered. The current date is {current_date}.
+- Query should ensure that the most current information is gathered. The current date is given with the research topic.
 - Conduct multiple, diverse searches to gather comprehensive information.
 - Consolidate key findings while meticulously tracking the source(s) for each specific piece of information.
-- The output should be a well-written summary or report based on your search findings. 
-- Only include the information found in the search results, don't make up any information.
+- The output should be a well-written summary or report based on your search findings.
+- Only include the information found in the search results, don't make up any information."""
+
+web_searcher_input = """The current date is {current_date}.
 
 Research Topic:
 {research_topic}
 """
 
 
-data_analyzer_instructions = """Perform data analysis on "{research_topic}" to extract numerical insights and perform calculations.
+sql_generator_instructions = """Write a single PostgreSQL query that answers the data analysis question given below.
+
+Instructions:
+- Only write one read-only SELECT statement (a WITH clause is allowed). Never modify data.
+- Push all aggregations, filters, joins and sorting into the SQL itself; the database does the work, not the client.
+- Never select raw rows from large tables; aggregate them (COUNT, SUM, AVG, MIN, MAX, GROUP BY) or add a selective filter and a LIMIT.
+- Only use the tables and columns listed in the table statistics.
+- List the columns the query groups by in "dimensions".
+
+Format your response as a JSON object with these exact keys:
+- "sql": The SQL query
+- "dimensions": A list of the result columns used for grouping
+- "rationale": Brief explanation of how the query answers the question"""
+
+sql_generator_input = """Table Statistics:
+{table_statistics}
+
+Analysis Question:
+{research_topic}
+"""
+
+
+sql_rejected_input = """The previous query was rejected before execution because it was too expensive:
+{sql}
+
+Reason: {reason}
+
+Write a narrower query: filter on fewer rows, aggregate to fewer groups, or query a smaller table.
+"""
+
+
+approximate_suggestion = """Note: the exact query is expensive (estimated cost {cost:.0f}). An approximate answer estimated from a sample of the table, with 95% confidence intervals, is available by running again with approximate_queries enabled; mention this to the user."""
+
+
+data_analyzer_instructions = """Perform data analysis on the research topic given below to extract numerical insights and perform calculations.
 
 Instructions:
 - Focus on gathering numerical data, statistics, and performing calculations
@@ -104,13 +167,22 @@ Instructions:
 - Perform relevant calculations and statistical analysis
 - Present findings in a clear, structured format with numerical results
 - Include data sources and methodology where applicable
+- Use the table statistics to choose sensible queries: prefer aggregations and filters on large tables, and rely on the listed value ranges and distinct counts instead of scanning for them
+- Base your findings on the query results; if the query failed or returned no rows, say so instead of inventing numbers
+- If the query results are marked as an approximate result, report every estimate with its confidence interval (estimate ± error), say that it was estimated from a sample of the table, and do not present it as an exact figure"""
+
+data_analyzer_input = """Table Statistics:
+{table_statistics}
+
+Query Results:
+{query_results}
 
 Research Topic:
 {research_topic}
 """
 
 
-reflection_instructions = """You are an expert research assistant analyzing summaries about "{research_topic}".
+reflection_instructions = """You are an expert research assistant analyzing summaries about the research topic given below.
 
 Instructions:
 - Identify knowledge gaps or areas that need deeper exploration and generate a follow-up query. (1 or multiple).
@@ -126,17 +198,24 @@ Output Format:
    - "is_sufficient": true or false
    - "knowledge_gap": Describe what information is missing or needs clarification
    - "follow_up_queries": Write a specific question to address this gap
+   - "confidence": A number between 0 and 1 for how confident you are in this assessment
 
 Example:
 ```json
-{{
+{
     "is_sufficient": true, // or false
     "knowledge_gap": "The summary lacks information about performance metrics and benchmarks", // "" if is_sufficient is true
-    "follow_up_queries": ["What are typical performance benchmarks and metrics used to evaluate [specific technology]?"] // [] if is_sufficient is true
-}}
+    "follow_up_queries": ["What are typical performance benchmarks and metrics used to evaluate [specific technology]?"], // [] if is_sufficient is true
+    "confidence": 0.9
+}
 ```
 
-Reflect carefully on the Summaries to identify knowledge gaps and produce a follow-up query. Then, produce your output following this JSON format:
+Reflect carefully on the Summaries to identify knowledge gaps and produce a follow-up query. Then, produce your output following this JSON format."""
+
+reflection_input = """The current date is {current_date}.
+
+Research Topic:
+{research_topic}
 
 Summaries:
 {summaries}"""
@@ -145,15 +224,38 @@ Summaries:
 answer_instructions = """Generate a high-quality answer to the user's question based on the provided summaries.
 
 Instructions:
-- The current date is {current_date}.
-- You are the final step of a multi-step research process, don't mention that you are the final step. 
+- The current date is given with the user context.
+- You are the final step of a multi-step research process, don't mention that you are the final step.
 - You have access to all the information gathered from the previous steps.
 - You have access to the user's question.
 - Generate a high-quality answer to the user's question based on the provided summaries and the user's question.
-- Include the sources you used from the Summaries in the answer correctly, use markdown format (e.g. [apnews](https://vertexaisearch.cloud.google.com/id/1-0)). THIS IS A MUST.
+- Include the sources you used from the Summaries in the answer correctly, use markdown format (e.g. [apnews](https://vertexaisearch.cloud.google.com/id/1-0)). THIS IS A MUST."""
 
+answer_input = """The current date is {current_date}.
+{conversation_context}
 User Context:
 - {research_topic}
 
 Summaries:
 {summaries}"""
+
+
+conversation_context_block = """
+Earlier in this conversation (use it to resolve references in the question):
+{context}
+"""
+
+
+history_summary_instructions = """Maintain a compact summary of a conversation between a user and a research assistant.
+
+Instructions:
+- Merge the existing summary with the new turns into one updated summary.
+- Keep the questions the user asked, the key facts and figures of the answers and any preferences or constraints the user stated.
+- Drop citations, URLs, formatting and wording that does not carry information.
+- Keep the summary under 200 words, written as plain sentences."""
+
+history_summary_input = """Existing summary:
+{summary}
+
+New turns:
+{turns}"""
@@ -0,0 +1,253 @@
+"""Result cache for data analysis SQL, invalidated by table change tracking.
+
+Entries are keyed by the normalized SQL text plus a version token for every
+table the query references. A write to any of those tables changes its token,
+so later lookups compute a different key and miss; the stale entry simply ages
+out of the LRU.
+
+Two version sources are available:
+
+- ``PgStatVersionSource`` combines the ``pg_stat_user_tables`` insert, update
+  and delete counters with ``pg_class.relfilenode`` (which changes on
+  ``TRUNCATE``). It needs no schema changes, but the counters are published
+  by PostgreSQL with a delay of up to about a second after commit.
+- ``VersionTableSource`` reads a trigger-maintained table of per-table
+  version numbers, which is exact.
+
+To serve hits without a database round trip, tokens are reused for
+``version_ttl`` seconds after they were read; set it to 0 to check the
+versions on every lookup. Queries that reference a table without a version
+(a view, an unknown name, a table missing from the version table), queries
+that reference no table and queries calling a volatile function such as
+``now()`` or ``random()`` bypass the cache, since no table version would
+invalidate their results.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from agent.sql_executor import QueryResult, referenced_tables
+from agent.table_stats import quote_ident
+
+_TOKEN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\s+|[^'\"\s]+")
+
+# Plain tables and materialized views are versioned by their own counters,
+# partitioned tables by those of their leaf partitions. Views, foreign tables
+# and unknown names get no row in ``s`` and so no version.
+_PG_STAT_VERSIONS_SQL = """
+SELECT t.name, s.files, s.ins, s.upd, s.del
+FROM unnest(%s::text[]) AS t(name)
+LEFT JOIN pg_class c ON c.oid = to_regclass(t.name)
+LEFT JOIN LATERAL (
+    SELECT string_agg(pc.relfilenode::text, ',' ORDER BY pc.oid) AS files,
+           sum(st.n_tup_ins) AS ins, sum(st.n_tup_upd) AS upd, sum(st.n_tup_del) AS del
+    FROM pg_class pc
+    LEFT JOIN pg_stat_user_tables st ON st.relid = pc.oid
+    WHERE (c.relkind IN ('r', 'm') AND pc.oid = c.oid)
+       OR (c.relkind = 'p' AND pc.oid IN (SELECT relid FROM pg_partition_tree(c.oid) WHERE isleaf))
+    HAVING count(*) > 0 AND count(st.relid) = count(*)
+) s ON true
+"""
+
+# Functions and literals whose value changes without any table changing
+_VOLATILE_CALL = re.compile(
+    r"\b(?:now|clock_timestamp|statement_timestamp|transaction_timestamp|timeofday"
+    r"|random|setseed|gen_random_uuid|uuid_generate_\w+|nextval|currval|lastval|age)\s*\("
+    r"|\b(?:current_date|current_time|current_timestamp|localtime|localtimestamp)\b",
+    re.IGNORECASE,
+)
+_RELATIVE_TIME_LITERAL = re.compile(r"^'(?:now|today|tomorrow|yesterday)'$", re.IGNORECASE)
+
+
+def is_volatile(sql: str) -> bool:
+    """Return whether ``sql`` calls a volatile or time-relative function."""
+    code = []
+    for token in _TOKEN.findall(sql):
+        if token[0] == "'" and _RELATIVE_TIME_LITERAL.match(token):
+            return True
+        # Literals and quoted identifiers can not call anything
+        code.append(" " if token[0] in "'\"" else token)
+    return _VOLATILE_CALL.search("".join(code)) is not None
+
+
+def _unquoted_name(name: str) -> str:
+    """Return the name of a possibly quoted, schema-qualified identifier as stored."""
+    parts = re.findall(r'"((?:[^"]|"")*)"|([^."]+)', name)
+    return ".".join(quoted.replace('""', '"') if quoted else plain.lower() for quoted, plain in parts)
+
+
+def normalize_sql(sql: str) -> str:
+    """Normalize SQL text for use as a cache key.
+
+    Whitespace runs are collapsed and everything outside string literals and
+    quoted identifiers is lower-cased, so formatting differences in generated
+    SQL do not defeat the cache.
+    """
+    parts = []
+    for token in _TOKEN.findall(sql.strip().rstrip(";").strip()):
+        if token.isspace():
+            parts.append(" ")
+        elif token[0] in "'\"":
+            parts.append(token)
+        else:
+            parts.append(token.lower())
+    return "".join(parts)
+
+
+class PgStatVersionSource:
+    """Derive table versions from ``pg_stat_user_tables`` counters."""
+
+    def __init__(self, connect: Callable[[], Any]):
+        """Read versions over connections from ``connect``."""
+        self._connect = connect
+
+    def versions(self, tables: Sequence[str]) -> Dict[str, str]:
+        """Return a version token per table; tables without one are left out.
+
+        Names are resolved as written in SQL, so quoted identifiers keep
+        their case.
+        """
+        connection = self._connect()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(_PG_STAT_VERSIONS_SQL, (list(tables),))
+                return {
+                    name: f"{files}:{ins}:{upd}:{dele}"
+                    for name, files, ins, upd, dele in cursor.fetchall()
+                    if files is not None
+                }
+        finally:
+            connection.rollback()
+            connection.close()
+
+
+class VersionTableSource:
+    """Read table versions from a trigger-maintained version table.
+
+    The table needs ``table_name text PRIMARY KEY`` and ``version bigint``
+    columns, bumped by statement-level triggers on each analysis table
+    (see DATA_ANALYSIS_SETUP.md).
+    """
+
+    def __init__(self, connect: Callable[[], Any], version_table: str):
+        """Read versions from ``version_table`` over connections from ``connect``."""
+        self._connect = connect
+        relation = ".".join(quote_ident(part) for part in version_table.split("."))
+        self._sql = (
+            f"SELECT table_name, version FROM {relation} "
+            "WHERE table_name = ANY(%s)"
+        )
+
+    def versions(self, tables: Sequence[str]) -> Dict[str, str]:
+        """Return a version token per table; untracked tables are left out."""
+        names = {table: _unquoted_name(table) for table in tables}
+        connection = self._connect()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(self._sql, (sorted(set(names.values())),))
+                found = {name: str(version) for name, version in cursor.fetchall()}
+        finally:
+            connection.rollback()
+            connection.close()
+        return {table: found[name] for table, name in names.items() if name in found}
+
+
+class ResultCache:
+    """LRU cache of analysis query results keyed by SQL and table versions.
+
+    Args:
+        source: Object with a ``versions(tables) -> dict`` method.
+        max_entries: Maximum number of cached results.
+        max_bytes: Maximum total (estimated) size of cached results.
+        version_ttl: Seconds a table version token is reused before it is
+            read again.
+    """
+
+    def __init__(
+        self,
+        source: Any,
+        max_entries: int = 256,
+        max_bytes: int = 64_000_000,
+        version_ttl: float = 1.0,
+    ):
+        """Create an empty cache."""
+        self.source = source
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version_ttl = version_ttl
+        self._entries: OrderedDict[Tuple, QueryResult] = OrderedDict()
+        self._bytes = 0
+        self._versions: Dict[str, Tuple[Optional[str], float]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _table_versions(self, tables: List[str]) -> Optional[Tuple[str, ...]]:
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                t
+                for t in tables
+                if t not in self._versions or now - self._versions[t][1] > self.version_ttl
+            ]
+        if expired:
+            fresh = self.source.versions(expired)
+            with self._lock:
+                for table in expired:
+                    self._versions[table] = (fresh.get(table), now)
+        with self._lock:
+            versions = [(t, self._versions[t][0]) for t in sorted(tables)]
+        if any(version is None for _, version in versions):
+            return None
+        return tuple(f"{t}={version}" for t, version in versions)
+
+    def key(self, sql: str) -> Optional[Tuple]:
+        """Return the cache key of ``sql`` under the current table versions.
+
+        Returns None if the query references no table, calls a volatile
+        function, or references a table whose version can not be read (views,
+        unknown names, untracked tables): such results are not cached, since
+        nothing would invalidate them.
+        """
+        tables = referenced_tables(sql, keep_quotes=True)
+        if not tables or is_volatile(sql):
+            return None
+        versions = self._table_versions(tables)
+        return None if versions is None else (normalize_sql(sql), versions)
+
+    def get(self, key: Tuple) -> Optional[QueryResult]:
+        """Return the cached result for ``key``, if any."""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: Tuple, result: QueryResult) -> None:
+        """Store ``result`` under ``key``, evicting the least recently used entries."""
+        if result.bytes_read > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.bytes_read
+            self._entries[key] = result
+            self._bytes += result.bytes_read
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.bytes_read
+
+    def clear(self) -> None:
+        """Drop all cached results and version tokens."""
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self._bytes = 0
@@ -0,0 +1,198 @@
+"""Compact statistical digests of analysis query results.
+
+Raw result rows are summarized column-wise with vectorized pandas/NumPy
+operations before they are put into a prompt, so prompt size depends on the
+number of columns and the digest limits, not on the number of rows returned.
+The rendering is deterministic: the same result always produces the same text.
+"""
+
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from agent.sql_executor import QueryResult, format_query_result
+
+_QUANTILES = [0.25, 0.5, 0.75]
+
+# Results this small are shown verbatim; a digest would not be shorter.
+_VERBATIM_MAX_ROWS = 20
+
+_MAX_GROUPS = 20
+
+
+def _format_value(value) -> str:
+    """Format a scalar deterministically and compactly."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return "null"
+    if isinstance(value, (float, np.floating)):
+        return f"{value:.6g}"
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return str(value)
+
+
+def unique_columns(columns: Sequence[str]) -> List[str]:
+    """Suffix repeated column names (``count``, ``count_2``, ...)."""
+    seen = set(columns)
+    unique: List[str] = []
+    for name in columns:
+        if name not in unique:
+            unique.append(name)
+            continue
+        suffix = 2
+        while f"{name}_{suffix}" in seen or f"{name}_{suffix}" in unique:
+            suffix += 1
+        unique.append(f"{name}_{suffix}")
+    return unique
+
+
+def to_dataframe(result: QueryResult) -> pd.DataFrame:
+    """Build a DataFrame from a query result, converting numeric object columns.
+
+    psycopg2 returns ``NUMERIC`` columns as ``Decimal`` objects, which pandas
+    keeps as ``object``; those are converted to floats so they can be
+    summarized with vectorized operations. Repeated column names, such as
+    two ``count`` aggregates, are made unique so each selects one column.
+    """
+    df = pd.DataFrame.from_records(result.rows, columns=unique_columns(result.columns))
+    for column in df.select_dtypes(include="object").columns:
+        series = df[column]
+        converted = pd.to_numeric(series, errors="coerce")
+        if converted.notna().sum() == series.notna().sum() and series.notna().any():
+            df[column] = converted.astype(float)
+    return df
+
+
+def _numeric_section(df: pd.DataFrame) -> List[str]:
+    numeric = df.select_dtypes(include="number")
+    if numeric.empty:
+        return []
+    counts = numeric.count()
+    nulls = numeric.isna().sum()
+    mins = numeric.min()
+    maxs = numeric.max()
+    means = numeric.mean()
+    sums = numeric.sum()
+    quantiles = numeric.quantile(_QUANTILES)
+
+    lines = [
+        "Numeric columns:",
+        "| column | count | nulls | min | p25 | median | p75 | max | mean | sum |",
+        "| --- | --- | --- | --- | --- | --- | --- | --- | --- | --- |",
+    ]
+    for column in numeric.columns:
+        values = [
+            counts[column],
+            nulls[column],
+            mins[column],
+            *(quantiles.at[q, column] for q in _QUANTILES),
+            maxs[column],
+            means[column],
+            sums[column],
+        ]
+        lines.append(
+            f"| {column} | " + " | ".join(_format_value(v) for v in values) + " |"
+        )
+    return lines
+
+
+def _categorical_section(df: pd.DataFrame, top_k: int) -> List[str]:
+    categorical = df.select_dtypes(exclude="number")
+    if categorical.empty:
+        return []
+    lines = ["Other columns:"]
+    for column in categorical.columns:
+        series = categorical[column]
+        nulls = int(series.isna().sum())
+        if pd.api.types.is_datetime64_any_dtype(series):
+            lines.append(
+                f"- {column}: {series.count()} values, {nulls} nulls, "
+                f"range {_format_value(series.min())} .. {_format_value(series.max())}"
+            )
+            continue
+        counts = series.astype(str).where(series.notna()).value_counts()
+        # Sort by count, then by value, so ties render the same way every time.
+        counts = counts.sort_index(kind="stable").sort_values(
+            ascending=False, kind="stable"
+        )
+        top = ", ".join(f"{value} ({count})" for value, count in counts.head(top_k).items())
+        lines.append(
+            f"- {column}: {series.count()} values, {nulls} nulls, "
+            f"{len(counts)} distinct; top: {top}"
+        )
+    return lines
+
+
+def _group_section(df: pd.DataFrame, dimensions: Sequence[str]) -> List[str]:
+    dims = [d for d in dimensions if d in df.columns]
+    measures = [c for c in df.select_dtypes(include="number").columns if c not in dims]
+    if not dims or not measures:
+        return []
+    totals = df.groupby(dims, dropna=False, sort=True)[measures].sum()
+    totals = totals.sort_values(measures[0], ascending=False, kind="stable")
+    lines = [
+        f"Totals by {', '.join(dims)} (top {min(len(totals), _MAX_GROUPS)} of {len(totals)} groups):",
+        "| " + " | ".join(dims + measures) + " |",
+        "| " + " | ".join("---" for _ in dims + measures) + " |",
+    ]
+    for key, row in totals.head(_MAX_GROUPS).iterrows():
+        keys = key if isinstance(key, tuple) else (key,)
+        values = [_format_value(k) for k in keys] + [_format_value(row[m]) for m in measures]
+        lines.append("| " + " | ".join(values) + " |")
+    return lines
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    if len(text) > max_chars:
+        text = text[: max_chars - 15].rstrip() + "\n[... truncated]"
+    return text
+
+
+def digest_header(result: QueryResult) -> str:
+    """Return the first line of a digest, describing the result's shape."""
+    header = f"{result.row_count} rows, {len(result.columns)} columns"
+    if result.truncated:
+        header += " (truncated at the row / byte cap; statistics cover the rows read)"
+    if result.approximation is not None:
+        header += f"\n{result.approximation.describe()}"
+    return header
+
+
+def digest_dataframe(
+    df: pd.DataFrame,
+    header: str,
+    dimensions: Optional[Sequence[str]] = None,
+    top_k: int = 5,
+    max_chars: int = 6000,
+) -> str:
+    """Render the column summaries of ``df`` below ``header``."""
+    sections = [
+        [header],
+        _numeric_section(df),
+        _categorical_section(df, top_k),
+        _group_section(df, dimensions or []),
+    ]
+    text = "\n\n".join("\n".join(section) for section in sections if section)
+    return _truncate(text, max_chars)
+
+
+def digest_result(
+    result: QueryResult,
+    dimensions: Optional[Sequence[str]] = None,
+    top_k: int = 5,
+    max_chars: int = 6000,
+) -> str:
+    """Render a bounded, deterministic summary of a query result.
+
+    Args:
+        result: The query result to summarize.
+        dimensions: Result columns to compute group-by totals for.
+        top_k: Number of most frequent values listed per non-numeric column.
+        max_chars: Upper bound on the length of the returned text.
+    """
+    header = digest_header(result)
+    if result.row_count <= _VERBATIM_MAX_ROWS:
+        text = f"{header}\n\n{format_query_result(result, max_rows=_VERBATIM_MAX_ROWS)}"
+        return _truncate(text, max_chars)
+    return digest_dataframe(to_dataframe(result), header, dimensions, top_k, max_chars)
@@ -0,0 +1,201 @@
+"""Admission-controlled run queue for graph runs started by the HTTP app.
+
+At most ``max_concurrent`` runs execute at a time; the others wait in a
+queue. Waiting runs are served by priority class first (``interactive``
+before ``batch``) and round-robin across tenants within a class, so one
+tenant submitting a large batch cannot starve the others.
+
+Load is shed instead of letting latency grow without bound: a run is
+rejected on arrival when its class queue is full, and a queued run is
+rejected as soon as it has waited for its class's wait limit.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+
+
+class RunRejected(Exception):
+    """Raised when a run is shed; ``retry_after`` is a hint in seconds."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        """Create the error with a retry hint of ``retry_after`` seconds."""
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Waiter:
+    tenant: str
+    priority: str
+    future: asyncio.Future
+    enqueued: float = field(default_factory=time.monotonic)
+
+
+class RunScheduler:
+    """Bounded-concurrency run queue with priorities and tenant fairness.
+
+    Args:
+        max_concurrent: Number of runs executing at the same time.
+        max_queue_depth: Maximum number of queued runs per priority class.
+        max_wait: Maximum queueing time in seconds per priority class; a
+            missing or 0 entry means no limit.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 4,
+        max_queue_depth: int = 100,
+        max_wait: Optional[Dict[str, float]] = None,
+    ):
+        """Create an idle scheduler with empty queues."""
+        self.max_concurrent = max_concurrent
+        self.max_queue_depth = max_queue_depth
+        self.max_wait = max_wait or {}
+        self.running = 0
+        # Per class: tenant -> queued waiters, in round-robin order
+        self._queues: Dict[str, OrderedDict[str, Deque[_Waiter]]] = {
+            priority: OrderedDict() for priority in PRIORITIES
+        }
+        self._queued = {priority: 0 for priority in PRIORITIES}
+        self._stats: Dict[str, Dict[str, float]] = {
+            priority: {"admitted": 0, "rejected_full": 0, "shed_wait": 0, "wait_seconds": 0.0}
+            for priority in PRIORITIES
+        }
+
+    @asynccontextmanager
+    async def slot(self, tenant: str, priority: str = INTERACTIVE) -> AsyncIterator[None]:
+        """Wait for a run slot and hold it for the duration of the block.
+
+        Raises:
+            RunRejected: The queue is full or the run waited too long.
+            ValueError: Unknown priority class.
+        """
+        await self.acquire(tenant, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, tenant: str, priority: str = INTERACTIVE) -> None:
+        """Wait for a run slot; the caller must :meth:`release` it afterwards.
+
+        Raises:
+            RunRejected: The queue is full or the run waited for the class's
+                wait limit.
+            ValueError: Unknown priority class.
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class: {priority}")
+        stats = self._stats[priority]
+        if self.running < self.max_concurrent and not any(self._queued.values()):
+            self.running += 1
+            stats["admitted"] += 1
+            return
+        if self._queued[priority] >= self.max_queue_depth:
+            stats["rejected_full"] += 1
+            raise RunRejected(f"The {priority} run queue is full", retry_after=self._retry_after())
+
+        waiter = _Waiter(tenant, priority, asyncio.get_running_loop().create_future())
+        self._queues[priority].setdefault(tenant, deque()).append(waiter)
+        self._queued[priority] += 1
+        limit = self.max_wait.get(priority) or None
+        try:
+            # The shield keeps a timeout from cancelling a slot granted meanwhile
+            await asyncio.wait_for(asyncio.shield(waiter.future), limit)
+        except TimeoutError:
+            if waiter.future.done():
+                # Granted or shed by _grant just as the limit was reached
+                waiter.future.result()
+                return
+            self._remove(waiter)
+            waiter.future.cancel()
+            stats["shed_wait"] += 1
+            raise RunRejected(
+                f"Run waited {limit:.1f}s in the {priority} queue", retry_after=self._retry_after()
+            )
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                # The slot was granted just as the caller went away
+                self.release()
+            else:
+                self._remove(waiter)
+                waiter.future.cancel()
+            raise
+
+    def release(self) -> None:
+        """Give a slot back and grant it to the next queued run."""
+        self.running -= 1
+        self._grant()
+
+    def _grant(self) -> None:
+        while self.running < self.max_concurrent:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            if waiter.future.done():
+                continue
+            waited = time.monotonic() - waiter.enqueued
+            stats = self._stats[waiter.priority]
+            limit = self.max_wait.get(waiter.priority) or 0
+            if limit and waited > limit:
+                stats["shed_wait"] += 1
+                waiter.future.set_exception(
+                    RunRejected(
+                        f"Run waited {waited:.1f}s in the {waiter.priority} queue",
+                        retry_after=self._retry_after(),
+                    )
+                )
+                continue
+            stats["admitted"] += 1
+            stats["wait_seconds"] += waited
+            self.running += 1
+            waiter.future.set_result(None)
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        for priority in PRIORITIES:
+            tenants = self._queues[priority]
+            if not tenants:
+                continue
+            # Serve the tenant at the front and move it to the back
+            tenant, waiters = next(iter(tenants.items()))
+            waiter = waiters.popleft()
+            del tenants[tenant]
+            if waiters:
+                tenants[tenant] = waiters
+            self._queued[priority] -= 1
+            return waiter
+        return None
+
+    def _remove(self, waiter: _Waiter) -> None:
+        waiters = self._queues[waiter.priority].get(waiter.tenant)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        self._queued[waiter.priority] -= 1
+        if not waiters:
+            del self._queues[waiter.priority][waiter.tenant]
+
+    def _retry_after(self) -> float:
+        queued = sum(self._queued.values())
+        return max(1.0, round(queued / max(self.max_concurrent, 1), 1))
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return running and queued runs and admission counters per class."""
+        report: Dict[str, Any] = {"running": self.running, "max_concurrent": self.max_concurrent}
+        for priority in PRIORITIES:
+            stats = dict(self._stats[priority])
+            stats["queued"] = self._queued[priority]
+            stats["tenants_queued"] = len(self._queues[priority])
+            stats["mean_wait_seconds"] = (
+                stats["wait_seconds"] / stats["admitted"] if stats["admitted"] else 0.0
+            )
+            report[priority] = stats
+        return report
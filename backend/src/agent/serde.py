@@ -0,0 +1,258 @@
+"""Fast serialization of graph state for checkpoints, stream events and API payloads.
+
+LangGraph's default checkpoint serializer encodes every message through
+pydantic (``model_dump`` on write, ``model_validate_json`` on read), and
+``json.dumps`` is slow for the large lists this graph accumulates
+(``messages``, ``web_research_result``, ``sources_gathered``). This module
+encodes them against schemas declared from the ``TypedDict`` states in
+``agent/state.py``: message fields become compact field maps that skip
+default values and validation, and every other field is plain data that
+is handed to orjson or msgpack as is.
+
+``StateSerializer`` is a LangGraph checkpoint serializer, passed to any
+checkpointer as ``MemorySaver(serde=StateSerializer())`` or
+``PostgresSaver(conn, serde=StateSerializer())``. Values it has no schema
+for are delegated to the default ``JsonPlusSerializer``, so existing
+checkpoints stay readable.
+
+Using it for checkpoints is opt-in: the graph in ``langgraph.json`` is
+compiled without a checkpointer, and the LangGraph server's built-in
+checkpointer keeps its own serializer. To use it, a deployment provides a
+factory returning its checkpointer built with ``serde=StateSerializer()``
+and registers it in ``langgraph.json``::
+
+    "checkpointer": {"backend": "custom", "path": "./deploy/checkpointer.py:make_checkpointer"}
+
+Code that compiles the graph itself passes the checkpointer directly, as
+in ``graph.builder.compile(checkpointer=PostgresSaver(conn, serde=StateSerializer()))``. ``dumps_json`` and ``encode_update`` serialize
+API payloads and stream events. orjson and ormsgpack are optional; without
+them the standard library and the default serializer are used.
+"""
+
+import json
+from typing import (
+    Any,
+    Dict,
+    Optional,
+    Tuple,
+    Type,
+    get_args,
+    get_origin,
+    get_type_hints,
+)
+
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.graph import add_messages
+from typing_extensions import Annotated
+
+from agent.state import (
+    DataAnalysisState,
+    OverallState,
+    QueryGenerationState,
+    ReflectionState,
+    WebSearchState,
+)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import ormsgpack
+except ImportError:  # pragma: no cover - optional dependency
+    ormsgpack = None
+
+# Field kinds of the state schemas
+MESSAGES = "messages"
+VALUE = "value"
+
+# Serialization type tags written next to the checkpoint bytes
+MESSAGE_LIST_TYPE = "agent-messages"
+MESSAGE_TYPE = "agent-message"
+
+_MESSAGE_CLASSES: Dict[str, Type[BaseMessage]] = {
+    cls.model_fields["type"].default: cls
+    for cls in (HumanMessage, AIMessage, SystemMessage, ToolMessage, RemoveMessage, AIMessageChunk)
+}
+
+# Default value of every field per message class; defaults are not written
+_MESSAGE_DEFAULTS: Dict[Type[BaseMessage], Dict[str, Any]] = {
+    cls: {
+        name: field.get_default(call_default_factory=True)
+        for name, field in cls.model_fields.items()
+        if not field.is_required() and name != "type"
+    }
+    for cls in _MESSAGE_CLASSES.values()
+}
+
+_MESSAGE_FIELDS: Dict[Type[BaseMessage], frozenset] = {
+    cls: frozenset(cls.model_fields) for cls in _MESSAGE_CLASSES.values()
+}
+
+
+def _field_kinds(state: type) -> Dict[str, str]:
+    kinds = {}
+    for name, hint in get_type_hints(state, include_extras=True).items():
+        reducers = get_args(hint)[1:] if get_origin(hint) is Annotated else ()
+        kinds[name] = MESSAGES if add_messages in reducers else VALUE
+    return kinds
+
+
+# Field kinds of every state TypedDict, by state name
+STATE_SCHEMAS: Dict[str, Dict[str, str]] = {
+    state.__name__: _field_kinds(state)
+    for state in (OverallState, ReflectionState, QueryGenerationState, WebSearchState, DataAnalysisState)
+}
+
+# Field kinds by field name across all states; node updates carry no state name
+FIELD_KINDS: Dict[str, str] = {
+    name: kind for schema in STATE_SCHEMAS.values() for name, kind in schema.items()
+}
+
+
+def message_to_dict(message: BaseMessage) -> Dict[str, Any]:
+    """Return the fields of ``message`` that differ from their defaults.
+
+    Raises:
+        TypeError: ``message`` is not of a known message class.
+    """
+    defaults = _MESSAGE_DEFAULTS.get(type(message))
+    if defaults is None:
+        raise TypeError(f"No schema for message class {type(message).__name__}")
+    fields = {"type": message.type}
+    for name, value in message.__dict__.items():
+        if name not in defaults or value != defaults[name]:
+            fields[name] = value
+    if message.__pydantic_extra__:
+        fields.update(message.__pydantic_extra__)
+    return fields
+
+
+def message_from_dict(fields: Dict[str, Any]) -> BaseMessage:
+    """Rebuild a message written by ``message_to_dict`` without validation.
+
+    Equivalent to ``model_construct``, which inspects the default factories
+    on every call and is slower than validating.
+    """
+    cls = _MESSAGE_CLASSES[fields["type"]]
+    model_fields = _MESSAGE_FIELDS[cls]
+    values: Dict[str, Any] = {}
+    extra: Dict[str, Any] = {}
+    for name, default in _MESSAGE_DEFAULTS[cls].items():
+        if name not in fields:
+            values[name] = default.copy() if isinstance(default, (dict, list)) else default
+    for name, value in fields.items():
+        if name in model_fields:
+            values[name] = value
+        else:
+            extra[name] = value
+    message = cls.__new__(cls)
+    object.__setattr__(message, "__dict__", values)
+    object.__setattr__(message, "__pydantic_fields_set__", set(fields) - set(extra))
+    object.__setattr__(message, "__pydantic_extra__", extra)
+    object.__setattr__(message, "__pydantic_private__", None)
+    return message
+
+
+def encode_value(kind: str, value: Any) -> Any:
+    """Convert a state field value into plain data according to its kind."""
+    if kind == MESSAGES:
+        if isinstance(value, BaseMessage):
+            return message_to_dict(value)
+        if isinstance(value, list):
+            return [message_to_dict(m) if isinstance(m, BaseMessage) else m for m in value]
+    return value
+
+
+def encode_update(update: Any) -> Any:
+    """Convert a ``stream_mode="updates"`` chunk (``{node: {field: value}}``) into plain data."""
+    if not isinstance(update, dict):
+        return update
+    encoded = {}
+    for node, values in update.items():
+        if isinstance(values, dict):
+            values = {
+                name: encode_value(FIELD_KINDS.get(name, VALUE), value)
+                for name, value in values.items()
+            }
+        encoded[node] = values
+    return encoded
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, BaseMessage):
+        return message_to_dict(obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    return str(obj)
+
+
+def dumps_json(obj: Any) -> bytes:
+    """Serialize an API payload or stream event to UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_json_default, ensure_ascii=False).encode("utf-8")
+
+
+def _is_message_list(obj: Any) -> bool:
+    return (
+        isinstance(obj, list)
+        and bool(obj)
+        and all(type(m) in _MESSAGE_DEFAULTS for m in obj)
+    )
+
+
+class StateSerializer(SerializerProtocol):
+    """Checkpoint serializer with a fast path for the message channels.
+
+    Opt-in: it is only used by checkpointers constructed with it (see the
+    module docstring for the deployment step).
+
+    Args:
+        fallback: Serializer for everything without a schema; defaults to
+            LangGraph's ``JsonPlusSerializer``.
+    """
+
+    def __init__(self, fallback: Optional[SerializerProtocol] = None):
+        """Create the serializer around ``fallback``."""
+        self.fallback = fallback or JsonPlusSerializer()
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        """Serialize ``obj`` to a ``(type, bytes)`` pair."""
+        if ormsgpack is not None:
+            try:
+                if _is_message_list(obj):
+                    return MESSAGE_LIST_TYPE, ormsgpack.packb([message_to_dict(m) for m in obj])
+                if type(obj) in _MESSAGE_DEFAULTS:
+                    return MESSAGE_TYPE, ormsgpack.packb(message_to_dict(obj))
+            except (TypeError, ormsgpack.MsgpackEncodeError):
+                # Content the fast path cannot encode, e.g. objects in additional_kwargs
+                pass
+        return self.fallback.dumps_typed(obj)
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        """Deserialize a ``(type, bytes)`` pair written by ``dumps_typed``."""
+        type_, payload = data
+        if type_ == MESSAGE_LIST_TYPE:
+            return [message_from_dict(fields) for fields in _unpack(payload)]
+        if type_ == MESSAGE_TYPE:
+            return message_from_dict(_unpack(payload))
+        return self.fallback.loads_typed(data)
+
+
+def _unpack(payload: bytes) -> Any:
+    if ormsgpack is None:
+        raise RuntimeError("ormsgpack is required to read checkpoints written by StateSerializer")
+    return ormsgpack.unpackb(payload)
+
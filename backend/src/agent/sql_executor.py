@@ -0,0 +1,327 @@
+"""Execute generated analysis SQL with bounded memory.
+
+Aggregations, filters and joins are expected to be pushed down into the SQL
+itself; this module only validates that the statement is a single read-only
+query and streams its result through a named (server-side) cursor in fixed
+size batches. Reading stops at a hard row and byte cap, so the worker never
+holds more than ``max_rows`` rows regardless of the size of the result.
+Expensive aggregates over one large table can instead run as concurrent
+pieces over its partitions or key ranges (see ``agent.parallel_sql``).
+"""
+
+import logging
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional, Sequence
+
+_FORBIDDEN_KEYWORDS = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE|DROP|ALTER|CREATE|TRUNCATE|GRANT|REVOKE|"
+    r"COPY|VACUUM|ANALYZE|CLUSTER|REINDEX|LOCK|CALL|DO|SET|RESET|LISTEN|NOTIFY|INTO)\b",
+    re.IGNORECASE,
+)
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_QUOTED_IDENTIFIER = re.compile(r'"(?:[^"]|"")*"')
+# Literals and quoted identifiers are matched first so comment markers inside
+# them are kept
+_COMMENT = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+logger = logging.getLogger(__name__)
+
+
+class SQLExecutionError(Exception):
+    """Raised when generated SQL is rejected or fails to execute."""
+
+
+@dataclass
+class QueryResult:
+    """Result of an analysis query, possibly truncated at the row/byte cap."""
+
+    sql: str
+    columns: List[str] = field(default_factory=list)
+    rows: List[tuple] = field(default_factory=list)
+    truncated: bool = False
+    bytes_read: int = 0
+    elapsed: float = 0.0
+    source: str = "postgresql"
+    estimated_cost: Optional[float] = None
+    estimated_rows: Optional[float] = None
+    parallel_pieces: int = 0
+    approximation: Optional[Any] = None  # ``approximate.Approximation`` of a sampled result
+
+    @property
+    def row_count(self) -> int:
+        """Return the number of rows held in memory."""
+        return len(self.rows)
+
+
+def validate_select(sql: str) -> str:
+    """Return ``sql`` normalized if it is a single read-only SELECT statement.
+
+    Comments are removed, so the statement can be wrapped in another query.
+
+    Raises:
+        SQLExecutionError: If the statement is empty, contains several
+            statements or uses a keyword that could modify the database
+            (including ``SELECT ... INTO``, which creates a table).
+    """
+    statement = _COMMENT.sub(lambda m: m.group(1) or " ", sql)
+    statement = statement.strip().rstrip(";").strip()
+    if not statement:
+        raise SQLExecutionError("Empty SQL statement")
+    # Keywords inside string literals and quoted identifiers are harmless, so ignore them.
+    code = _QUOTED_IDENTIFIER.sub('""', _STRING_LITERAL.sub("''", statement))
+    if ";" in code:
+        raise SQLExecutionError("Only a single SQL statement is allowed")
+    if not re.match(r"^\s*(SELECT|WITH)\b", code, re.IGNORECASE):
+        raise SQLExecutionError("Only SELECT queries are allowed")
+    forbidden = _FORBIDDEN_KEYWORDS.search(code)
+    if forbidden:
+        raise SQLExecutionError(f"Keyword not allowed in analysis SQL: {forbidden.group(1)}")
+    return statement
+
+
+def _row_size(row: Sequence[Any]) -> int:
+    """Cheaply estimate the in-memory size of a row in bytes."""
+    return sum(8 if value is None else len(str(value)) for value in row)
+
+
+class SQLExecutor:
+    """Stream read-only analysis queries through server-side cursors.
+
+    Args:
+        connect: Callable returning a new psycopg2 connection.
+        batch_size: Rows fetched from the server per round trip.
+        max_rows: Hard cap on the rows kept in memory.
+        max_bytes: Hard cap on the (estimated) bytes kept in memory.
+        guard: Optional ``SQLGuard`` that checks the planner estimate first.
+        statement_timeout_ms: Per-statement timeout; 0 disables it.
+        parallel: Optional ``ParallelAggregator`` that runs decomposable
+            aggregates over table slices when the estimate is high enough.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        batch_size: int = 1000,
+        max_rows: int = 10000,
+        max_bytes: int = 8_000_000,
+        guard: Optional[Any] = None,
+        statement_timeout_ms: int = 0,
+        parallel: Optional[Any] = None,
+    ):
+        """Create the executor over connections from ``connect``."""
+        self._connect = connect
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.guard = guard
+        self.statement_timeout_ms = statement_timeout_ms
+        self.parallel = parallel
+
+    def execute(self, sql: str, params: Optional[Sequence[Any]] = None) -> QueryResult:
+        """Run ``sql`` and return at most ``max_rows`` rows / ``max_bytes`` bytes."""
+        statement = validate_select(sql)
+        result = QueryResult(sql=statement)
+        start = time.perf_counter()
+
+        try:
+            connection = self._connect()
+        except Exception as e:
+            raise SQLExecutionError(str(e)) from e
+        try:
+            self._stream(connection, statement, params, result)
+        except SQLExecutionError:
+            raise
+        except Exception as e:
+            raise SQLExecutionError(str(e)) from e
+        finally:
+            try:
+                connection.rollback()
+            finally:
+                connection.close()
+
+        result.elapsed = time.perf_counter() - start
+        if result.estimated_cost is not None:
+            logger.info(
+                "analysis query: estimated_cost=%.0f estimated_rows=%.0f "
+                "actual_rows=%d truncated=%s parallel_pieces=%d elapsed=%.3fs",
+                result.estimated_cost,
+                result.estimated_rows,
+                result.row_count,
+                result.truncated,
+                result.parallel_pieces,
+                result.elapsed,
+            )
+        return result
+
+    def _stream(
+        self,
+        connection: Any,
+        statement: str,
+        params: Optional[Sequence[Any]],
+        result: QueryResult,
+    ) -> None:
+        # Everything runs in one read-only transaction, so neither the guard's
+        # EXPLAIN nor the query can modify data or outlive the timeout.
+        plan, limited = None, False
+        with connection.cursor() as setup:
+            setup.execute("SET TRANSACTION READ ONLY")
+            if self.statement_timeout_ms:
+                setup.execute(
+                    "SELECT set_config('statement_timeout', %s, true)",
+                    (str(self.statement_timeout_ms),),
+                )
+            if self.guard is not None:
+                decision = self.guard.check(setup, statement)
+                statement = decision.sql
+                result.sql = statement
+                result.estimated_cost = decision.estimate.total_cost
+                result.estimated_rows = decision.estimate.plan_rows
+                limited = decision.limited
+            if self.parallel is not None and not params and not limited:
+                plan = self.parallel.plan(setup, statement, result.estimated_cost)
+            # The pieces import this transaction's snapshot; when their partial
+            # rows exceed the caps the query runs as one, in the same transaction
+            if plan is not None and self.parallel.execute(
+                setup, plan, result, self.max_rows, self.max_bytes, self.batch_size
+            ):
+                return
+        self._fetch(connection, statement, params, result)
+
+    def _fetch(
+        self,
+        connection: Any,
+        statement: str,
+        params: Optional[Sequence[Any]],
+        result: QueryResult,
+    ) -> None:
+        # Named cursors keep the result set on the server; fetchmany pulls it
+        # over in batches of ``batch_size`` rows.
+        cursor = connection.cursor(name=f"analysis_{uuid.uuid4().hex}")
+        cursor.itersize = self.batch_size
+        try:
+            cursor.execute(statement, params)
+            read_capped(cursor, result, self.batch_size, self.max_rows, self.max_bytes)
+        finally:
+            cursor.close()
+
+
+def read_capped(
+    cursor: Any,
+    result: QueryResult,
+    batch_size: int,
+    max_rows: int,
+    max_bytes: int,
+) -> None:
+    """Fetch rows from an executed DB-API cursor into ``result`` until a cap is hit."""
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not result.columns and cursor.description:
+            result.columns = [column[0] for column in cursor.description]
+        if not batch or not append_capped(result, batch, max_rows, max_bytes):
+            return
+
+
+def append_capped(result: QueryResult, rows: Sequence[Sequence[Any]], max_rows: int, max_bytes: int) -> bool:
+    """Append ``rows`` to ``result`` until a cap is hit; return False once it is."""
+    for row in rows:
+        size = _row_size(row)
+        if len(result.rows) >= max_rows or result.bytes_read + size > max_bytes:
+            result.truncated = True
+            return False
+        result.rows.append(tuple(row))
+        result.bytes_read += size
+    return True
+
+
+_TABLE_REFERENCE = re.compile(
+    r"\b(FROM|JOIN)\s+(?:ONLY\s+)?((?:\"[^\"]+\"|[A-Za-z_][\w$]*)(?:\.(?:\"[^\"]+\"|[A-Za-z_][\w$]*))?)",
+    re.IGNORECASE,
+)
+_CTE_NAME = re.compile(r"(?:\bWITH(?:\s+RECURSIVE)?|,)\s*([A-Za-z_][\w$]*)\s+AS\s*\(", re.IGNORECASE)
+_SUBQUERY_START = re.compile(r"\s*(SELECT|WITH)\b", re.IGNORECASE)
+_FROM_END = re.compile(
+    r"\b(WHERE|GROUP|HAVING|WINDOW|ORDER|LIMIT|OFFSET|FETCH|UNION|INTERSECT|EXCEPT|FOR|"
+    r"JOIN|ON|USING)\b",
+    re.IGNORECASE,
+)
+_LISTED_TABLE = re.compile(r"\s*(?:ONLY\s+)?((?:\"[^\"]+\"|[A-Za-z_][\w$]*)(?:\.(?:\"[^\"]+\"|[A-Za-z_][\w$]*))?)")
+
+
+def _listed_tables(code: str, start: int) -> List[str]:
+    """Return the further comma-separated tables of the FROM list at ``start``."""
+    tables, depth, i = [], 0, start
+    while i < len(code):
+        char = code[i]
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth < 0:
+                break
+        elif depth == 0:
+            if char == ",":
+                listed = _LISTED_TABLE.match(code, i + 1)
+                if listed and listed.group(1).upper() != "LATERAL":
+                    tables.append(listed.group(1))
+            elif _FROM_END.match(code, i) and (i == 0 or not (code[i - 1].isalnum() or code[i - 1] == "_")):
+                break
+        i += 1
+    return tables
+
+
+def referenced_tables(sql: str, keep_quotes: bool = False) -> List[str]:
+    """Return the tables referenced in FROM/JOIN clauses, excluding CTE names.
+
+    This is a lexical scan, good enough for the single SELECT statements the
+    SQL generator produces; names are returned in order of first appearance,
+    unquoted unless ``keep_quotes`` is set (quoting decides case folding, so
+    callers resolving names in the database need it). A ``FROM`` inside the
+    parentheses of a function call such as ``extract(year FROM col)`` is
+    skipped, but callers must still treat the list as an over-approximation.
+    """
+    code = _STRING_LITERAL.sub("''", sql)
+    # Innermost open parenthesis at every position
+    openers, stack = [], []
+    for i, char in enumerate(code):
+        openers.append(stack[-1] if stack else -1)
+        if char == "(":
+            stack.append(i)
+        elif char == ")" and stack:
+            stack.pop()
+    ctes = {name.lower() for name in _CTE_NAME.findall(code)}
+    tables: List[str] = []
+    for match in _TABLE_REFERENCE.finditer(code):
+        opener = openers[match.start()]
+        if match.group(1).upper() == "FROM" and opener >= 0 and not _SUBQUERY_START.match(code, opener + 1):
+            continue
+        names = [match.group(2)]
+        if match.group(1).upper() == "FROM":
+            names += _listed_tables(code, match.end())
+        for name in names:
+            name = name if keep_quotes else name.replace('"', "")
+            if name.lower() in ctes or name in tables:
+                continue
+            tables.append(name)
+    return tables
+
+
+def format_query_result(result: QueryResult, max_rows: int = 50) -> str:
+    """Render the first ``max_rows`` rows of a result as a markdown table."""
+    if not result.columns:
+        return "The query returned no columns."
+    lines = [
+        "| " + " | ".join(result.columns) + " |",
+        "| " + " | ".join("---" for _ in result.columns) + " |",
+    ]
+    for row in result.rows[:max_rows]:
+        lines.append("| " + " | ".join("" if v is None else str(v) for v in row) + " |")
+    shown = min(result.row_count, max_rows)
+    note = f"{shown} of {result.row_count} rows shown"
+    if result.truncated:
+        note += f"; result truncated at the {result.row_count} row / byte cap"
+    lines.append("")
+    lines.append(f"({note})")
+    return "\n".join(lines)
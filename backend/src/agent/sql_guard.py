@@ -0,0 +1,111 @@
+"""EXPLAIN-based cost guard for generated analysis SQL.
+
+Before a generated query runs, the planner's estimate is read with
+``EXPLAIN (FORMAT JSON)`` (never ``ANALYZE``, which would execute it). Queries
+over the cost threshold are rejected; queries that are cheap enough but would
+return too many rows are wrapped in a ``LIMIT``. Every decision is logged with
+the estimate, and the executor logs estimated versus actual rows and time once
+the query has run, so the thresholds can be tuned from production logs.
+"""
+
+import json
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from agent.sql_executor import SQLExecutionError
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRejected(SQLExecutionError):
+    """Raised when a query's estimated cost is over the configured threshold."""
+
+    def __init__(self, message: str, estimated_cost: Optional[float] = None):
+        """Create the error with the planner's cost estimate, if known."""
+        super().__init__(message)
+        self.estimated_cost = estimated_cost
+
+
+@dataclass
+class CostEstimate:
+    """Planner estimate for a query."""
+
+    total_cost: float
+    plan_rows: float
+
+
+@dataclass
+class GuardDecision:
+    """The query to run and the estimate it was accepted with."""
+
+    sql: str
+    estimate: CostEstimate
+    limited: bool = False
+
+
+class SQLGuard:
+    """Reject or narrow queries based on the planner's estimates.
+
+    Args:
+        max_cost: Reject queries whose estimated total cost is higher.
+        max_rows: Queries estimated to return more rows are limited.
+        row_limit: The ``LIMIT`` added to such queries.
+    """
+
+    def __init__(self, max_cost: float, max_rows: float, row_limit: int):
+        """Create the guard with the given thresholds."""
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self.row_limit = row_limit
+
+    @staticmethod
+    def explain(cursor, sql: str) -> CostEstimate:
+        """Return the planner estimate for ``sql`` without executing it."""
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+        document = cursor.fetchone()[0]
+        if isinstance(document, str):
+            document = json.loads(document)
+        plan = document[0]["Plan"]
+        return CostEstimate(total_cost=plan["Total Cost"], plan_rows=plan["Plan Rows"])
+
+    def check(self, cursor, sql: str) -> GuardDecision:
+        """Return the (possibly rewritten) query to run.
+
+        Raises:
+            QueryRejected: If the estimated cost is over ``max_cost``, even
+                after limiting the number of returned rows.
+        """
+        estimate = self.explain(cursor, sql)
+        decision = GuardDecision(sql=sql, estimate=estimate)
+
+        if estimate.plan_rows > self.max_rows:
+            limited_sql = f"SELECT * FROM ({sql}) AS limited_query LIMIT {self.row_limit}"
+            decision = GuardDecision(
+                sql=limited_sql,
+                estimate=self.explain(cursor, limited_sql),
+                limited=True,
+            )
+
+        if decision.estimate.total_cost > self.max_cost:
+            logger.warning(
+                "sql_guard rejected: cost=%.0f rows=%.0f max_cost=%.0f sql=%s",
+                decision.estimate.total_cost,
+                estimate.plan_rows,
+                self.max_cost,
+                sql,
+            )
+            raise QueryRejected(
+                f"Estimated query cost {decision.estimate.total_cost:.0f} exceeds the "
+                f"limit of {self.max_cost:.0f} (about {estimate.plan_rows:.0f} rows). "
+                "Filter on fewer rows or aggregate more coarsely.",
+                estimated_cost=decision.estimate.total_cost,
+            )
+
+        logger.info(
+            "sql_guard accepted: cost=%.0f rows=%.0f limited=%s",
+            decision.estimate.total_cost,
+            decision.estimate.plan_rows,
+            decision.limited,
+        )
+        return decision
@@ -9,18 +9,25 @@ from typing_extensions import Annotated
 
 import operator
 
+from agent.tracing import merge_trace
+
 
 class OverallState(TypedDict):
     messages: Annotated[list, add_messages]
     search_query: Annotated[list, operator.add]
     web_research_result: Annotated[list, operator.add]
+    data_analysis_query: Annotated[list, operator.add]
     data_analysis_result: Annotated[list, operator.add]
     sources_gathered: Annotated[list, operator.add]
     initial_search_query_count: int
     max_research_loops: int
     research_loop_count: int
     reasoning_model: str
+    task_type: str
     database_schema: dict  # 数据库表结构信息
+    deadline: float  # absolute run deadline (epoch seconds)
+    missing_branches: Annotated[list, operator.add]
+    trace: Annotated[list, merge_trace]  # spans of the latest run
 
 
 class ReflectionState(TypedDict):
@@ -43,11 +50,17 @@ class QueryGenerationState(TypedDict):
 class WebSearchState(TypedDict):
     search_query: str
     id: str
+    deadline: float
+    fanout_id: str
+    fanout_size: int
 
 
 class DataAnalysisState(TypedDict):
     analysis_query: str
     id: str
+    deadline: float
+    fanout_id: str
+    fanout_size: int
 
 
 @dataclass(kw_only=True)
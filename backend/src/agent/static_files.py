@@ -0,0 +1,198 @@
+"""Precompressed, cache-friendly serving of the built frontend.
+
+All files of the build directory are loaded into memory at startup together
+with their gzip and brotli variants. Variants produced at build time
+(``app.js.gz``, ``app.js.br``) are used as is; missing ones are compressed
+once at startup. Brotli needs the optional ``brotli`` package; without it
+only gzip is offered.
+
+Every response carries a strong ETag derived from the file content and the
+encoding, and conditional requests are answered with 304. Vite's hashed
+assets (``assets/name-<hash>.js``) never change under the same name and are
+marked immutable for a year; everything else, including ``index.html``,
+must be revalidated, so a new deployment is picked up on the next load.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import pathlib
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import PlainTextResponse, Response
+from starlette.types import Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+# Vite names bundled assets ``<name>-<hash>.<ext>`` with an 8+ character hash.
+_HASHED_ASSET = re.compile(r"-[A-Za-z0-9_-]{8,}\.[a-z0-9]+$")
+
+_COMPRESSIBLE_SUFFIXES = {
+    ".html", ".js", ".mjs", ".css", ".json", ".map", ".svg", ".txt", ".xml", ".wasm", ".ico",
+}
+
+# Variants that save less than this fraction of the size are not served.
+_MIN_SAVING = 0.05
+
+_IMMUTABLE = "public, max-age=31536000, immutable"
+_REVALIDATE = "no-cache"
+
+
+@dataclass
+class StaticAsset:
+    """A file of the build directory and its compressed variants."""
+
+    media_type: str
+    cache_control: str
+    etag: str
+    variants: Dict[str, bytes] = field(default_factory=dict)  # encoding -> body
+
+
+def _parse_accept_encoding(header: str) -> Dict[str, float]:
+    accepted: Dict[str, float] = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding: str, available: List[str]) -> str:
+    """Pick the smallest acceptable variant: ``br``, then ``gzip``, else ``identity``."""
+    accepted = _parse_accept_encoding(accept_encoding)
+    for coding in ("br", "gzip"):
+        if coding in available and accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return "identity"
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, as required for If-None-Match
+    return etag in tags or f"W/{etag}" in tags
+
+
+class PrecompressedStaticFiles:
+    """ASGI app serving a build directory from memory.
+
+    Args:
+        directory: The build directory, which must contain ``index.html``.
+        gzip_level: Compression level of variants made at startup.
+        brotli_quality: Quality of brotli variants made at startup.
+    """
+
+    def __init__(self, directory: pathlib.Path, gzip_level: int = 9, brotli_quality: int = 11):
+        """Index ``directory`` and compress the assets missing a variant."""
+        self.directory = pathlib.Path(directory)
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.assets: Dict[str, StaticAsset] = {}
+        self._load()
+
+    def _load(self) -> None:
+        for path in sorted(self.directory.rglob("*")):
+            if not path.is_file() or path.suffix in (".gz", ".br"):
+                continue
+            relative = path.relative_to(self.directory).as_posix()
+            self.assets[relative] = self._load_asset(path, relative)
+
+    def _load_asset(self, path: pathlib.Path, relative: str) -> StaticAsset:
+        body = path.read_bytes()
+        media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        if media_type.startswith("text/") or media_type in ("application/javascript", "application/json"):
+            media_type += "; charset=utf-8"
+        immutable = relative.startswith("assets/") and _HASHED_ASSET.search(path.name)
+        asset = StaticAsset(
+            media_type=media_type,
+            cache_control=_IMMUTABLE if immutable else _REVALIDATE,
+            etag='"' + hashlib.sha256(body).hexdigest()[:32] + '"',
+            variants={"identity": body},
+        )
+        if path.suffix not in _COMPRESSIBLE_SUFFIXES:
+            return asset
+
+        for encoding, suffix, compress in (
+            ("gzip", ".gz", lambda data: gzip.compress(data, self.gzip_level, mtime=0)),
+            ("br", ".br", self._brotli),
+        ):
+            prebuilt = path.with_name(path.name + suffix)
+            if prebuilt.is_file():
+                variant: Optional[bytes] = prebuilt.read_bytes()
+            else:
+                variant = compress(body)
+            if variant is not None and len(variant) <= len(body) * (1 - _MIN_SAVING):
+                asset.variants[encoding] = variant
+        return asset
+
+    def _brotli(self, data: bytes) -> Optional[bytes]:
+        if brotli is None:
+            return None
+        return brotli.compress(data, quality=self.brotli_quality)
+
+    def _lookup(self, path: str) -> Optional[StaticAsset]:
+        path = path.lstrip("/")
+        candidates = [path] if path and not path.endswith("/") else []
+        candidates.append(f"{path.rstrip('/')}/index.html".lstrip("/"))
+        for candidate in candidates:
+            asset = self.assets.get(candidate)
+            if asset is not None:
+                return asset
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Serve a GET or HEAD request for one of the assets."""
+        assert scope["type"] == "http"
+        if scope["method"] not in ("GET", "HEAD"):
+            response: Response = PlainTextResponse("Method Not Allowed", status_code=405)
+            await response(scope, receive, send)
+            return
+
+        path, root_path = scope["path"], scope.get("root_path", "")
+        # Newer Starlette versions keep the mount prefix in the path
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        asset = self._lookup(path)
+        if asset is None:
+            response = PlainTextResponse("Not Found", status_code=404)
+            await response(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""), list(asset.variants))
+        etag = asset.etag if encoding == "identity" else f'{asset.etag[:-1]}-{encoding}"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": asset.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+
+        if _etag_matches(request_headers.get("if-none-match", ""), etag):
+            response = Response(status_code=304, headers=headers)
+        else:
+            body = asset.variants[encoding]
+            response = Response(
+                b"" if scope["method"] == "HEAD" else body,
+                media_type=asset.media_type,
+                headers=headers,
+            )
+            if scope["method"] == "HEAD":
+                response.headers["content-length"] = str(len(body))
+        await response(scope, receive, send)
@@ -0,0 +1,261 @@
+"""Cheap table statistics for data analysis prompts.
+
+Row counts and column profiles are read from the PostgreSQL planner catalogs
+(``pg_class.reltuples`` and ``pg_stats``) instead of scanning the tables, and
+are cached per table so repeated runs do not hit the catalogs either. Exact
+``COUNT(*)`` is only used for small tables or when the caller asks for it.
+"""
+
+import json
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+# Tables that have never been analyzed have no reltuples estimate; they are
+# counted exactly only if they are at most this many pages (8 kB each) large,
+# larger ones get the planner's size-based estimate.
+_SMALL_TABLE_PAGES = 128
+
+_RELATION_SQL = """
+SELECT n.nspname,
+       c.relname,
+       c.reltuples,
+       c.relpages,
+       pg_relation_size(c.oid) / current_setting('block_size')::int AS curpages
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.oid = to_regclass(%s)
+"""
+
+_COLUMNS_SQL = """
+SELECT a.attname, format_type(a.atttypid, a.atttypmod)
+FROM pg_attribute a
+WHERE a.attrelid = to_regclass(%s) AND a.attnum > 0 AND NOT a.attisdropped
+ORDER BY a.attnum
+"""
+
+_PG_STATS_SQL = """
+SELECT attname, null_frac, n_distinct, histogram_bounds::text
+FROM pg_stats
+WHERE schemaname = %s AND tablename = %s
+"""
+
+
+@dataclass
+class ColumnStats:
+    """Planner statistics for a single column."""
+
+    name: str
+    data_type: str
+    null_frac: Optional[float] = None
+    n_distinct: Optional[int] = None
+    min_value: Optional[str] = None
+    max_value: Optional[str] = None
+
+
+@dataclass
+class TableStats:
+    """Planner statistics for a table."""
+
+    table: str
+    row_count: int
+    exact: bool
+    columns: List[ColumnStats] = field(default_factory=list)
+    analyzed: bool = True  # False if the row count was derived from the table size
+    collected_at: float = field(default_factory=time.time)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return a JSON-serializable representation of the statistics."""
+        return asdict(self)
+
+
+def parse_pg_array(text: Optional[str]) -> List[str]:
+    """Parse the text form of a one-dimensional PostgreSQL array."""
+    if not text or len(text) < 2:
+        return []
+    body = text[1:-1]
+    items: List[str] = []
+    current: List[str] = []
+    in_quotes = False
+    escaped = False
+    for char in body:
+        if escaped:
+            current.append(char)
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == '"':
+            in_quotes = not in_quotes
+        elif char == "," and not in_quotes:
+            items.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    items.append("".join(current))
+    return items
+
+
+def quote_ident(name: str) -> str:
+    """Quote a SQL identifier."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _estimate_rows(reltuples: float, relpages: int, curpages: int) -> Optional[int]:
+    """Scale reltuples to the current relation size like the planner does."""
+    if reltuples is None or reltuples < 0:
+        return None
+    if relpages and relpages > 0:
+        return int(reltuples / relpages * curpages)
+    return int(reltuples)
+
+
+def _planner_rows(cursor, qualified_table: str) -> int:
+    """Return the planner's row estimate for a full scan of the table."""
+    cursor.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {qualified_table}")
+    document = cursor.fetchone()[0]
+    if isinstance(document, str):
+        document = json.loads(document)
+    return int(document[0]["Plan"]["Plan Rows"])
+
+
+class TableStatsService:
+    """Read and cache planner statistics for a set of tables.
+
+    Args:
+        connect: Callable returning a new DB-API connection.
+        ttl_seconds: How long cached statistics stay valid.
+        exact_count_max_rows: Tables whose estimate is at or below this size
+            are counted exactly, since ``COUNT(*)`` on them is cheap.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        ttl_seconds: float = 300.0,
+        exact_count_max_rows: int = 10000,
+    ):
+        """Create the service with an empty cache."""
+        self._connect = connect
+        self.ttl_seconds = ttl_seconds
+        self.exact_count_max_rows = exact_count_max_rows
+        self._cache: Dict[str, TableStats] = {}
+        self._lock = threading.Lock()
+
+    def get(self, table: str, exact: bool = False) -> TableStats:
+        """Return statistics for ``table``, reading the catalogs on a cache miss.
+
+        Args:
+            table: Table name, optionally schema-qualified.
+            exact: Force an exact ``COUNT(*)`` even for large tables.
+        """
+        with self._lock:
+            cached = self._cache.get(table)
+        if (
+            cached is not None
+            and time.time() - cached.collected_at < self.ttl_seconds
+            and (cached.exact or not exact)
+        ):
+            return cached
+
+        stats = self._collect(table, exact)
+        with self._lock:
+            self._cache[table] = stats
+        return stats
+
+    def row_count(self, table: str, exact: bool = False) -> int:
+        """Return the (estimated) number of rows in ``table``."""
+        return self.get(table, exact=exact).row_count
+
+    def invalidate(self, table: Optional[str] = None) -> None:
+        """Drop cached statistics for ``table``, or for all tables."""
+        with self._lock:
+            if table is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(table, None)
+
+    def _collect(self, table: str, exact: bool) -> TableStats:
+        connection = self._connect()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(_RELATION_SQL, (table,))
+                relation = cursor.fetchone()
+                if relation is None:
+                    raise ValueError(f"Table not found: {table}")
+                schema, relname, reltuples, relpages, curpages = relation
+
+                estimate = _estimate_rows(reltuples, relpages, curpages)
+                needs_exact = exact or (
+                    estimate is None and curpages <= _SMALL_TABLE_PAGES
+                )
+                if estimate is not None and estimate <= self.exact_count_max_rows:
+                    needs_exact = True
+
+                qualified = f"{quote_ident(schema)}.{quote_ident(relname)}"
+                if needs_exact:
+                    cursor.execute(f"SELECT COUNT(*) FROM {qualified}")
+                    row_count = cursor.fetchone()[0]
+                elif estimate is None:
+                    # Never analyzed: the planner derives rows per page from
+                    # the column widths and scales by the current size
+                    row_count = _planner_rows(cursor, qualified)
+                else:
+                    row_count = estimate
+
+                cursor.execute(_COLUMNS_SQL, (table,))
+                columns = {
+                    name: ColumnStats(name=name, data_type=data_type)
+                    for name, data_type in cursor.fetchall()
+                }
+
+                cursor.execute(_PG_STATS_SQL, (schema, relname))
+                for name, null_frac, n_distinct, histogram in cursor.fetchall():
+                    column = columns.get(name)
+                    if column is None:
+                        continue
+                    column.null_frac = null_frac
+                    # Negative n_distinct is a fraction of the row count.
+                    if n_distinct is not None:
+                        column.n_distinct = int(
+                            -n_distinct * row_count if n_distinct < 0 else n_distinct
+                        )
+                    bounds = parse_pg_array(histogram)
+                    if bounds:
+                        column.min_value = bounds[0]
+                        column.max_value = bounds[-1]
+        finally:
+            connection.close()
+
+        return TableStats(
+            table=table,
+            row_count=int(row_count),
+            exact=needs_exact,
+            columns=list(columns.values()),
+            analyzed=estimate is not None,
+        )
+
+
+def format_table_stats(stats: List[TableStats]) -> str:
+    """Render table statistics as compact prompt context."""
+    if not stats:
+        return "No table statistics available."
+    lines = []
+    for table in stats:
+        if table.exact:
+            qualifier = "exact"
+        elif table.analyzed:
+            qualifier = "estimated"
+        else:
+            qualifier = "estimated from the table size; not analyzed yet"
+        lines.append(f"Table {table.table}: {table.row_count} rows ({qualifier})")
+        for column in table.columns:
+            details = [column.data_type]
+            if column.null_frac is not None:
+                details.append(f"nulls {column.null_frac:.0%}")
+            if column.n_distinct is not None:
+                details.append(f"~{column.n_distinct} distinct")
+            if column.min_value is not None:
+                details.append(f"range {column.min_value} .. {column.max_value}")
+            lines.append(f"  - {column.name}: {', '.join(details)}")
+    return "\n".join(lines)
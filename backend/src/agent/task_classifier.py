@@ -0,0 +1,215 @@
+"""Local task-type classifier in front of the LLM router.
+
+Most questions can be routed between ``web_research`` and ``data_analysis``
+without an LLM round trip. ``TaskClassifier`` scores a question with a small
+logistic model over hashed word n-grams plus keyword and schema-term features
+(table and column names of the analysis tables). Confident predictions are
+used directly; the rest fall back to the ``TaskType`` LLM call.
+
+Every routing decision can be appended to a JSONL log. Decisions made by the
+LLM serve as labels for retraining::
+
+    python -m agent.task_classifier routing.jsonl weights.json
+"""
+
+import json
+import math
+import re
+import sys
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+WEB_RESEARCH = "web_research"
+DATA_ANALYSIS = "data_analysis"
+
+_BUCKETS = 1 << 18
+_TOKEN = re.compile(r"[a-z0-9_]+|[一-鿿]")
+
+# Keywords match whole tokens (for Chinese, runs of characters), so "sum"
+# does not fire on "summarize"; words common in web questions ("our", "top",
+# "mean", "总") are left to the n-gram weights.
+_DATA_KEYWORDS = (
+    "calculate", "total", "sum", "average", "avg", "median", "count",
+    "how many", "per month", "per year", "by region", "by category", "breakdown",
+    "aggregate", "distribution", "trend", "ratio", "percentage", "growth rate",
+    "compare", "revenue", "sales", "orders", "customers", "retention",
+    "计算", "统计", "总计", "总额", "平均", "合计", "数量", "占比", "趋势", "排名", "同比", "环比",
+)
+_WEB_KEYWORDS = (
+    "latest", "news", "recent", "today", "current", "who is", "what is", "why",
+    "explain", "benefits", "history of", "developments", "announced", "stock price",
+    "weather", "best", "review", "how to", "definition", "meaning",
+    "最新", "新闻", "是什么", "为什么", "介绍", "如何",
+)
+
+
+def _keyword_tokens(keywords: Sequence[str]) -> List[Tuple[str, ...]]:
+    return [tuple(_TOKEN.findall(keyword)) for keyword in keywords]
+
+
+_DATA_KEYWORD_TOKENS = _keyword_tokens(_DATA_KEYWORDS)
+_WEB_KEYWORD_TOKENS = _keyword_tokens(_WEB_KEYWORDS)
+
+
+def _contains(tokens: Sequence[str], keyword: Tuple[str, ...]) -> bool:
+    n = len(keyword)
+    return any(tuple(tokens[i:i + n]) == keyword for i in range(len(tokens) - n + 1))
+
+
+# Weights used before the model has been trained on production traffic. They
+# only feed the routing log: an untrained classifier never skips the LLM.
+_PRIOR_WEIGHTS = {
+    "__bias__": -0.5,
+    "__data_keyword__": 1.5,
+    "__web_keyword__": -1.5,
+    "__schema_term__": 1.0,
+}
+
+
+def _bucket(feature: str) -> str:
+    return str(zlib.crc32(feature.encode("utf-8")) % _BUCKETS)
+
+
+def schema_terms(database_schema: Dict) -> List[str]:
+    """Return lower-cased table and column name terms from a database schema."""
+    terms = set()
+    for table, info in database_schema.items():
+        names = [table.split(".")[-1]]
+        names.extend(column["name"] for column in info.get("columns", []))
+        for name in names:
+            name = name.lower()
+            terms.add(name)
+            terms.update(part for part in name.split("_") if len(part) > 2)
+    return sorted(terms)
+
+
+class TaskClassifier:
+    """Logistic classifier over hashed n-grams and keyword features.
+
+    A positive score means ``data_analysis``. ``trained`` is set once weights
+    have been loaded or fitted; only then are predictions meant to replace
+    the LLM router.
+
+    Args:
+        weights: Sparse feature weights; the untrained priors are used if omitted.
+    """
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None):
+        """Create the classifier from ``weights`` over the priors."""
+        self.weights = dict(_PRIOR_WEIGHTS)
+        if weights:
+            self.weights.update(weights)
+        self.trained = bool(weights)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "TaskClassifier":
+        """Load weights saved with ``save``."""
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def save(self, path: str) -> None:
+        """Save the weights as JSON."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.weights, f)
+
+    def features(self, question: str, terms: Sequence[str] = ()) -> List[str]:
+        """Return the active features of ``question``."""
+        text = question.lower()
+        tokens = _TOKEN.findall(text)
+        features = ["__bias__"]
+        features.extend(_bucket(f"1:{t}") for t in tokens)
+        features.extend(_bucket(f"2:{a} {b}") for a, b in zip(tokens, tokens[1:]))
+        features.extend("__data_keyword__" for k in _DATA_KEYWORD_TOKENS if _contains(tokens, k))
+        features.extend("__web_keyword__" for k in _WEB_KEYWORD_TOKENS if _contains(tokens, k))
+        token_set = set(tokens)
+        features.extend("__schema_term__" for t in terms if t in token_set)
+        return features
+
+    def _score(self, features: Iterable[str]) -> float:
+        return sum(self.weights.get(f, 0.0) for f in features)
+
+    def predict(self, question: str, terms: Sequence[str] = ()) -> Tuple[str, float]:
+        """Return the predicted task type and its confidence in [0.5, 1]."""
+        z = self._score(self.features(question, terms))
+        p = 1.0 / (1.0 + math.exp(-max(min(z, 30.0), -30.0)))
+        if p >= 0.5:
+            return DATA_ANALYSIS, p
+        return WEB_RESEARCH, 1.0 - p
+
+    def train(
+        self,
+        examples: Sequence[Tuple[str, Sequence[str], str]],
+        epochs: int = 5,
+        learning_rate: float = 0.1,
+        l2: float = 1e-4,
+    ) -> None:
+        """Fit the weights with SGD on ``(question, schema_terms, label)`` examples."""
+        with self._lock:
+            for _ in range(epochs):
+                for question, terms, label in examples:
+                    features = self.features(question, terms)
+                    z = self._score(features)
+                    p = 1.0 / (1.0 + math.exp(-max(min(z, 30.0), -30.0)))
+                    gradient = p - (1.0 if label == DATA_ANALYSIS else 0.0)
+                    for feature in features:
+                        weight = self.weights.get(feature, 0.0)
+                        self.weights[feature] = weight - learning_rate * (
+                            gradient + l2 * weight
+                        )
+            self.trained = True
+
+
+class RoutingLog:
+    """Append routing decisions to a JSONL file for retraining."""
+
+    def __init__(self, path: str):
+        """Append decisions to the JSONL file at ``path``."""
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        question: str,
+        terms: Sequence[str],
+        task_type: str,
+        source: str,
+        confidence: Optional[float],
+    ) -> None:
+        """Append one decision; ``source`` is ``local`` or ``llm``."""
+        entry = {
+            "ts": time.time(),
+            "question": question,
+            "schema_terms": list(terms),
+            "task_type": task_type,
+            "source": source,
+            "confidence": confidence,
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def load_training_examples(path: str) -> List[Tuple[str, List[str], str]]:
+    """Read LLM-labelled examples from a routing log."""
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry.get("source") == "llm":
+                examples.append(
+                    (entry["question"], entry.get("schema_terms", []), entry["task_type"])
+                )
+    return examples
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: python -m agent.task_classifier ROUTING_LOG WEIGHTS_OUT")
+    classifier = TaskClassifier()
+    training_examples = load_training_examples(sys.argv[1])
+    classifier.train(training_examples)
+    classifier.save(sys.argv[2])
+    sys.stdout.write(f"Trained on {len(training_examples)} examples\n")
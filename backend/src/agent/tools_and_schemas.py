@@ -21,6 +21,10 @@ class Reflection(BaseModel):
     follow_up_queries: List[str] = Field(
         description="A list of follow-up queries to address the knowledge gap."
     )
+    confidence: float = Field(
+        default=1.0,
+        description="Confidence between 0 and 1 that this assessment is correct.",
+    )
 
 
 class TaskType(BaseModel):
@@ -39,3 +43,18 @@ class DataAnalysisQuery(BaseModel):
     rationale: str = Field(
         description="A brief explanation of why these analysis queries are relevant to the research topic."
     )
+
+
+class AnalysisSQL(BaseModel):
+    """A SQL query generated for one analysis query."""
+
+    sql: str = Field(
+        description="A single read-only PostgreSQL SELECT statement that answers the analysis query, with aggregations, filters and joins done in SQL."
+    )
+    dimensions: List[str] = Field(
+        default_factory=list,
+        description="The result columns that the query groups by (empty if the query does not group).",
+    )
+    rationale: str = Field(
+        description="A brief explanation of how the query answers the analysis question."
+    )
@@ -0,0 +1,299 @@
+"""Span traces of graph runs with critical-path analysis.
+
+Every node call is recorded as a span: node, branch id of a ``Send``
+branch, superstep, and start and end in epoch seconds. The upstream calls
+made inside it (LLM requests, SQL queries, the queries of pipelined
+research) are recorded as child spans, including calls made on worker
+threads that run through ``run_in_context``. The spans travel in the node's
+state update under ``trace``. They are streamed with the ``updates`` stream
+mode and checkpointed with the thread, and ``merge_trace`` keeps only the
+spans of the thread's latest run.
+
+The first node opens a ``run`` span. The last node closes it, with the
+summary of ``analyze_trace`` as its ``attrs``:
+
+- the critical path: the node that finished last in each superstep, with
+  its upstream calls, since the next superstep starts only when it is done;
+- per fan-out, the straggler branch and how long the first finished
+  branch's result waited for it at the join;
+- the wall time, the node time within it, and the parallelism achieved
+  (node time over wall time), plus the time with a single node or no node
+  running, and the time spent in upstream calls.
+"""
+
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+RUN = "run"
+NODE = "node"
+# Child span kinds that are calls to upstream services
+UPSTREAM_KINDS = ("llm", "sql")
+
+_trace: contextvars.ContextVar[Optional["_NodeTrace"]] = contextvars.ContextVar(
+    "node_trace", default=None
+)
+_parent: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_parent", default=None)
+
+
+def _span_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def merge_trace(left: Optional[list], right: Optional[list]) -> list:
+    """Reducer of the ``trace`` state channel.
+
+    An opening ``run`` span starts the trace over, so a thread only keeps
+    its latest run; a closing ``run`` span replaces the open one.
+    """
+    merged = list(left or [])
+    for span in right or []:
+        if span["kind"] == RUN:
+            if span.get("end") is None:
+                merged = []
+            else:
+                merged = [s for s in merged if s["id"] != span["id"]]
+        merged.append(span)
+    return merged
+
+
+class _NodeTrace:
+    """The child spans recorded during one node call."""
+
+    def __init__(self):
+        self.spans: List[Dict[str, Any]] = []
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def add(self, span: Dict[str, Any]) -> None:
+        with self.lock:
+            # Branches cut off at a deadline may finish after their node
+            if not self.closed:
+                self.spans.append(span)
+
+    def close(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            self.closed = True
+            return list(self.spans)
+
+
+@contextlib.contextmanager
+def span(kind: str, name: str, **attrs):
+    """Record the enclosed block as a child span of the current node call.
+
+    Outside a traced node call this does nothing.
+    """
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    record: Dict[str, Any] = {"id": _span_id(), "parent": _parent.get(), "kind": kind, "name": name}
+    if attrs:
+        record["attrs"] = attrs
+    token = _parent.set(record["id"])
+    record["start"] = time.time()
+    try:
+        yield
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["end"] = time.time()
+        _parent.reset(token)
+        trace.add(record)
+
+
+def traced(node: str, fn: Callable, *, opens_run: bool = False, closes_run: bool = False) -> Callable:
+    """Wrap the node function ``fn`` so every call adds its spans to ``trace``.
+
+    ``opens_run`` marks the graph's entry node and ``closes_run`` its last
+    node, which summarizes the run. The wrapper keeps ``fn``'s signature.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        state = kwargs.get("state", args[0] if args else None) or {}
+        config = kwargs.get("config", args[1] if len(args) > 1 else None) or {}
+        node_span: Dict[str, Any] = {
+            "id": _span_id(),
+            "parent": None,
+            "kind": NODE,
+            "name": node,
+            "step": (config.get("metadata") or {}).get("langgraph_step"),
+        }
+        if "fanout_id" in state:
+            node_span["branch"] = state.get("id")
+
+        trace = _NodeTrace()
+        trace_token = _trace.set(trace)
+        parent_token = _parent.set(node_span["id"])
+        node_span["start"] = time.time()
+        try:
+            update = fn(*args, **kwargs)
+        finally:
+            node_span["end"] = time.time()
+            _parent.reset(parent_token)
+            _trace.reset(trace_token)
+        if update is not None and not isinstance(update, dict):
+            return update
+
+        spans = [*trace.close(), node_span]
+        if opens_run:
+            spans.insert(0, {"id": _span_id(), "parent": None, "kind": RUN, "name": RUN, "start": node_span["start"], "end": None})
+        if closes_run:
+            previous = merge_trace(state.get("trace"), [])
+            run = next((s for s in reversed(previous) if s["kind"] == RUN), None)
+            spans.append(
+                {
+                    "id": run["id"] if run else _span_id(),
+                    "parent": None,
+                    "kind": RUN,
+                    "name": RUN,
+                    "start": run["start"] if run else node_span["start"],
+                    "end": node_span["end"],
+                    "attrs": analyze_trace(previous + spans),
+                }
+            )
+        update = dict(update or {})
+        update["trace"] = [*update.get("trace", []), *spans]
+        return update
+
+    return wrapper
+
+
+def _seconds(value: float) -> float:
+    return round(value, 3)
+
+
+def analyze_trace(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Summarize the spans of one run: critical path, fan-outs and parallelism."""
+    nodes = [s for s in spans if s["kind"] == NODE and s.get("end") is not None]
+    if not nodes:
+        return {}
+    start = min(s["start"] for s in nodes)
+    end = max(s["end"] for s in nodes)
+    wall = end - start
+
+    children = defaultdict(list)
+    for s in spans:
+        if s.get("parent") is not None and s.get("end") is not None:
+            children[s["parent"]].append(s)
+
+    steps = defaultdict(list)
+    for s in nodes:
+        steps[s["step"] if s.get("step") is not None else s["id"]].append(s)
+
+    critical_path, fanouts = [], []
+    previous_end = start
+    for group in sorted(steps.values(), key=lambda g: min(s["start"] for s in g)):
+        # The next superstep waits for the node that finishes last
+        last = max(group, key=lambda s: s["end"])
+        step_start = min(s["start"] for s in group)
+        entry = {
+            "node": last["name"],
+            "branch": last.get("branch"),
+            "step": last.get("step"),
+            "start": _seconds(last["start"] - start),
+            "seconds": _seconds(last["end"] - last["start"]),
+            "scheduling_gap": _seconds(max(0.0, step_start - previous_end)),
+            "calls": [
+                {"kind": c["kind"], "name": c["name"], "start": _seconds(c["start"] - start), "seconds": _seconds(c["end"] - c["start"])}
+                for c in sorted(children[last["id"]], key=lambda c: c["start"])
+            ],
+        }
+        critical_path.append(entry)
+        if len(group) > 1:
+            first_end = min(s["end"] for s in group)
+            fanouts.append(
+                {
+                    "step": last.get("step"),
+                    "node": last["name"],
+                    "branches": len(group),
+                    "straggler": last.get("branch"),
+                    "straggler_seconds": entry["seconds"],
+                    "mean_branch_seconds": _seconds(sum(s["end"] - s["start"] for s in group) / len(group)),
+                    "join_wait_seconds": _seconds(last["end"] - first_end),
+                }
+            )
+        previous_end = max(previous_end, last["end"])
+
+    # Sweep the node spans for the time with one node and with no node running
+    events = sorted([(s["start"], 1) for s in nodes] + [(s["end"], -1) for s in nodes])
+    running, previous, sequential, idle = 0, start, 0.0, 0.0
+    for moment, delta in events:
+        if running == 0:
+            idle += moment - previous
+        elif running == 1:
+            sequential += moment - previous
+        running += delta
+        previous = moment
+
+    node_seconds = sum(s["end"] - s["start"] for s in nodes)
+    upstream = [s for s in spans if s["kind"] in UPSTREAM_KINDS and s.get("end") is not None]
+    upstream_seconds = sum(s["end"] - s["start"] for s in upstream)
+    return {
+        "wall_seconds": _seconds(wall),
+        "node_seconds": _seconds(node_seconds),
+        "parallelism": round(node_seconds / wall, 2) if wall > 0 else 1.0,
+        "sequential_seconds": _seconds(sequential),
+        "idle_seconds": _seconds(idle),
+        "upstream_calls": len(upstream),
+        "upstream_seconds": _seconds(upstream_seconds),
+        # Average number of upstream calls in flight, including those inside one node
+        "upstream_concurrency": round(upstream_seconds / wall, 2) if wall > 0 else 0.0,
+        "critical_path": critical_path,
+        "fanouts": fanouts,
+    }
+
+
+class TraceLog:
+    """The traces of the most recent runs, by run id."""
+
+    def __init__(self, max_entries: int = 200):
+        """Keep the traces of the last ``max_entries`` runs."""
+        self.max_entries = max_entries
+        self._traces: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, spans: List[Dict[str, Any]]) -> Optional[str]:
+        """Store the spans of a run and return its id, or None without a run span."""
+        run = next((s for s in reversed(spans) if s["kind"] == RUN), None)
+        if run is None:
+            return None
+        trace = {
+            "id": run["id"],
+            "analysis": run.get("attrs") or analyze_trace(spans),
+            "spans": spans,
+        }
+        with self._lock:
+            self._traces[run["id"]] = trace
+            self._traces.move_to_end(run["id"])
+            while len(self._traces) > self.max_entries:
+                self._traces.popitem(last=False)
+        return run["id"]
+
+    def get(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        """Return a stored trace, or None if it has been evicted or never existed."""
+        with self._lock:
+            return self._traces.get(trace_id)
+
+    def recent(self) -> List[Dict[str, Any]]:
+        """Return the id and headline numbers of every stored trace, newest first."""
+        with self._lock:
+            traces = list(self._traces.values())
+        return [
+            {
+                "id": t["id"],
+                "wall_seconds": t["analysis"].get("wall_seconds"),
+                "parallelism": t["analysis"].get("parallelism"),
+            }
+            for t in reversed(traces)
+        ]
+
+
+trace_log = TraceLog()
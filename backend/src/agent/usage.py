@@ -0,0 +1,128 @@
+"""Token usage accounting per node and model.
+
+Records prompt, cached and completion tokens plus latency for every LLM call,
+so the effect of the provider's prompt cache can be checked: the cache hit
+rate is ``cached_tokens / prompt_tokens``, and latencies are kept separately
+for calls that did and did not hit the cache.
+"""
+
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _empty_stats() -> Dict[str, float]:
+    return {
+        "calls": 0,
+        "prompt_tokens": 0,
+        "cached_tokens": 0,
+        "completion_tokens": 0,
+        "latency_seconds": 0.0,
+        "cache_hit_calls": 0,
+        "cache_hit_latency_seconds": 0.0,
+    }
+
+
+class UsageTracker:
+    """Aggregate token usage and latency by ``(node, model)``."""
+
+    def __init__(self):
+        """Create empty statistics."""
+        self._stats: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(_empty_stats)
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        node: str,
+        model: str,
+        prompt_tokens: int,
+        cached_tokens: int,
+        completion_tokens: int,
+        latency: float,
+    ) -> None:
+        """Record one LLM call."""
+        with self._lock:
+            stats = self._stats[(node, model)]
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["cached_tokens"] += cached_tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["latency_seconds"] += latency
+            if cached_tokens:
+                stats["cache_hit_calls"] += 1
+                stats["cache_hit_latency_seconds"] += latency
+        logger.debug(
+            "llm usage: node=%s model=%s prompt=%d cached=%d completion=%d latency=%.3fs",
+            node,
+            model,
+            prompt_tokens,
+            cached_tokens,
+            completion_tokens,
+            latency,
+        )
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Return the statistics with derived cache hit rates and mean latencies."""
+        with self._lock:
+            items = [(key, dict(stats)) for key, stats in self._stats.items()]
+        report = {}
+        for (node, model), stats in items:
+            misses = stats["calls"] - stats["cache_hit_calls"]
+            stats["cache_hit_rate"] = (
+                stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+            )
+            stats["mean_latency_cache_hit"] = (
+                stats["cache_hit_latency_seconds"] / stats["cache_hit_calls"]
+                if stats["cache_hit_calls"]
+                else None
+            )
+            stats["mean_latency_cache_miss"] = (
+                (stats["latency_seconds"] - stats["cache_hit_latency_seconds"]) / misses
+                if misses
+                else None
+            )
+            report[f"{node}/{model}"] = stats
+        return report
+
+    def reset(self) -> None:
+        """Clear all statistics."""
+        with self._lock:
+            self._stats.clear()
+
+
+usage_tracker = UsageTracker()
+
+
+def record_message_usage(node: str, model: str, message: Any, latency: float) -> None:
+    """Record the ``usage_metadata`` of a LangChain AIMessage."""
+    usage: Optional[Dict[str, Any]] = getattr(message, "usage_metadata", None)
+    if not usage:
+        return
+    details = usage.get("input_token_details") or {}
+    usage_tracker.record(
+        node,
+        model,
+        prompt_tokens=usage.get("input_tokens", 0),
+        cached_tokens=details.get("cache_read", 0) or 0,
+        completion_tokens=usage.get("output_tokens", 0),
+        latency=latency,
+    )
+
+
+def record_completion_usage(node: str, model: str, response: Any, latency: float) -> None:
+    """Record the ``usage`` of an OpenAI chat completion response."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    usage_tracker.record(
+        node,
+        model,
+        prompt_tokens=usage.prompt_tokens or 0,
+        cached_tokens=(getattr(details, "cached_tokens", 0) or 0) if details else 0,
+        completion_tokens=usage.completion_tokens or 0,
+        latency=latency,
+    )
@@ -1,9 +1,26 @@
+import functools
+import logging
 import re
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Optional
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from sqlalchemy import create_engine, text, MetaData, inspect
+from psycopg2.pool import ThreadedConnectionPool
+from sqlalchemy import create_engine, MetaData, inspect
 from agent.configuration import Configuration
+from agent.analysis_pool import POOL_ERRORS, AnalysisPool, CPUTimeExceeded
+from agent.approximate import approximate_plan, run_approximate
+from agent.columnar_cache import ColumnarCache, parse_table_settings
+from agent.parallel_sql import ParallelAggregator
+from agent.result_digest import digest_header, digest_result, to_dataframe
+from agent.result_cache import PgStatVersionSource, ResultCache, VersionTableSource
+from agent.sql_executor import QueryResult, SQLExecutor, validate_select
+from agent.sql_guard import SQLGuard
+from agent.table_stats import TableStats, TableStatsService
+from agent.task_classifier import RoutingLog, TaskClassifier
+from agent.tracing import span
+
+logger = logging.getLogger(__name__)
 
 
 def get_citations(response):
@@ -73,22 +90,315 @@ def get_database_connection(config: Configuration):
         raise Exception(f"数据库连接失败: {str(e)}")
 
 
+_table_stats_services: Dict[tuple, TableStatsService] = {}
+_table_stats_lock = threading.Lock()
+
+
+def get_table_stats_service(config: Configuration) -> TableStatsService:
+    """获取与数据库连接参数对应的表统计服务（进程内共享缓存）."""
+    key = (
+        config.postgresql_host,
+        config.postgresql_port,
+        config.postgresql_database,
+        config.postgresql_username,
+    )
+    with _table_stats_lock:
+        service = _table_stats_services.get(key)
+        if service is None:
+            service = TableStatsService(
+                lambda: get_database_connection(config),
+                ttl_seconds=config.table_stats_ttl_seconds,
+                exact_count_max_rows=config.exact_count_max_rows,
+            )
+            _table_stats_services[key] = service
+        return service
+
+
+def get_analysis_table_stats(config: Configuration) -> List[TableStats]:
+    """获取所有数据分析表的统计信息，无法读取的表会被跳过."""
+    service = get_table_stats_service(config)
+    stats = []
+    for table in config.analysis_tables:
+        try:
+            stats.append(service.get(table))
+        except Exception as e:
+            logger.warning("获取表统计信息失败 %s: %s", table, e)
+    return stats
+
+
+_parallel_aggregators: Dict[tuple, ParallelAggregator] = {}
+
+
+def get_parallel_aggregator(config: Configuration):
+    """获取并行聚合执行器（共享连接池）；analysis_parallel_workers为0时返回None."""
+    if config.analysis_parallel_workers <= 0:
+        return None
+    key = (
+        config.postgresql_host,
+        config.postgresql_port,
+        config.postgresql_database,
+        config.postgresql_username,
+        config.analysis_parallel_workers,
+        config.analysis_parallel_min_cost,
+        config.analysis_statement_timeout_ms,
+    )
+    with _table_stats_lock:
+        aggregator = _parallel_aggregators.get(key)
+        if aggregator is None:
+            pool = ThreadedConnectionPool(
+                0,
+                config.analysis_parallel_workers,
+                host=config.postgresql_host,
+                port=config.postgresql_port,
+                database=config.postgresql_database,
+                user=config.postgresql_username,
+                password=config.postgresql_password,
+            )
+            aggregator = ParallelAggregator(
+                pool,
+                max_workers=config.analysis_parallel_workers,
+                min_cost=config.analysis_parallel_min_cost,
+                statement_timeout_ms=config.analysis_statement_timeout_ms,
+            )
+            _parallel_aggregators[key] = aggregator
+        return aggregator
+
+
+def get_sql_executor(config: Configuration) -> SQLExecutor:
+    """创建数据分析SQL执行器（只读事务、EXPLAIN代价检查、服务端游标分批读取）."""
+    return SQLExecutor(
+        lambda: get_database_connection(config),
+        batch_size=config.analysis_batch_size,
+        max_rows=config.analysis_max_rows,
+        max_bytes=config.analysis_max_bytes,
+        guard=SQLGuard(
+            max_cost=config.analysis_max_cost,
+            max_rows=config.analysis_max_plan_rows,
+            row_limit=config.analysis_max_rows + 1,
+        ),
+        statement_timeout_ms=config.analysis_statement_timeout_ms,
+        parallel=get_parallel_aggregator(config),
+    )
+
+
+_columnar_caches: Dict[str, ColumnarCache] = {}
+
+
+def get_columnar_cache(config: Configuration):
+    """获取本地列式缓存；未配置缓存目录或缺少pyarrow/duckdb时返回None."""
+    if not config.columnar_cache_dir or not config.analysis_tables:
+        return None
+    with _table_stats_lock:
+        cache = _columnar_caches.get(config.columnar_cache_dir)
+        if cache is None:
+            overrides = parse_table_settings(config.columnar_cache_staleness)
+            staleness = {
+                table: float(overrides.get(table, config.columnar_cache_max_staleness_seconds))
+                for table in config.analysis_tables
+            }
+            try:
+                cache = ColumnarCache(
+                    config.columnar_cache_dir,
+                    lambda: get_database_connection(config),
+                    staleness=staleness,
+                    incremental_columns=parse_table_settings(
+                        config.columnar_cache_incremental_columns
+                    ),
+                )
+            except ImportError as e:
+                logger.warning("列式缓存不可用: %s", e)
+                return None
+            _columnar_caches[config.columnar_cache_dir] = cache
+        return cache
+
+
+_result_caches: Dict[tuple, ResultCache] = {}
+
+
+def get_result_cache(config: Configuration):
+    """获取数据分析SQL结果缓存；result_cache_max_entries为0时返回None."""
+    if config.result_cache_max_entries <= 0:
+        return None
+    key = (
+        config.postgresql_host,
+        config.postgresql_port,
+        config.postgresql_database,
+        config.result_cache_version_table,
+    )
+    with _table_stats_lock:
+        cache = _result_caches.get(key)
+        if cache is None:
+            connect = functools.partial(get_database_connection, config)
+            if config.result_cache_version_table:
+                source = VersionTableSource(connect, config.result_cache_version_table)
+            else:
+                source = PgStatVersionSource(connect)
+            cache = ResultCache(
+                source,
+                max_entries=config.result_cache_max_entries,
+                version_ttl=config.result_cache_version_ttl_seconds,
+            )
+            _result_caches[key] = cache
+        return cache
+
+
+def run_analysis_query(config: Configuration, sql: str) -> QueryResult:
+    """执行数据分析SQL：依次尝试结果缓存、本地列式缓存，最后在PostgreSQL上执行."""
+    with span("sql", "analysis_query"):
+        sql = validate_select(sql)
+        result_cache = get_result_cache(config)
+        cache_key = None
+        if result_cache is not None:
+            try:
+                cache_key = result_cache.key(sql)
+            except Exception as e:
+                logger.warning("读取表版本失败，跳过结果缓存: %s", e)
+            if cache_key is not None:
+                cached = result_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+
+        result = _execute_analysis_query(config, sql)
+        # 列式缓存的结果可能比当前表版本旧，不能以当前版本号缓存
+        if cache_key is not None and result.source == "postgresql":
+            result_cache.put(cache_key, result)
+        return result
+
+
+def _execute_analysis_query(config: Configuration, sql: str) -> QueryResult:
+    cache = get_columnar_cache(config)
+    if cache is not None:
+        result = cache.query(
+            sql,
+            max_rows=config.analysis_max_rows,
+            max_bytes=config.analysis_max_bytes,
+            batch_size=config.analysis_batch_size,
+        )
+        if result is not None:
+            return result
+    return get_sql_executor(config).execute(sql)
+
+
+def run_approximate_query(config: Configuration, sql: str) -> Optional[QueryResult]:
+    """抽样近似执行可估计的聚合查询；查询不适用或表太小时返回None，由调用方精确执行."""
+    plan = approximate_plan(validate_select(sql))
+    if plan is None:
+        return None
+    table_rows = get_table_row_count(config, plan.table)
+    with span("sql", "approximate_query"):
+        return run_approximate(
+            plan,
+            get_sql_executor(config).execute,
+            table_rows,
+            sample_rows=config.approximate_sample_rows,
+            max_percent=config.approximate_max_sample_percent,
+            target_relative_error=config.approximate_target_relative_error,
+        )
+
+
+def should_suggest_approximate(config: Configuration, sql: str, estimated_cost: Optional[float]) -> bool:
+    """精确查询代价较高且可以抽样估计时返回True（仅在未启用近似模式时建议）."""
+    return (
+        not config.approximate_queries
+        and estimated_cost is not None
+        and estimated_cost >= config.approximate_suggest_cost
+        and approximate_plan(sql) is not None
+    )
+
+
+_analysis_pool = None
+
+
+def get_analysis_pool(config: Configuration):
+    """获取进程内共享的分析工作进程池；analysis_pool_workers为0时返回None."""
+    global _analysis_pool
+    if config.analysis_pool_workers <= 0:
+        return None
+    with _table_stats_lock:
+        if _analysis_pool is None:
+            _analysis_pool = AnalysisPool(
+                max_workers=config.analysis_pool_workers,
+                cpu_seconds=config.analysis_task_cpu_seconds,
+            )
+        return _analysis_pool
+
+
+def digest_analysis_result(config: Configuration, result: QueryResult, dimensions: List[str]) -> str:
+    """生成查询结果摘要；大结果在工作进程中计算，避免占用GIL阻塞其他请求."""
+    pool = get_analysis_pool(config)
+    inline = functools.partial(
+        digest_result,
+        result,
+        dimensions=dimensions,
+        top_k=config.digest_top_k,
+        max_chars=config.digest_max_chars,
+    )
+    if pool is None or result.row_count < config.analysis_pool_min_rows:
+        return inline()
+    header = digest_header(result)
+    try:
+        return pool.run(
+            "digest",
+            to_dataframe(result),
+            header=header,
+            dimensions=dimensions,
+            top_k=config.digest_top_k,
+            max_chars=config.digest_max_chars,
+        )
+    except CPUTimeExceeded:
+        return f"{header}\n\n(Summary unavailable: computing it exceeded the CPU-time limit.)"
+    except POOL_ERRORS as e:
+        logger.warning("分析工作进程不可用，在当前线程计算摘要: %s", e)
+        return inline()
+
+
+def get_analysis_pool_metrics() -> Dict[str, float]:
+    """返回分析工作进程池的利用率指标（尚未创建时为空）."""
+    return _analysis_pool.metrics() if _analysis_pool is not None else {}
+
+
 def get_table_schema(config: Configuration) -> Dict[str, Any]:
-    """获取数据库表结构信息 (保留以备将来使用)"""
-    # 暂时返回空字典，因为pandasai功能已被移除
-    return {}
+    """获取数据库表结构信息（基于规划器统计信息，不扫描表）"""
+    return {stats.table: stats.to_dict() for stats in get_analysis_table_stats(config)}
+
 
+def get_table_row_count(config: Configuration, table_name: str, exact: bool = False) -> int:
+    """获取表的行数
 
-def get_table_row_count(engine, table_name: str) -> int:
-    """获取表的行数 (保留以备将来使用)"""
+    默认读取pg_class.reltuples中的估计值；只有小表或exact=True时才执行COUNT(*)。
+    """
     try:
-        with engine.connect() as connection:
-            result = connection.execute(text(f"SELECT COUNT(*) FROM {table_name}"))
-            return result.scalar()
+        return get_table_stats_service(config).row_count(table_name, exact=exact)
     except Exception:
         return 0
 
 
+_task_classifiers: Dict[str, TaskClassifier] = {}
+_routing_logs: Dict[str, RoutingLog] = {}
+
+
+def get_task_classifier(config: Configuration) -> TaskClassifier:
+    """Return the shared local task-type classifier for the configured weights."""
+    path = config.task_classifier_weights
+    with _table_stats_lock:
+        classifier = _task_classifiers.get(path)
+        if classifier is None:
+            classifier = TaskClassifier.load(path) if path else TaskClassifier()
+            _task_classifiers[path] = classifier
+        return classifier
+
+
+def get_routing_log(config: Configuration):
+    """Return the routing decision log, or None if routing_log_path is not set."""
+    path = config.routing_log_path
+    if not path:
+        return None
+    with _table_stats_lock:
+        if path not in _routing_logs:
+            _routing_logs[path] = RoutingLog(path)
+        return _routing_logs[path]
+
+
 def can_analyze_with_data_analysis(query: str, database_schema: Dict[str, Any]) -> bool:
     """判断查询是否适合通过数据分析节点处理 (保留以备将来使用)"""
     # 暂时返回False，因为pandasai功能已被移除
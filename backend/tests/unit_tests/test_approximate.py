@@ -0,0 +1,100 @@
+import math
+
+import pytest
+
+from agent.approximate import (
+    Z_95,
+    approximate_plan,
+    estimate,
+    sample_sql,
+    sampling_percent,
+)
+from agent.sql_executor import QueryResult
+
+QUERY = (
+    "SELECT region, SUM(amount) AS total, COUNT(*) AS n, AVG(amount) AS mean "
+    "FROM orders GROUP BY region ORDER BY region"
+)
+SAMPLE_COLUMNS = ["g0", "s0_1", "s0_2", "sc0", "c0_1", "c0_2", "n_1", "n_2"]
+# Per group, the sums over sampled rows of s (amount), s^2, s*c, c, c^2, n, n^2:
+# "eu" sampled amounts 1, 2 and 3; "us" sampled one amount of 10
+SAMPLE_ROWS = [
+    ("us", 10.0, 100.0, 10.0, 1, 1, 1, 1),
+    ("eu", 6.0, 14.0, 6.0, 3, 3, 3, 3),
+]
+
+
+def _sample(rows=SAMPLE_ROWS, columns=SAMPLE_COLUMNS):
+    return QueryResult(sql="", columns=columns, rows=rows)
+
+
+def test_sample_sql_groups_rows_by_sampling_unit():
+    plan = approximate_plan(QUERY)
+
+    bernoulli = sample_sql(plan, "BERNOULLI", 10, 7)
+    system = sample_sql(plan, "SYSTEM", 0.5, 7)
+
+    assert "FROM orders AS orders TABLESAMPLE BERNOULLI (10) REPEATABLE (7)" in bernoulli
+    assert "GROUP BY region, orders.tableoid, orders.ctid)" in bernoulli
+    # SYSTEM samples whole blocks, so the block number is the unit
+    assert "TABLESAMPLE SYSTEM (0.5) REPEATABLE (7)" in system
+    assert "GROUP BY region, orders.tableoid, (orders.ctid::text::point)[0])" in system
+
+
+def test_estimate_scales_sums_and_counts_by_the_sampling_fraction():
+    plan = approximate_plan(QUERY)
+
+    columns, rows, worst, sampled = estimate(plan, _sample(), 10.0)
+
+    assert columns == ["region", "total", "n", "mean", "total_error", "n_error", "mean_error"]
+    assert sampled == 4
+    eu, us = rows
+    assert eu[:4] == ("eu", 60.0, 30, 2.0)
+    assert us[:4] == ("us", 100.0, 10, 10.0)
+    # Horvitz-Thompson: (1 - f) / f^2 * sum(t_u^2)
+    assert eu[4] == pytest.approx(Z_95 * math.sqrt(0.9 / 0.01 * 14.0))
+    assert eu[5] == pytest.approx(Z_95 * math.sqrt(0.9 / 0.01 * 3))
+    # Ratio estimator: (1 - f) * sum((s_u - R * c_u)^2) / (sum c_u)^2
+    assert eu[6] == pytest.approx(Z_95 * math.sqrt(0.9 * (14.0 - 2 * 2.0 * 6.0 + 4.0 * 3) / 9))
+    assert us[6] == 0.0
+    assert worst == pytest.approx(us[4] / 100.0)
+
+
+def test_estimate_of_a_full_sample_is_exact():
+    plan = approximate_plan(QUERY)
+
+    _, rows, worst, _ = estimate(plan, _sample(), 100.0)
+
+    assert rows == [("eu", 6.0, 3, 2.0, 0.0, 0.0, 0.0), ("us", 10.0, 1, 10.0, 0.0, 0.0, 0.0)]
+    assert worst == 0.0
+
+
+def test_estimate_without_sampled_rows_is_empty():
+    plan = approximate_plan("SELECT COUNT(*) FROM t")
+
+    columns, rows, worst, sampled = estimate(plan, _sample([(None, None)], ["n_1", "n_2"]), 10.0)
+
+    assert columns == ["count", "count_error"]
+    assert rows == []
+    assert math.isinf(worst)
+    assert sampled == 0
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "SELECT MIN(amount) FROM orders",
+        "SELECT region, MAX(amount) FROM orders GROUP BY region",
+        "SELECT a, SUM(b) FROM t JOIN u ON t.id = u.id GROUP BY a",
+    ],
+)
+def test_approximate_plan_rejects_queries_without_estimators(sql):
+    assert approximate_plan(sql) is None
+
+
+@pytest.mark.parametrize(
+    ("table_rows", "expected"),
+    [(0, None), (100_000, None), (1_000_000, 1.0), (10**12, 0.0001)],
+)
+def test_sampling_percent(table_rows, expected):
+    assert sampling_percent(table_rows, 10_000, 5.0) == expected
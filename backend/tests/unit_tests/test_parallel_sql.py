@@ -0,0 +1,95 @@
+from decimal import Decimal
+
+import pytest
+
+from agent.parallel_sql import decompose
+
+GROUPED = (
+    "SELECT region, SUM(amount) AS total, COUNT(*), AVG(amount) AS avg_amount "
+    "FROM orders o WHERE status = 'paid; FROM x' GROUP BY region ORDER BY total DESC LIMIT 2"
+)
+
+
+def test_decompose_splits_aggregates_into_partials():
+    plan = decompose(GROUPED)
+
+    assert plan.table == "orders"
+    assert plan.qualifier == "o"
+    assert plan.where == "status = 'paid; FROM x'"
+    assert plan.groups == ["region"]
+    assert [(c.name, c.function, c.partials) for c in plan.columns] == [
+        ("region", None, []),
+        ("total", "sum", ["p0"]),
+        ("count", "count", ["p1"]),
+        ("avg_amount", "avg", ["p2", "p3"]),
+    ]
+    assert plan.partials == [
+        ("p0", "SUM(amount)", "sum"),
+        ("p1", "COUNT(*)", "sum"),
+        ("p2", "SUM(amount)", "sum"),
+        ("p3", "COUNT(amount)", "sum"),
+    ]
+    assert plan.order == [(1, True, None)]
+    assert plan.limit == 2
+
+
+def test_piece_sql_combines_query_filter_and_slice_condition():
+    plan = decompose(GROUPED)
+
+    assert plan.piece_sql("orders_2024", "o.id >= 0 AND o.id < 100") == (
+        "SELECT region AS g0, SUM(amount) AS p0, COUNT(*) AS p1, SUM(amount) AS p2, "
+        "COUNT(amount) AS p3 FROM orders_2024 AS o "
+        "WHERE (status = 'paid; FROM x') AND (o.id >= 0 AND o.id < 100) GROUP BY region"
+    )
+
+
+def test_merge_rebuilds_averages_and_applies_order_and_limit():
+    plan = decompose(GROUPED)
+    pieces = [
+        [("eu", 10, 2, 10, 2), ("us", 5, 1, 5, 1)],
+        [("eu", 20, 3, 20, 3), ("ap", None, 4, None, 0)],
+    ]
+
+    # DESC sorts NULLs first, as in PostgreSQL, and LIMIT 2 drops "us"
+    assert plan.merge(pieces) == [("ap", None, 4, None), ("eu", 30, 5, Decimal("6"))]
+
+
+def test_merge_without_group_by_reduces_one_row_per_piece():
+    plan = decompose("SELECT SUM(x), MIN(y), MAX(y), COUNT(z) FROM t")
+
+    rows = plan.merge([[(1, 3, 9, 2)], [(None, None, None, 0)], [(4, 1, 5, 1)]])
+
+    assert rows == [(5, 1, 9, 3)]
+
+
+def test_decompose_keeps_quoted_names_and_nulls_order():
+    plan = decompose('SELECT "Region", SUM(x) AS "Total" FROM s.t GROUP BY "Region" ORDER BY 2 DESC NULLS LAST')
+
+    assert plan.table == "s.t"
+    assert [c.name for c in plan.columns] == ["Region", "Total"]
+    assert plan.merge([[("a", 1), ("b", None), ("c", 5)]]) == [("c", 5), ("a", 1), ("b", None)]
+
+
+def test_decompose_resolves_group_by_positions():
+    plan = decompose("select 1 + 1 as k, max(x) from t group by 1")
+
+    assert plan.groups == ["1 + 1"]
+    assert [(c.name, c.group) for c in plan.columns] == [("k", 0), ("max", None)]
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "SELECT a, SUM(b) FROM t JOIN u ON t.id = u.id GROUP BY a",
+        "SELECT COUNT(DISTINCT a) FROM t",
+        "SELECT a, SUM(b) FROM t GROUP BY a HAVING SUM(b) > 1",
+        "SELECT SUM(b) OVER () FROM t",
+        "SELECT SUM(b) FROM (SELECT * FROM t) s",
+        "SELECT a, b FROM t",
+        "SELECT b, SUM(c) FROM t GROUP BY a",
+        "SELECT PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY a) FROM t",
+        "SELECT a, SUM(b) FROM t GROUP BY ROLLUP(a)",
+    ],
+)
+def test_decompose_rejects_queries_that_do_not_split(sql):
+    assert decompose(sql) is None
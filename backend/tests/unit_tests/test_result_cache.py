@@ -0,0 +1,103 @@
+import pytest
+
+from agent.result_cache import ResultCache, is_volatile, normalize_sql
+from agent.sql_executor import QueryResult
+
+
+class FakeVersions:
+    """Version source backed by a dict, recording every lookup."""
+
+    def __init__(self, versions):
+        self.versions_by_table = versions
+        self.lookups = []
+
+    def versions(self, tables):
+        self.lookups.append(sorted(tables))
+        return {t: self.versions_by_table[t] for t in tables if t in self.versions_by_table}
+
+
+def _result(size):
+    return QueryResult(sql="", columns=["n"], rows=[(1,)], bytes_read=size)
+
+
+def test_key_ignores_formatting_and_follows_table_versions():
+    source = FakeVersions({"orders": "1"})
+    cache = ResultCache(source, version_ttl=0)
+
+    key = cache.key("SELECT  COUNT(*)\nFROM orders;")
+    assert key == ("select count(*) from orders", ("orders=1",))
+    assert cache.key("select count(*) from orders") == key
+
+    source.versions_by_table["orders"] = "2"
+    assert cache.key("select count(*) from orders") != key
+
+
+def test_key_reuses_versions_within_ttl():
+    source = FakeVersions({"orders": "1"})
+    cache = ResultCache(source, version_ttl=60)
+
+    cache.key("select count(*) from orders")
+    cache.key("select sum(amount) from orders")
+
+    assert source.lookups == [["orders"]]
+
+
+def test_key_keeps_quoted_table_names():
+    cache = ResultCache(FakeVersions({'"Sales"': "7"}))
+
+    assert cache.key('select * from "Sales"') == ('select * from "Sales"', ('"Sales"=7',))
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "select 1",
+        "select * from unversioned_view",
+        "select count(*) from orders where created_at > now() - interval '1 day'",
+        "select * from orders order by random()",
+        "select * from orders where day = current_date",
+    ],
+)
+def test_uncacheable_queries_have_no_key(sql):
+    cache = ResultCache(FakeVersions({"orders": "1"}))
+
+    assert cache.key(sql) is None
+
+
+@pytest.mark.parametrize(
+    ("sql", "volatile"),
+    [
+        ("select now () from t", True),
+        ("select * from t where d > 'today'", True),
+        ("select nextval('ids')", True),
+        ("select 'now()' from t", False),
+        ('select "random"(x) from t', False),
+        ("select known_at from t", False),
+    ],
+)
+def test_is_volatile(sql, volatile):
+    assert is_volatile(sql) is volatile
+
+
+def test_normalize_sql_keeps_literals():
+    assert normalize_sql("SELECT  A\n FROM T WHERE b = 'X Y';") == "select a from t where b = 'X Y'"
+
+
+def test_put_evicts_least_recently_used_entries():
+    cache = ResultCache(FakeVersions({}), max_entries=2, max_bytes=100)
+    cache.put(("a",), _result(10))
+    cache.put(("b",), _result(10))
+    cache.get(("a",))
+    cache.put(("c",), _result(10))
+
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) is not None
+    assert cache.get(("c",)) is not None
+
+    cache.put(("d",), _result(95))
+    assert cache.get(("a",)) is None
+    assert cache.get(("c",)) is None
+    # Larger than the whole cache: not stored at all
+    cache.put(("e",), _result(101))
+    assert cache.get(("e",)) is None
+    assert cache.get(("d",)) is not None
@@ -6,6 +6,81 @@ import { WelcomeScreen } from "@/components/WelcomeScreen";
 import { ChatMessagesView } from "@/components/ChatMessagesView";
 import { Button } from "@/components/ui/button";
 
+const BRANCH_TITLES: Record<string, string> = {
+  web_research: "Web Research",
+  data_analysis: "Data Analysis",
+};
+
+// Summarise the latest progress of a branch for the activity timeline.
+function describeBranchProgress(progress: any): string {
+  const parts: string[] = [];
+  if (progress.query) parts.push(progress.query);
+  if (progress.count !== undefined) {
+    const noun = progress.node === "data_analysis" ? "rows" : "sources";
+    const labels = (progress.labels || []).slice(0, 3).join(", ");
+    parts.push(
+      `Found ${progress.count} ${noun}${labels ? ` (${labels})` : ""}.`
+    );
+  }
+  if (progress.sample_percent !== undefined) {
+    parts.push(`Estimated from a ${progress.sample_percent}% sample.`);
+  }
+  if (progress.approximate_cost !== undefined) {
+    parts.push("Exact query is expensive; try Approximate precision.");
+  }
+  if (progress.event === "cancelled") {
+    parts.push(`Cut off (${progress.reason}).`);
+  } else if (progress.event === "finished") {
+    const timings = Object.entries(progress.timings || {})
+      .map(([step, seconds]) => `${step} ${Number(seconds).toFixed(1)}s`)
+      .join(", ");
+    parts.push(`Done in ${Number(progress.elapsed).toFixed(1)}s (${timings}).`);
+  } else if (progress.text) {
+    const text = progress.text.trim();
+    parts.push(text.length > 160 ? `…${text.slice(-160)}` : text);
+  } else {
+    parts.push("Working…");
+  }
+  return parts.join(" ");
+}
+
+// The span of the node itself among the trace spans of a state update.
+function nodeSpan(update: any): any {
+  return (update?.trace || []).find((span: any) => span.kind === "node");
+}
+
+// Summarise a run's trace analysis: wall time, parallelism and critical path.
+function describeRunTrace(analysis: any): string {
+  const path = (analysis.critical_path || [])
+    .filter((entry: any) => entry.seconds >= 0.05)
+    .map(
+      (entry: any) =>
+        `${entry.node}${entry.branch != null ? ` #${entry.branch}` : ""} ${Number(
+          entry.seconds
+        ).toFixed(1)}s`
+    )
+    .join(" → ");
+  const joins = (analysis.fanouts || [])
+    .filter((fanout: any) => fanout.join_wait_seconds >= 0.05)
+    .map(
+      (fanout: any) =>
+        `${fanout.node} #${fanout.straggler} held the join for ${Number(
+          fanout.join_wait_seconds
+        ).toFixed(1)}s`
+    );
+  return [
+    `${Number(analysis.wall_seconds).toFixed(1)}s total, ${Number(
+      analysis.parallelism
+    ).toFixed(1)}x parallelism, ${Number(
+      analysis.sequential_seconds
+    ).toFixed(1)}s with a single node running.`,
+    path ? `Critical path: ${path}.` : "",
+    joins.length ? `${joins.join("; ")}.` : "",
+  ]
+    .filter(Boolean)
+    .join(" ");
+}
+
 export default function App() {
   const [processedEventsTimeline, setProcessedEventsTimeline] = useState<
     ProcessedEvent[]
@@ -15,6 +90,7 @@ export default function App() {
   >({});
   const scrollAreaRef = useRef<HTMLDivElement>(null);
   const hasFinalizeEventOccurredRef = useRef(false);
+  const branchProgressRef = useRef<Record<string, any>>({});
   const [error, setError] = useState<string | null>(null);
   const thread = useStream<{
     messages: Message[];
@@ -34,18 +110,16 @@ export default function App() {
           title: "Generating Search Queries",
           data: event.generate_query?.search_query?.join(", ") || "",
         };
-      } else if (event.web_research) {
-        const sources = event.web_research.sources_gathered || [];
-        const numSources = sources.length;
-        const uniqueLabels = [
-          ...new Set(sources.map((s: any) => s.label).filter(Boolean)),
-        ];
-        const exampleLabels = uniqueLabels.slice(0, 3).join(", ");
+      } else if (event.pipelined_research) {
+        const queries =
+          event.pipelined_research.search_query?.length ??
+          event.pipelined_research.data_analysis_query?.length ??
+          0;
         processedEvent = {
-          title: "Web Research",
-          data: `Gathered ${numSources} sources. Related to: ${
-            exampleLabels || "N/A"
-          }.`,
+          title: "Pipelined Research",
+          data: `Finished ${queries} queries over ${
+            event.pipelined_research.research_loop_count
+          } research rounds.`,
         };
       } else if (event.reflection) {
         processedEvent = {
@@ -58,6 +132,29 @@ export default function App() {
           data: "Composing and presenting the final answer.",
         };
         hasFinalizeEventOccurredRef.current = true;
+      } else if (event.compact_history) {
+        const run = (event.compact_history.trace || []).find(
+          (span: any) => span.kind === "run" && span.attrs?.critical_path
+        );
+        if (run) {
+          processedEvent = {
+            title: "Run Timing",
+            data: describeRunTrace(run.attrs),
+            duration: run.end - run.start,
+          };
+        }
+      }
+      const span = nodeSpan(Object.values(event)[0]);
+      if (span && (event.web_research || event.data_analysis)) {
+        // Branch updates complete the entry their progress events created
+        const key = `${span.name}:${span.branch}`;
+        setProcessedEventsTimeline((prevEvents) =>
+          prevEvents.map((e) =>
+            e.key === key ? { ...e, duration: span.end - span.start } : e
+          )
+        );
+      } else if (processedEvent && span && processedEvent.duration === undefined) {
+        processedEvent.duration = span.end - span.start;
       }
       if (processedEvent) {
         setProcessedEventsTimeline((prevEvents) => [
@@ -66,6 +163,25 @@ export default function App() {
         ]);
       }
     },
+    onCustomEvent: (event: any) => {
+      // Progress from a running web_research or data_analysis branch
+      if (!event || !event.node || !event.event) return;
+      const key = `${event.node}:${event.branch}`;
+      const progress = { ...(branchProgressRef.current[key] || {}), ...event };
+      branchProgressRef.current[key] = progress;
+      const processedEvent: ProcessedEvent = {
+        key,
+        title: BRANCH_TITLES[event.node] || event.node,
+        data: describeBranchProgress(progress),
+      };
+      setProcessedEventsTimeline((prevEvents) => {
+        const index = prevEvents.findIndex((e) => e.key === key);
+        if (index === -1) return [...prevEvents, processedEvent];
+        const nextEvents = [...prevEvents];
+        nextEvents[index] = processedEvent;
+        return nextEvents;
+      });
+    },
     onError: (error: any) => {
       setError(error.message);
     },
@@ -100,9 +216,15 @@ export default function App() {
   }, [thread.messages, thread.isLoading, processedEventsTimeline]);
 
   const handleSubmit = useCallback(
-    (submittedInputValue: string, effort: string, model: string) => {
+    (
+      submittedInputValue: string,
+      effort: string,
+      model: string,
+      precision: string
+    ) => {
       if (!submittedInputValue.trim()) return;
       setProcessedEventsTimeline([]);
+      branchProgressRef.current = {};
       hasFinalizeEventOccurredRef.current = false;
 
       // convert effort to, initial_search_query_count and max_research_loops
@@ -134,12 +256,20 @@ export default function App() {
           id: Date.now().toString(),
         },
       ];
-      thread.submit({
-        messages: newMessages,
-        initial_search_query_count: initial_search_query_count,
-        max_research_loops: max_research_loops,
-        reasoning_model: model,
-      });
+      thread.submit(
+        {
+          messages: newMessages,
+          initial_search_query_count: initial_search_query_count,
+          max_research_loops: max_research_loops,
+          reasoning_model: model,
+        },
+        {
+          // Approximate runs estimate aggregates from table samples
+          config: {
+            configurable: { approximate_queries: precision === "approximate" },
+          },
+        }
+      );
     },
     [thread]
   );
@@ -174,7 +304,8 @@ export default function App() {
             </div>
           ) : (
             <ChatMessagesView
-              messages={thread.messages}
+              // The summary of older turns is context for the agent, not a chat bubble
+              messages={thread.messages.filter((message) => message.type !== "system")}
               isLoading={thread.isLoading}
               scrollAreaRef={scrollAreaRef}
               onSubmit={handleSubmit}
@@ -21,6 +21,10 @@ import { useEffect, useState } from "react";
 export interface ProcessedEvent {
   title: string;
   data: any;
+  // Progress events of one branch share a key and update a single entry
+  key?: string;
+  // Seconds the node took, from its trace span
+  duration?: number;
 }
 
 interface ActivityTimelineProps {
@@ -105,6 +109,11 @@ export function ActivityTimeline({
                     <div>
                       <p className="text-sm text-neutral-200 font-medium mb-0.5">
                         {eventItem.title}
+                        {eventItem.duration !== undefined && (
+                          <span className="ml-2 text-xs font-normal text-neutral-400">
+                            {eventItem.duration.toFixed(1)}s
+                          </span>
+                        )}
                       </p>
                       <p className="text-xs text-neutral-300 leading-relaxed">
                         {typeof eventItem.data === "string"